@@ -0,0 +1,294 @@
+import argparse
+import os
+import re
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from banner_schema import DEMOGRAPHIC_DIMENSIONS
+from study_registry import get_registry, workbook_version
+from table_extractor import TableExtractor
+
+DEFAULT_CUBE_DIR = "Data/cache/cubes"
+
+# Words in a question that name a banner dimension
+DIMENSION_KEYWORDS = {
+    "Gender": ("gender", "male", "female", "men", "women", "sex"),
+    "Age": ("age", "ages", "age group", "age groups", "younger", "older", "youth"),
+    "NCCS": ("nccs", "sec", "income"),
+    "Region": ("region", "regions", "zone", "zones", "north", "south", "east", "west"),
+    "Town class": ("town", "city", "cities", "metro", "tier", "urban", "rural"),
+}
+
+# Phrasings of "how does X compare across <dimension>" that the cube answers directly
+COMPARISON_PATTERN = re.compile(
+    r'\b(compare[sd]?|comparison|across|differ(?:s|ence|ences)?|vary|varies|variation|'
+    r'split|breakdown|break down|by (?:age|gender|region|zone|nccs|sec|town|city))\b',
+    re.IGNORECASE,
+)
+
+
+class AggregateCube:
+    def __init__(self, values: np.ndarray, row_keys: List[Tuple[str, str]], segments: List[Tuple[str, str]],
+                 question_texts: Dict[str, str]):
+        """
+        Every question table of a sheet as one brand × question × segment matrix.
+
+        Args:
+            values: float32 matrix, one row per (QID, row label) and one column per
+                (dimension, segment) across all banners; NaN where a question has no such cell
+            row_keys: (QID, row label) of each matrix row, grouped by question in sheet order
+            segments: (dimension, segment) of each matrix column
+            question_texts: Question wording by QID
+        """
+        self.values = values
+        self.row_keys = row_keys
+        self.segments = segments
+        self.question_texts = question_texts
+
+        # Lookup tables, so every query is a dict lookup plus an array index
+        self._rows = {(qid.upper(), label.lower()): i for i, (qid, label) in enumerate(row_keys)}
+        self._columns = {(dimension, segment.lower()): j for j, (dimension, segment) in enumerate(segments)}
+        self._questions: Dict[str, Tuple[int, int]] = {}
+        for i, (qid, _) in enumerate(row_keys):
+            start, _ = self._questions.get(qid.upper(), (i, i))
+            self._questions[qid.upper()] = (start, i + 1)
+        self._dimensions: Dict[str, np.ndarray] = {}
+        for j, (dimension, _) in enumerate(segments):
+            self._dimensions.setdefault(dimension, []).append(j)
+        self._dimensions = {d: np.array(cols) for d, cols in self._dimensions.items()}
+
+    @classmethod
+    def build(cls, extractor: TableExtractor) -> "AggregateCube":
+        """One pass over every question block of the extractor's sheet."""
+        row_keys: List[Tuple[str, str]] = []
+        segments: List[Tuple[str, str]] = []
+        columns: Dict[Tuple[str, str], int] = {}
+        question_texts: Dict[str, str] = {}
+        cells: List[Tuple[int, int, float]] = []
+
+        for qid, question_text, table in extractor.iter_question_blocks():
+            question_texts[qid.upper()] = question_text
+            if table.empty or table.shape[1] < 2:
+                continue
+            schema = extractor.banner_schema(table)
+            banner = schema.as_columns(table).apply(pd.to_numeric, errors="coerce")
+
+            positions = []
+            for key in banner.columns:
+                if key not in columns:
+                    columns[key] = len(segments)
+                    segments.append(key)
+                positions.append(columns[key])
+
+            for label, row in zip(banner.index, banner.to_numpy(dtype="float64")):
+                if not label or np.isnan(row).all():
+                    continue
+                row_index = len(row_keys)
+                row_keys.append((qid.upper(), label))
+                cells.extend((row_index, j, v) for j, v in zip(positions, row) if not np.isnan(v))
+
+        values = np.full((len(row_keys), len(segments)), np.nan, dtype=np.float32)
+        if cells:
+            rows, cols, data = zip(*cells)
+            values[list(rows), list(cols)] = data
+        print(f"Built aggregate cube: {len(question_texts)} questions, {len(row_keys)} rows x "
+              f"{len(segments)} segments ({values.nbytes / 1e6:.1f} MB)")
+        return cls(values, row_keys, segments, question_texts)
+
+    def save(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        qids = list(self.question_texts)
+        # Written beside the target and renamed, so readers never load a half-written cube
+        partial = f"{path[:-len('.npz')]}.partial.npz"
+        np.savez_compressed(
+            partial,
+            values=self.values,
+            row_keys=np.array(self.row_keys, dtype=str).reshape(-1, 2),
+            segments=np.array(self.segments, dtype=str).reshape(-1, 2),
+            qids=np.array(qids, dtype=str),
+            question_texts=np.array([self.question_texts[q] for q in qids], dtype=str),
+        )
+        os.replace(partial, path)
+
+    @classmethod
+    def load(cls, path: str) -> "AggregateCube":
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data["values"],
+                       [tuple(k) for k in data["row_keys"].tolist()],
+                       [tuple(s) for s in data["segments"].tolist()],
+                       dict(zip(data["qids"].tolist(), data["question_texts"].tolist())))
+
+    def labels(self, question_id: str) -> List[str]:
+        """Row labels (brands, answer options) of a question."""
+        start, stop = self._questions.get(question_id.upper(), (0, 0))
+        return [label for _, label in self.row_keys[start:stop]]
+
+    def dimension_segments(self, dimension: str) -> List[str]:
+        return [self.segments[j][1] for j in self._dimensions.get(dimension, [])]
+
+    def value(self, question_id: str, label: str, dimension: str, segment: str) -> Optional[float]:
+        """A single cell, e.g. value("Q10.1", "Netflix", "Age", "18-24 years")."""
+        i = self._rows.get((question_id.upper(), label.lower()))
+        j = self._columns.get((dimension, segment.lower()))
+        if i is None or j is None or np.isnan(self.values[i, j]):
+            return None
+        return float(self.values[i, j])
+
+    def compare(self, question_id: str, label: str, dimension: str) -> Dict[str, float]:
+        """A row label's values across the segments of one dimension (segments the question lacks are left out)."""
+        i = self._rows.get((question_id.upper(), label.lower()))
+        cols = self._dimensions.get(dimension)
+        if i is None or cols is None:
+            return {}
+        row = self.values[i, cols]
+        return {self.segments[j][1]: round(float(v), 2) for j, v in zip(cols, row) if not np.isnan(v)}
+
+    def breakdown(self, question_id: str, label: str,
+                  dimensions=DEMOGRAPHIC_DIMENSIONS) -> Dict[str, Dict[str, float]]:
+        """A row label's values by every demographic dimension the question's banner has."""
+        result = {dimension: self.compare(question_id, label, dimension) for dimension in dimensions}
+        return {dimension: values for dimension, values in result.items() if values}
+
+    def mentioned_labels(self, question_id: str, text: str) -> List[str]:
+        """Row labels of a question that the text names as whole words (e.g. "Netflix", "Prime Video")."""
+        text = text.lower()
+        return [label for label in self.labels(question_id)
+                if re.search(rf'(?<!\w){re.escape(label.lower())}(?!\w)', text)]
+
+
+def mentioned_dimensions(text: str) -> List[str]:
+    """Banner dimensions a question asks about, in DEMOGRAPHIC_DIMENSIONS order."""
+    words = set(re.findall(r'[a-z]+', text.lower()))
+    text = text.lower()
+    return [dimension for dimension in DEMOGRAPHIC_DIMENSIONS if dimension in DIMENSION_KEYWORDS
+            and any((k in words) if " " not in k else (k in text) for k in DIMENSION_KEYWORDS[dimension])]
+
+
+def answer_comparison(cube: AggregateCube, question_id: str, question: str) -> Optional[str]:
+    """
+    Answer "how does X compare across age/gender/region" straight from the cube.
+
+    Returns None unless the question is a comparison that names both a row label of the
+    question and a banner dimension, so other questions still go to the LLM.
+    """
+    if not COMPARISON_PATTERN.search(question):
+        return None
+    labels = cube.mentioned_labels(question_id, question)
+    dimensions = mentioned_dimensions(question)
+    if not labels or not dimensions:
+        return None
+
+    lines = [cube.question_texts.get(question_id.upper()) or question_id]
+    for label in labels:
+        total = cube.compare(question_id, label, "Total")
+        total_text = f" (Total: {next(iter(total.values())):.1f}%)" if total else ""
+        lines.append(f"\n{label}{total_text}")
+        for dimension in dimensions:
+            values = cube.compare(question_id, label, dimension)
+            if not values:
+                lines.append(f"- {dimension}: not in this table's banner")
+                continue
+            segments = ", ".join(f"{segment} {value:.1f}%" for segment, value in values.items())
+            if len(values) < 2:
+                lines.append(f"- {dimension}: {segments}.")
+                continue
+            highest = max(values, key=values.get)
+            lowest = min(values, key=values.get)
+            lines.append(f"- {dimension}: {segments}. Highest among {highest} ({values[highest]:.1f}%), "
+                         f"lowest among {lowest} ({values[lowest]:.1f}%); "
+                         f"spread {values[highest] - values[lowest]:.1f} points.")
+    return "\n".join(lines)
+
+
+def cube_path(study_id: str, version: str, directory: Optional[str] = None) -> str:
+    directory = directory or os.getenv("CUBE_DIR", DEFAULT_CUBE_DIR)
+    return os.path.join(directory, f"{study_id}_{version}.npz")
+
+
+_cubes: Dict[Tuple[str, str], AggregateCube] = {}
+_cubes_lock = threading.Lock()
+
+
+def _remember(study_id: str, version: str, cube: AggregateCube) -> AggregateCube:
+    with _cubes_lock:
+        # Older versions of this study's cube are no longer reachable
+        for stale in [k for k in _cubes if k[0] == study_id and k[1] != version]:
+            del _cubes[stale]
+        return _cubes.setdefault((study_id, version), cube)
+
+
+def get_cube(study_id: Optional[str] = None) -> AggregateCube:
+    """
+    The study's cube for its current workbook version, from memory or from disk.
+
+    Cubes are never built here (this runs on the request path); a workbook version without
+    a saved cube raises FileNotFoundError until build_cube() runs for it, which the
+    fingerprint refresh and the "build" command do.
+    """
+    config = get_registry().get(study_id)
+    version = workbook_version(config.workbook)
+    with _cubes_lock:
+        cube = _cubes.get((config.study_id, version))
+    if cube is not None:
+        return cube
+
+    path = cube_path(config.study_id, version)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No aggregate cube for '{config.study_id}' at version {version} "
+                                f"(build it with: python aggregate_cube.py --study {config.study_id} build)")
+    return _remember(config.study_id, version, AggregateCube.load(path))
+
+
+def build_cube(study_id: Optional[str] = None, extractor: Optional[TableExtractor] = None) -> str:
+    """
+    Build and save the cube for the study's current workbook version.
+
+    Args:
+        study_id: Registered study (default study if None)
+        extractor: Extractor already loaded on the study's sheet (a private one is loaded if None)
+
+    Returns:
+        Path of the saved cube
+    """
+    config = get_registry().get(study_id)
+    version = workbook_version(config.workbook)
+    if extractor is None:
+        extractor = TableExtractor(config.workbook)
+        extractor.sheets = dict(config.sheets)
+        extractor.load_excel(config.sheet_name)
+    cube = AggregateCube.build(extractor)
+    path = cube_path(config.study_id, version)
+    cube.save(path)
+    _remember(config.study_id, version, cube)
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or query the brand x question x segment aggregate cube.")
+    parser.add_argument("--study", default=None, help="Registered study ID (default study if omitted)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("build", help="Build (or rebuild) the cube for the current workbook version")
+    query = sub.add_parser("query", help="Values of a row label across a dimension")
+    query.add_argument("qid")
+    query.add_argument("label")
+    query.add_argument("--dimension", default=None, help="Dimension (default: every demographic dimension)")
+    ask = sub.add_parser("ask", help="Answer a comparison question without the LLM")
+    ask.add_argument("qid")
+    ask.add_argument("question")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        print(f"Saved to {build_cube(args.study)}")
+    elif args.command == "query":
+        cube = get_cube(args.study)
+        if args.dimension:
+            print(cube.compare(args.qid, args.label, args.dimension))
+        else:
+            for dimension, values in cube.breakdown(args.qid, args.label).items():
+                print(f"{dimension}: {values}")
+    else:
+        print(answer_comparison(get_cube(args.study), args.qid, args.question) or
+              "Not a comparison the cube can answer; the pipeline would send it to the LLM.")
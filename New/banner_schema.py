@@ -0,0 +1,141 @@
+import re
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+# Dimensions sent to the LLM by default (replaces the old keyword lists)
+DEFAULT_DIMENSIONS = ("Total", "Gender", "Age", "NCCS")
+# Every demographic dimension, for callers that test the whole banner
+DEMOGRAPHIC_DIMENSIONS = DEFAULT_DIMENSIONS + ("Region", "Town class")
+MAX_HEADER_ROWS = 3
+
+# Names used for a dimension in a spanning banner row, mapped to one canonical name
+DIMENSION_NAMES = {
+    "total": "Total", "all": "Total", "base": "Total",
+    "gender": "Gender", "sex": "Gender",
+    "age": "Age", "age group": "Age", "age groups": "Age",
+    "nccs": "NCCS", "sec": "NCCS",
+    "region": "Region", "zone": "Region",
+    "town class": "Town class", "city": "Town class", "town": "Town class", "pop strata": "Town class",
+}
+
+# Dimension inferred from a segment label when the banner has a single header row
+SEGMENT_PATTERNS = [
+    ("Total", re.compile(r'^(total|all|base)\b', re.IGNORECASE)),
+    ("Gender", re.compile(r'^(male|female|men|women|man|woman)s?$', re.IGNORECASE)),
+    ("Age", re.compile(r'\b\d+\s*[-–]\s*\d+\b|\b\d+\s*\+|\byears?\b|\bage\b', re.IGNORECASE)),
+    ("NCCS", re.compile(r'^(nccs|sec)\b', re.IGNORECASE)),
+    ("Region", re.compile(r'^(north|south|east|west|central)\b|\b(zone|region)\b', re.IGNORECASE)),
+    ("Town class", re.compile(r'\b(metro|tier|town|city|urban|rural)\b', re.IGNORECASE)),
+]
+
+
+def cell_label(value) -> str:
+    """Stripped text of a cell, with empty cells as ""."""
+    return "" if value is None or (isinstance(value, float) and pd.isna(value)) else str(value).strip()
+
+
+def infer_dimension(segment: str) -> str:
+    """Dimension a banner segment belongs to, judged from its label alone."""
+    for dimension, pattern in SEGMENT_PATTERNS:
+        if pattern.search(segment):
+            return dimension
+    return "Other"
+
+
+def is_header_row(values: Sequence) -> bool:
+    """Banner rows have no row label and no numeric cells."""
+    if not values or cell_label(values[0]):
+        return False
+    cells = [v for v in values[1:] if cell_label(v)]
+    return bool(cells) and not any(isinstance(v, (int, float, np.number)) for v in cells)
+
+
+class BannerSchema:
+    def __init__(self, segments: List[str], dimensions: List[str]):
+        """
+        Banner columns of a col% table as a (dimension, segment) MultiIndex.
+
+        Position i in the index is column i + 1 of the table (column 0 holds row labels).
+        """
+        self.columns = pd.MultiIndex.from_arrays([dimensions, segments], names=["dimension", "segment"])
+
+    @property
+    def dimensions(self) -> List[str]:
+        return list(dict.fromkeys(self.columns.get_level_values("dimension")))
+
+    def flat_labels(self) -> List[str]:
+        """Single-row column labels, qualified with the dimension where the segment alone is ambiguous ("NCCS A")."""
+        return [segment if dimension in ("Total", "Gender", "Other") or dimension.lower() in segment.lower()
+                else f"{dimension} {segment}"
+                for dimension, segment in self.columns]
+
+    def label_dimensions(self) -> Dict[str, str]:
+        """Dimension of each flat column label, e.g. {"Male": "Gender", "NCCS A": "NCCS"}."""
+        return {label: dimension for label, (dimension, _) in zip(self.flat_labels(), self.columns)}
+
+    def segments(self, dimension: str) -> List[str]:
+        return self.columns[self.columns.get_level_values("dimension") == dimension].get_level_values("segment").tolist()
+
+    def positions(self, dimensions: Iterable[str]) -> np.ndarray:
+        """Table column positions of every segment in the given dimensions, in banner order."""
+        mask = self.columns.get_level_values("dimension").isin(list(dimensions))
+        return np.flatnonzero(mask) + 1
+
+    def select(self, table: pd.DataFrame,
+               dimensions: Iterable[str] = DEFAULT_DIMENSIONS,
+               max_columns: Optional[int] = 10,
+               min_columns: int = 5) -> pd.DataFrame:
+        """
+        Row labels plus the banner columns of the requested dimensions.
+
+        Falls back to the first banner columns when the dimensions match fewer than min_columns.
+        """
+        positions = self.positions(dimensions)
+        if len(positions) < min_columns:
+            leading = np.arange(1, min(len(self.columns), max_columns or len(self.columns)) + 1)
+            positions = np.unique(np.concatenate([positions, leading]))
+        if max_columns:
+            positions = positions[:max_columns]
+        return table.iloc[:, np.concatenate([[0], positions])]
+
+    def as_columns(self, table: pd.DataFrame) -> pd.DataFrame:
+        """Banner columns of a table re-labelled with the hierarchical index (row labels as the index)."""
+        banner = table.iloc[:, 1:len(self.columns) + 1].copy()
+        banner.index = table.iloc[:, 0].map(cell_label)
+        banner.columns = self.columns[:banner.shape[1]]
+        return banner
+
+
+def parse_banner(header_rows: List[Sequence]) -> BannerSchema:
+    """
+    Build the banner schema from a block's header rows (row-label cell included).
+
+    With several header rows, the upper rows name dimensions that span the segments
+    below them (merged cells come through as a label followed by blanks). With a
+    single row, each segment's dimension is inferred from its label.
+    """
+    width = max(len(row) for row in header_rows)
+    rows = [[cell_label(v) for v in row] + [""] * (width - len(row)) for row in header_rows]
+
+    segments = []
+    dimensions = []
+    spans = [""] * len(rows[:-1])
+    for col in range(1, width):
+        for level, row in enumerate(rows[:-1]):
+            if row[col]:
+                spans[level] = row[col]
+                # A new upper-level label resets the spans below it
+                spans[level + 1:] = [""] * (len(spans) - level - 1)
+        segment = rows[-1][col] or next((r[col] for r in reversed(rows[:-1]) if r[col]), "")
+        span = next((s for s in spans if s), "")
+
+        if span and span.lower() != segment.lower():
+            dimension = DIMENSION_NAMES.get(span.lower(), span)
+        else:
+            dimension = infer_dimension(segment)
+        segments.append(segment)
+        dimensions.append(dimension)
+
+    return BannerSchema(segments, dimensions)
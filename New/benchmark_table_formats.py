@@ -0,0 +1,165 @@
+import argparse
+import os
+import re
+import statistics
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import tiktoken
+
+from benchmark_table_scan import build_workbook
+from prompt_builder import PromptBuilder
+from table_extractor import TableExtractor
+from table_serializers import DEFAULT_FORMAT, SERIALIZERS, save_model_formats, serialize_table
+
+DEFAULT_MODELS = ["gpt-4", "gpt-4o", "gpt-4o-mini"]
+QUALITY_TOLERANCE = 0.05  # A format may lose this much grounded-number rate against markdown
+
+# Percentages and point gaps quoted in generated insights ("42%", "12.5 points", "8 pp")
+QUOTED_NUMBER = re.compile(r'(\d+(?:\.\d+)?)\s*(?:%|percent|pp\b|points?\b|percentage points?)', re.IGNORECASE)
+
+_encodings: Dict[str, object] = {}
+
+
+def count_tokens(text: str, model: str) -> int:
+    if model not in _encodings:
+        try:
+            _encodings[model] = tiktoken.encoding_for_model(model)
+        except KeyError:
+            _encodings[model] = tiktoken.get_encoding("cl100k_base")
+    return len(_encodings[model].encode(text))
+
+
+def load_tables(path: str, sheet_name: Optional[str], limit: Optional[int]) -> List[Tuple[str, str, pd.DataFrame]]:
+    """(QID, question text, banner-trimmed table) for the sheet's question blocks, as prompts get them."""
+    extractor = TableExtractor(path)
+    extractor.load_excel(sheet_name)
+    tables = []
+    for qid, text, table in extractor.iter_question_blocks():
+        if table.empty:
+            continue
+        tables.append((qid, text, extractor.banner_schema(table).select(table).copy()))
+        if limit and len(tables) >= limit:
+            break
+    return tables
+
+
+def rounding_error(table: pd.DataFrame, digits: int) -> float:
+    """Largest change a value suffers from rounding to digits."""
+    values = table.iloc[:, 1:].apply(pd.to_numeric, errors="coerce").to_numpy(dtype="float64")
+    values = values[~np.isnan(values)]
+    return float(np.abs(np.round(values, digits) - values).max()) if values.size else 0.0
+
+
+def grounded_rate(insights: str, table: pd.DataFrame, tolerance: float = 0.6) -> Optional[float]:
+    """
+    Share of percentages quoted in insights that match a table value or a gap between
+    two values of the same row or column (None when nothing is quoted).
+    """
+    quoted = [float(n) for n in QUOTED_NUMBER.findall(insights)]
+    if not quoted:
+        return None
+    values = table.iloc[:, 1:].apply(pd.to_numeric, errors="coerce").to_numpy(dtype="float64")
+    candidates = [values[~np.isnan(values)]]
+    for axis_values in list(values) + list(values.T):
+        v = axis_values[~np.isnan(axis_values)]
+        candidates.append(np.abs(v[:, None] - v[None, :]).ravel())
+    reference = np.concatenate(candidates) if candidates else np.array([])
+    grounded = sum(1 for q in quoted if reference.size and np.abs(reference - q).min() <= tolerance)
+    return grounded / len(quoted)
+
+
+def measure_tokens(tables, formats: List[str], models: List[str]) -> Dict[str, Dict[str, float]]:
+    """Mean tokens per table for every format and model."""
+    results = {}
+    for fmt in formats:
+        serialized = [serialize_table(table, fmt) for _, _, table in tables]
+        results[fmt] = {model: statistics.mean(count_tokens(text, model) for text in serialized) for model in models}
+        results[fmt]["chars"] = statistics.mean(len(text) for text in serialized)
+    return results
+
+
+def measure_quality(tables, formats: List[str], model: str) -> Dict[str, Optional[float]]:
+    """Generate insights from each format and score how many quoted numbers are grounded in the table."""
+    from openai import OpenAI
+    from openai_scheduler import get_scheduler
+    from utils import load_keys
+
+    client = OpenAI(api_key=load_keys()["OPENAI_API_KEY"])
+    builder = PromptBuilder()
+    scores = {}
+    for fmt in formats:
+        rates = []
+        for qid, text, table in tables:
+            prompt = builder.build_insight_prompt(text, serialize_table(table, fmt))
+            response = get_scheduler().chat(
+                client, model=model, temperature=0, max_tokens=600,
+                messages=[{"role": "system", "content": "You are an expert market research analyst."},
+                          {"role": "user", "content": prompt}])
+            rate = grounded_rate(response.choices[0].message.content or "", table)
+            if rate is not None:
+                rates.append(rate)
+        scores[fmt] = statistics.mean(rates) if rates else None
+        print(f"  {model} {fmt:<9} grounded numbers: {scores[fmt] if scores[fmt] is None else f'{scores[fmt]:.0%}'}")
+    return scores
+
+
+def choose_formats(tokens: Dict[str, Dict[str, float]], models: List[str],
+                   quality: Optional[Dict[str, Dict[str, Optional[float]]]] = None) -> Dict[str, str]:
+    """Cheapest format per model whose insight quality (when measured) stays near markdown's."""
+    choices = {}
+    for model in models:
+        ranked = sorted(tokens, key=lambda fmt: tokens[fmt][model])
+        scores = (quality or {}).get(model)
+        if scores and scores.get(DEFAULT_FORMAT) is not None:
+            floor = scores[DEFAULT_FORMAT] - QUALITY_TOLERANCE
+            ranked = [fmt for fmt in ranked if scores.get(fmt) is not None and scores[fmt] >= floor] or [DEFAULT_FORMAT]
+        choices[model] = ranked[0]
+    return choices
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare prompt token costs (and insight quality) of table formats.")
+    parser.add_argument("--workbook", default=None, help="Tables workbook (default: a synthetic one)")
+    parser.add_argument("--sheet", default=None, help="Sheet name (default col%%)")
+    parser.add_argument("--tables", type=int, default=200, help="Most question tables to measure")
+    parser.add_argument("--models", nargs="+", default=DEFAULT_MODELS)
+    parser.add_argument("--formats", nargs="+", default=list(SERIALIZERS), choices=list(SERIALIZERS))
+    parser.add_argument("--quality", type=int, default=0,
+                        help="Also generate insights for this many tables per format and model (calls the API)")
+    parser.add_argument("--save", action="store_true",
+                        help="Record the chosen format per model for the pipeline (requires --quality)")
+    args = parser.parse_args()
+    if args.save and not args.quality:
+        # Without quality scores the cheapest (lossy) format always wins
+        parser.error("--save needs --quality so the saved formats are checked against markdown's insights")
+
+    path = args.workbook
+    if path is None:
+        path = "bench_formats.xlsx"
+        build_workbook(path, 2_000)
+    tables = load_tables(path, args.sheet, args.tables)
+    if args.workbook is None:
+        os.remove(path)
+    print(f"Measuring {len(tables)} tables")
+
+    tokens = measure_tokens(tables, args.formats, args.models)
+    baseline = tokens[DEFAULT_FORMAT] if DEFAULT_FORMAT in tokens else None
+    error = max(rounding_error(table, 0) for _, _, table in tables)
+    print(f"\n{'format':<9} {'chars':>7} " + " ".join(f"{m:>12}" for m in args.models) + "   saving")
+    for fmt, row in tokens.items():
+        saving = f"{1 - row[args.models[0]] / baseline[args.models[0]]:>+7.0%}" if baseline else ""
+        print(f"{fmt:<9} {row['chars']:>7.0f} " + " ".join(f"{row[m]:>12.1f}" for m in args.models) + f"   {saving}")
+    print(f"\nCompact formats round to whole percents (largest rounding error: {error:.2f} points)")
+
+    quality = None
+    if args.quality:
+        print("\nInsight quality (share of quoted numbers grounded in the table):")
+        sample = tables[:args.quality]
+        quality = {model: measure_quality(sample, args.formats, model) for model in args.models}
+
+    choices = choose_formats(tokens, args.models, quality)
+    print("\nChosen format per model:", choices)
+    if args.save:
+        print(f"Saved to {save_model_formats(choices)}")
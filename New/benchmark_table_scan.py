@@ -0,0 +1,76 @@
+import argparse
+import os
+import time
+import tracemalloc
+from openpyxl import Workbook
+from table_extractor import TableExtractor
+
+SEGMENTS = ["Total", "Male", "Female", "18-24 years", "25-34 years", "35-44 years", "NCCS A", "NCCS B", "NCCS C"]
+APPS = ["Netflix", "Prime Video", "Hotstar", "YouTube", "SonyLiv", "Zee5", "JioCinema", "MX Player"]
+
+
+def build_workbook(path: str, total_rows: int, sheet_name: str = "col%") -> list:
+    """Write a synthetic col% sheet of repeated question blocks and return the question IDs in order."""
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(sheet_name)
+
+    question_ids = []
+    rows_written = 0
+    block_rows = 2 + len(APPS)  # question row + banner row + one row per app
+    question_num = 1
+    while rows_written + block_rows <= total_rows:
+        qid = f"Q{question_num}.1"
+        question_ids.append(qid)
+        ws.append([f"{qid} Which OTT apps have you used in the last month?"])
+        ws.append([""] + SEGMENTS)
+        for app_idx, app in enumerate(APPS):
+            ws.append([app] + [round((question_num * 7 + app_idx * 13 + seg * 3) % 100 + 0.5, 1)
+                               for seg in range(len(SEGMENTS))])
+        rows_written += block_rows
+        question_num += 1
+
+    wb.save(path)
+    return question_ids
+
+
+def extract(streaming: bool, path: str, question_id: str) -> tuple:
+    extractor = TableExtractor(path, streaming=streaming)
+    extractor.load_excel()
+    _, table = extractor.extract_question_table(question_id)
+    return table.shape
+
+
+def measure(streaming: bool, path: str, question_id: str) -> tuple:
+    """Return (seconds, peak traced MB, table shape) for one extraction."""
+    # Time without tracing, which slows allocation-heavy parsing considerably
+    start = time.perf_counter()
+    shape = extract(streaming, path, question_id)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    extract(streaming, path, question_id)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak / (1024 * 1024), shape
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare full-sheet parsing with the streaming scanner.")
+    parser.add_argument("--rows", type=int, default=500_000, help="Rows in the synthetic col% sheet")
+    parser.add_argument("--path", default="bench_tables.xlsx", help="Where to write the synthetic workbook")
+    parser.add_argument("--keep", action="store_true", help="Keep the synthetic workbook afterwards")
+    args = parser.parse_args()
+
+    print(f"Building synthetic workbook with {args.rows:,} rows...")
+    qids = build_workbook(args.path, args.rows)
+    targets = {"first": qids[0], "middle": qids[len(qids) // 2], "last": qids[-1]}
+
+    print(f"\n{'position':<8} {'mode':<10} {'seconds':>9} {'peak MB':>9}  shape")
+    for position, qid in targets.items():
+        for streaming in (False, True):
+            seconds, peak_mb, shape = measure(streaming, args.path, qid)
+            mode = "streaming" if streaming else "full"
+            print(f"{position:<8} {mode:<10} {seconds:>9.2f} {peak_mb:>9.1f}  {shape}")
+
+    if not args.keep:
+        os.remove(args.path)
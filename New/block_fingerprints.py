@@ -0,0 +1,233 @@
+import argparse
+import glob
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from study_registry import StudyConfig, get_registry, workbook_version
+from table_extractor import TableExtractor
+
+DEFAULT_FINGERPRINT_DIR = "Data/cache/fingerprints"
+DEFAULT_PROGRESS_DIR = "Data/sweeps"
+REPORT_EXTENSIONS = (".md", ".html", ".docx")
+
+
+def block_hash(question_text: str, table: pd.DataFrame) -> str:
+    """Content hash of one question block (question wording, banner and every cell)."""
+    digest = hashlib.sha256()
+    digest.update(str(question_text).encode("utf-8"))
+    digest.update(table.to_csv(index=False).encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def fingerprint_blocks(extractor: TableExtractor) -> Dict[str, str]:
+    """Fingerprint every question block of the extractor's sheet, keyed by upper-case QID."""
+    return {qid.upper(): block_hash(text, table) for qid, text, table in extractor.iter_question_blocks()}
+
+
+def diff_fingerprints(old: Dict[str, str], new: Dict[str, str]) -> Dict[str, List[str]]:
+    """Which QIDs changed, appeared, disappeared or stayed the same between two fingerprint sets."""
+    return {
+        "changed": [qid for qid in new if qid in old and old[qid] != new[qid]],
+        "added": [qid for qid in new if qid not in old],
+        "removed": [qid for qid in old if qid not in new],
+        "unchanged": [qid for qid in new if old.get(qid) == new[qid]],
+    }
+
+
+class FingerprintStore:
+    def __init__(self, directory: str = DEFAULT_FINGERPRINT_DIR):
+        """Last known block fingerprints per study, one JSON file each."""
+        self.directory = directory
+
+    def _path(self, study_id: str) -> str:
+        return os.path.join(self.directory, f"{study_id}.json")
+
+    def load(self, study_id: str) -> Optional[Dict[str, Any]]:
+        path = self._path(study_id)
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def save(self, study_id: str, version: str, blocks: Dict[str, str]) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self._path(study_id), "w", encoding="utf-8") as f:
+            json.dump({"workbook_version": version, "blocks": blocks, "updated": time.time()}, f, indent=2)
+
+
+def mark_sweep_stale(progress_path: str, qids: List[str]) -> int:
+    """Append 'stale' records so a resumed sweep regenerates these questions."""
+    if not qids or not os.path.exists(progress_path):
+        return 0
+    with open(progress_path, "a", encoding="utf-8") as f:
+        for qid in qids:
+            f.write(json.dumps({"qid": qid, "status": "stale", "finished_at": time.time()}) + "\n")
+    return len(qids)
+
+
+def remove_reports(report_dir: str, qids: List[str]) -> int:
+    """Delete per-question local reports for these QIDs (combined documents are rebuilt by the next sweep)."""
+    removed = 0
+    for qid in qids:
+        for ext in REPORT_EXTENSIONS:
+            for path in glob.glob(os.path.join(glob.escape(report_dir), f"{glob.escape(qid)}{ext}")):
+                os.remove(path)
+                removed += 1
+    return removed
+
+
+def release_local_assets(config: StudyConfig) -> None:
+    """Drop this process's loaded workbook and query engines, which hold the old data cut."""
+    from workbook_sql import drop_query_engines
+
+    get_registry().unload(config.study_id)
+    drop_query_engines(config.workbook)
+
+
+def invalidate_artifacts(config: StudyConfig, old_version: Optional[str], new_version: str,
+                         stale_qids: List[str], progress_path: Optional[str] = None,
+                         report_dir: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Invalidate what was derived from the changed blocks only.
+
+    Cached tables and completions in the node output cache need no deletion: extract_table
+    is keyed by block fingerprint, so changed blocks miss and unchanged ones keep hitting.
+    """
+    from semantic_cache import get_semantic_cache
+
+    result: Dict[str, Any] = {}
+    release_local_assets(config)
+
+    if old_version:
+        try:
+            result["semantic_cache"] = get_semantic_cache().migrate(config.study_id, old_version,
+                                                                    new_version, stale_qids)
+        except Exception as e:
+            print(f"Semantic cache not migrated: {e}")
+
+    progress_path = progress_path or os.path.join(DEFAULT_PROGRESS_DIR, f"{config.study_id}_progress.jsonl")
+    result["sweep_marked_stale"] = mark_sweep_stale(progress_path, stale_qids)
+
+    report_dir = report_dir or os.getenv("REPORT_OUTPUT", "Data/reports")
+    if os.path.isdir(report_dir):
+        result["reports_removed"] = remove_reports(report_dir, stale_qids)
+
+    return result
+
+
+_current: Dict[str, Tuple[str, Dict[str, str]]] = {}  # study_id -> (workbook version, fingerprints)
+_refresh_lock = threading.Lock()
+
+
+def refresh_study(study_id: Optional[str] = None,
+                  dry_run: bool = False,
+                  progress_path: Optional[str] = None,
+                  report_dir: Optional[str] = None,
+                  store: Optional[FingerprintStore] = None) -> Dict[str, Any]:
+    """
+    Fingerprint a study's workbook, diff it against the last known fingerprints and
+    invalidate artifacts for the changed QIDs only.
+
+    Args:
+        study_id: Registered study (default study if None)
+        dry_run: Only report what changed
+        progress_path: Sweep progress file to mark stale questions in
+        report_dir: Directory of per-question local reports
+
+    Returns:
+        Summary with the changed/added/removed QIDs and what was invalidated
+    """
+    config = get_registry().get(study_id)
+    store = store or FingerprintStore(os.getenv("FINGERPRINT_DIR", DEFAULT_FINGERPRINT_DIR))
+
+    with _refresh_lock:
+        version = workbook_version(config.workbook)
+        previous = store.load(config.study_id)
+        old_version = previous["workbook_version"] if previous else None
+
+        extractor = None
+        if previous and old_version == version:
+            blocks = previous["blocks"]
+            diff = diff_fingerprints(blocks, blocks)
+        else:
+            extractor = TableExtractor(config.workbook)
+            extractor.sheets = dict(config.sheets)
+            extractor.load_excel(config.sheet_name)
+            blocks = fingerprint_blocks(extractor)
+            diff = diff_fingerprints(previous["blocks"] if previous else {}, blocks)
+
+        stale = diff["changed"] + diff["removed"]
+        summary = {
+            "study_id": config.study_id,
+            "old_version": old_version,
+            "new_version": version,
+            **{key: value for key, value in diff.items() if key != "unchanged"},
+            "unchanged": len(diff["unchanged"]),
+        }
+
+        local_version = _current.get(config.study_id, (None, None))[0]
+        if not dry_run and old_version != version:
+            summary["invalidated"] = invalidate_artifacts(config, old_version, version, stale,
+                                                          progress_path, report_dir)
+            store.save(config.study_id, version, blocks)
+            try:
+                # The request path only reads cubes, so the new version's cube is built here
+                from aggregate_cube import build_cube
+                summary["cube"] = build_cube(config.study_id, extractor)
+            except Exception as e:
+                print(f"Aggregate cube not built for '{config.study_id}': {e}")
+        elif not dry_run and local_version != version:
+            # Another process already brought the store up to date, but what this process
+            # loaded may still be from the old workbook
+            release_local_assets(config)
+            summary["released_local_assets"] = True
+        if not dry_run:
+            _current[config.study_id] = (version, blocks)
+
+    return summary
+
+
+def current_fingerprints(study_id: Optional[str] = None) -> Dict[str, str]:
+    """Block fingerprints for the study's workbook as it is now, refreshing first if it changed."""
+    config = get_registry().get(study_id)
+    version = workbook_version(config.workbook)
+    current = _current.get(config.study_id)
+    if current is None or current[0] != version:
+        summary = refresh_study(config.study_id)
+        if summary["old_version"] and summary["old_version"] != version:
+            print(f"Workbook for '{config.study_id}' changed: {len(summary['changed'])} changed, "
+                  f"{len(summary['added'])} added, {len(summary['removed'])} removed questions")
+        current = _current[config.study_id]
+    return current[1]
+
+
+def block_fingerprint(study_id: Optional[str], question_id: Optional[str]) -> str:
+    """Fingerprint of one question's block (the workbook version when the QID has no block).
+
+    An unreadable workbook gets a one-off key so nothing cached is served for it and the
+    table node reports the error itself.
+    """
+    try:
+        blocks = current_fingerprints(study_id)
+        return blocks.get(str(question_id or "").upper()) or workbook_version(get_registry().get(study_id).workbook)
+    except Exception as e:
+        print(f"Could not fingerprint '{question_id}' for study '{study_id}': {e}")
+        return f"unavailable-{time.time_ns()}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Detect which question blocks changed in a refreshed workbook.")
+    parser.add_argument("--study", default=None, help="Registered study ID (default study if omitted)")
+    parser.add_argument("--dry-run", action="store_true", help="Report changes without invalidating anything")
+    parser.add_argument("--progress", default=None, help="Sweep progress file to mark stale questions in")
+    parser.add_argument("--reports", default=None, help="Directory of per-question local reports")
+    args = parser.parse_args()
+
+    summary = refresh_study(args.study, dry_run=args.dry_run, progress_path=args.progress, report_dir=args.reports)
+    print(json.dumps(summary, indent=2))
@@ -0,0 +1,110 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from langgraph.checkpoint.sqlite import SqliteSaver
+
+DEFAULT_CHECKPOINT_DB = "Data/cache/pipeline_checkpoints.sqlite"
+
+# How to tell that a node ran but didn't produce a usable result (nodes report failures in state)
+STAGE_FAILED: Dict[str, Callable[[Dict[str, Any]], bool]] = {
+    "query_pdf": lambda s: s.get("question_id", "unknown") == "unknown",
+    "extract_table": lambda s: "table_dict" not in s,
+    "build_prompt": lambda s: not s.get("prompt") or s["prompt"].startswith(("Error", "Failed", "No table")),
+    "generate_insights": lambda s: not s.get("insights") or s["insights"].startswith(("GPT failed", "Error", "No ")),
+    "save_to_doc": lambda s: not s.get("doc_url"),
+}
+
+
+def checkpoint_db_path() -> str:
+    return os.getenv("PIPELINE_CHECKPOINT_DB", DEFAULT_CHECKPOINT_DB)
+
+
+def _connect(db_path: str) -> sqlite3.Connection:
+    os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+    return sqlite3.connect(db_path, check_same_thread=False)
+
+
+def open_checkpointer(db_path: Optional[str] = None) -> SqliteSaver:
+    """SQLite-backed LangGraph checkpointer; each run is a thread keyed by its run ID."""
+    return SqliteSaver(_connect(db_path or checkpoint_db_path()))
+
+
+def _to_json(value: Any) -> Any:
+    # NumPy scalars and similar objects that json can't handle natively
+    return value.item() if hasattr(value, "item") else str(value)
+
+
+class NodeOutputCache:
+    def __init__(self, db_path: Optional[str] = None):
+        """
+        Reuse completed node outputs across runs whose inputs to that node are identical.
+        Stored in the same SQLite file as the checkpoints.
+        """
+        self._conn = _connect(db_path or checkpoint_db_path())
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS node_outputs (
+                       node TEXT NOT NULL,
+                       input_hash TEXT NOT NULL,
+                       output TEXT NOT NULL,
+                       created REAL NOT NULL,
+                       PRIMARY KEY (node, input_hash))"""
+            )
+            self._conn.commit()
+
+    def _get(self, node: str, input_hash: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT output FROM node_outputs WHERE node = ? AND input_hash = ?", (node, input_hash)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _put(self, node: str, input_hash: str, output: Dict[str, Any]) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO node_outputs (node, input_hash, output, created) VALUES (?, ?, ?, ?)",
+                (node, input_hash, json.dumps(output, default=_to_json), time.time())
+            )
+            self._conn.commit()
+
+    def wrap(self, node: str, fn: Callable[[Dict[str, Any]], Dict[str, Any]],
+             key_fn: Callable[[Dict[str, Any]], Any]) -> Callable[[Dict[str, Any]], Dict[str, Any]]:
+        """
+        Wrap a node so its output is looked up by a hash of key_fn(state) before running it.
+
+        Only the keys the node changed are stored, and failed outputs are never cached.
+        """
+        failed = STAGE_FAILED.get(node, lambda s: False)
+
+        def cached_node(state: Dict[str, Any]) -> Dict[str, Any]:
+            input_hash = hashlib.sha256(
+                json.dumps(key_fn(state), sort_keys=True, default=_to_json).encode("utf-8")
+            ).hexdigest()
+
+            delta = self._get(node, input_hash)
+            if delta is not None:
+                print(f"\nReusing cached output for node '{node}'")
+                return {**state, **delta}
+
+            result = fn(state)
+            if not failed(result):
+                delta = {k: v for k, v in result.items() if k not in state or state[k] != v}
+                self._put(node, input_hash, delta)
+            return result
+
+        return cached_node
+
+
+def first_failed_stage(state: Dict[str, Any], stages) -> Optional[str]:
+    """Return the first stage (in execution order) whose output in state looks failed."""
+    for stage in stages:
+        check = STAGE_FAILED.get(stage)
+        if check and check(state):
+            return stage
+    return None
@@ -0,0 +1,116 @@
+import os
+import sqlite3
+import threading
+import uuid
+from typing import Any, Dict, Iterable, List, Optional
+
+DEFAULT_CHUNK_STORE = "Data/cache/chunk_text.sqlite"
+
+
+class ChunkTextStore:
+    def __init__(self, db_path: str = DEFAULT_CHUNK_STORE):
+        """
+        Local key-value store for questionnaire chunk text, keyed by vector ID.
+
+        Vectors in Pinecone only carry IDs and QIDs; the text lives here and is
+        fetched for the handful of candidates that survive reranking.
+        """
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self.db_path = db_path
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS chunks (
+                       chunk_id TEXT PRIMARY KEY,
+                       namespace TEXT,
+                       qid TEXT,
+                       text TEXT NOT NULL,
+                       clean_text TEXT NOT NULL)"""
+            )
+            # Changes on every write to a namespace, so cached retrieval results can be keyed by it
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS namespace_versions (namespace TEXT PRIMARY KEY, version TEXT NOT NULL)"
+            )
+            self._conn.commit()
+
+    def put_many(self, records: Iterable[Dict[str, Any]]) -> None:
+        """Store chunks given as dicts with chunk_id, namespace, qid, text and clean_text."""
+        rows = [(r["chunk_id"], r.get("namespace"), r.get("qid"), r["text"], r["clean_text"]) for r in records]
+        namespaces = {row[1] or "default" for row in rows}
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO chunks (chunk_id, namespace, qid, text, clean_text) VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+            self._conn.executemany("INSERT OR REPLACE INTO namespace_versions VALUES (?, ?)",
+                                   [(namespace, uuid.uuid4().hex[:12]) for namespace in namespaces])
+            self._conn.commit()
+
+    def namespace_version(self, namespace: str) -> str:
+        """Version of a namespace's chunks ("" if nothing was stored for it)."""
+        with self._lock:
+            row = self._conn.execute("SELECT version FROM namespace_versions WHERE namespace = ?",
+                                     (namespace or "default",)).fetchone()
+        return row[0] if row else ""
+
+    def get_many(self, chunk_ids: List[str]) -> Dict[str, Dict[str, str]]:
+        """Return {chunk_id: {"text", "clean_text", "qid"}} for the IDs that exist."""
+        if not chunk_ids:
+            return {}
+
+        placeholders = ",".join("?" for _ in chunk_ids)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT chunk_id, text, clean_text, qid FROM chunks WHERE chunk_id IN ({placeholders})",
+                list(chunk_ids)
+            ).fetchall()
+        return {row[0]: {"text": row[1], "clean_text": row[2], "qid": row[3]} for row in rows}
+
+
+def normalize_match(match: Any) -> Dict[str, Any]:
+    """Turn a Pinecone match (dict or client object) into a plain dict with id, score and metadata."""
+    if isinstance(match, dict):
+        return {"id": match.get("id"), "score": match.get("score", 0), "metadata": dict(match.get("metadata") or {})}
+    return {
+        "id": getattr(match, "id", None),
+        "score": getattr(match, "score", 0),
+        "metadata": dict(getattr(match, "metadata", None) or {})
+    }
+
+
+def hydrate_matches(matches: List[Any], store: Optional["ChunkTextStore"] = None) -> List[Dict[str, Any]]:
+    """Fill in chunk text for matches whose metadata doesn't carry it (older vectors still do)."""
+    matches = [normalize_match(m) for m in matches]
+    missing = [m["id"] for m in matches if m["id"] and not m["metadata"].get("text")]
+    if not missing:
+        return matches
+
+    store = store or get_chunk_store()
+    texts = store.get_many(missing)
+    for m in matches:
+        stored = texts.get(m["id"])
+        if stored and not m["metadata"].get("text"):
+            m["metadata"]["text"] = stored["text"]
+            m["metadata"]["clean_text"] = stored["clean_text"]
+            m["metadata"].setdefault("qid", stored["qid"])
+
+    unresolved = [chunk_id for chunk_id in missing if chunk_id not in texts]
+    if unresolved:
+        print(f"Warning: {len(unresolved)} matched chunks are missing from the chunk text store "
+              f"({store.db_path}); re-embed the questionnaire or point CHUNK_STORE_PATH at its store. "
+              f"Those matches are ranked by embedding score alone")
+    return matches
+
+
+_store: Optional[ChunkTextStore] = None
+_store_lock = threading.Lock()
+
+
+def get_chunk_store() -> ChunkTextStore:
+    """Return the process-wide chunk text store (path from CHUNK_STORE_PATH)."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ChunkTextStore(os.getenv("CHUNK_STORE_PATH", DEFAULT_CHUNK_STORE))
+        return _store
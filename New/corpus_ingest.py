@@ -0,0 +1,167 @@
+import argparse
+import json
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Dict, List, Optional
+
+from pdf_embedder import EMBED_BATCH_SIZE, PAGE_EXTRACTORS, chunk_pages, embed_and_store, extract_pages
+
+
+def find_questionnaires(root: str) -> List[str]:
+    """Every file under root with a supported questionnaire format, in a stable order."""
+    paths = []
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            # Skip Office lock files ("~$name.docx")
+            if filename.startswith("~$"):
+                continue
+            if os.path.splitext(filename)[1].lower() in PAGE_EXTRACTORS:
+                paths.append(os.path.join(dirpath, filename))
+    return sorted(paths)
+
+
+def chunk_id_prefix(namespace: str, root: str, path: str) -> str:
+    """Vector ID prefix unique to a file, so chunks from different files never overwrite each other."""
+    relative = os.path.splitext(os.path.relpath(path, root))[0]
+    return f"{namespace}-{re.sub(r'[^A-Za-z0-9_.-]+', '_', relative)}"
+
+
+def extract_and_chunk(path: str, id_prefix: str) -> Dict[str, Any]:
+    """
+    Extract and chunk one file (runs in a worker process).
+
+    Errors are returned rather than raised, so one bad file doesn't stop the corpus.
+    """
+    start = time.perf_counter()
+    result = {"path": path, "chunks": [], "pages": 0, "error": None}
+    try:
+        pages = extract_pages(path)
+        chunks = chunk_pages(pages)
+        for i, chunk in enumerate(chunks):
+            chunk["chunk_id"] = f"{id_prefix}-chunk-{i}"
+        result.update(chunks=chunks, pages=len(pages))
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["extract_seconds"] = round(time.perf_counter() - start, 3)
+    return result
+
+
+def ingest_corpus(root: str,
+                  namespace: str = "default",
+                  study_id: Optional[str] = None,
+                  workers: Optional[int] = None,
+                  batch_size: int = EMBED_BATCH_SIZE,
+                  embed: bool = True) -> Dict[str, Any]:
+    """
+    Extract and chunk every questionnaire under a directory in a process pool, then
+    embed all chunks in one batched stage.
+
+    Args:
+        root: Directory to walk for PDF and DOCX files
+        namespace: Study questionnaire namespace
+        study_id: Study recorded in vector metadata (defaults to the namespace)
+        workers: Extraction processes (default: CPU count)
+        batch_size: Chunks per embeddings request / upsert
+        embed: Set False to only extract and chunk (dry run)
+
+    Returns:
+        Report with per-file timing, chunk counts and errors
+    """
+    paths = find_questionnaires(root)
+    print(f"Found {len(paths)} questionnaires under {root}")
+
+    corpus_start = time.perf_counter()
+    files: Dict[str, Dict[str, Any]] = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(extract_and_chunk, path, chunk_id_prefix(namespace, root, path)): path
+                   for path in paths}
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                # A crashed worker (BrokenProcessPool) or unpicklable result only fails this file
+                result = {"path": futures[future], "pages": 0, "chunks": [], "extract_seconds": 0.0,
+                          "error": f"Extraction worker failed: {type(e).__name__}: {e}"}
+            files[result["path"]] = result
+            status = f"failed ({result['error']})" if result["error"] else f"{len(result['chunks'])} chunks"
+            print(f"Extracted {result['path']}: {status} in {result['extract_seconds']}s")
+    extract_seconds = time.perf_counter() - corpus_start
+
+    # Single embedding stage over every file's chunks; a failed batch only fails its files
+    pending = [(path, chunk) for path in paths for chunk in files[path]["chunks"] if not files[path]["error"]]
+    for result in files.values():
+        result["embed_seconds"] = 0.0
+
+    embed_start = time.perf_counter()
+    if embed:
+        for start in range(0, len(pending), batch_size):
+            batch = pending[start:start + batch_size]
+            batch_start = time.perf_counter()
+            try:
+                embed_and_store([chunk for _, chunk in batch], namespace=namespace,
+                                study_id=study_id, batch_size=batch_size)
+                error = None
+            except Exception as e:
+                error = f"Embedding failed: {type(e).__name__}: {e}"
+                print(error)
+
+            # Attribute the batch time to files by their share of its chunks
+            share = (time.perf_counter() - batch_start) / len(batch)
+            for path, _ in batch:
+                files[path]["embed_seconds"] += share
+                if error and not files[path]["error"]:
+                    files[path]["error"] = error
+    embed_seconds = time.perf_counter() - embed_start
+
+    file_reports = [{
+        "path": path,
+        "status": "failed" if files[path]["error"] else "done",
+        "pages": files[path]["pages"],
+        "chunks": len(files[path]["chunks"]),
+        "extract_seconds": files[path]["extract_seconds"],
+        "embed_seconds": round(files[path]["embed_seconds"], 3),
+        "error": files[path]["error"]
+    } for path in paths]
+
+    report = {
+        "root": root,
+        "namespace": namespace,
+        "files": len(paths),
+        "failed": sum(1 for f in file_reports if f["status"] == "failed"),
+        "chunks": sum(f["chunks"] for f in file_reports if f["status"] == "done"),
+        "extract_seconds": round(extract_seconds, 2),
+        "embed_seconds": round(embed_seconds, 2),
+        "total_seconds": round(time.perf_counter() - corpus_start, 2),
+        "file_reports": file_reports
+    }
+
+    print("\nCorpus Ingestion Summary")
+    print("=========================")
+    for key, value in report.items():
+        if key != "file_reports":
+            print(f"{key}: {value}")
+    for f in file_reports:
+        if f["error"]:
+            print(f"FAILED {f['path']}: {f['error']}")
+
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Embed a directory of PDF and DOCX questionnaires.")
+    parser.add_argument("root", help="Directory of questionnaires")
+    parser.add_argument("--namespace", default="default", help="Study questionnaire namespace")
+    parser.add_argument("--study", default=None, help="Study ID for vector metadata (default: namespace)")
+    parser.add_argument("--workers", type=int, default=None, help="Extraction processes (default: CPU count)")
+    parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE, help="Chunks per embeddings request")
+    parser.add_argument("--dry-run", action="store_true", help="Extract and chunk only, without embedding")
+    parser.add_argument("--report", default=None, help="Write the JSON report to this path")
+    args = parser.parse_args()
+
+    report = ingest_corpus(args.root, namespace=args.namespace, study_id=args.study, workers=args.workers,
+                           batch_size=args.batch_size, embed=not args.dry_run)
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
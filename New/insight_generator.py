@@ -1,11 +1,21 @@
-import pandas as pd
 from openai import OpenAI
-from typing import Optional, Tuple
+from typing import Any, Dict, Optional, Tuple
 from utils import load_keys, extract_insights_and_recommendations
 from table_extractor import TableExtractor
 from prompt_builder import PromptBuilder
 from pinecone_search import query_pinecone
-from google_doc_saver import create_insight_doc
+from report_sinks import ReportSink, get_sink
+from study_registry import get_registry
+from significance import find_significant_differences, format_significant_differences
+from request_coalescing import SingleFlight
+from openai_scheduler import get_scheduler
+from structured_insights import generate_structured_insights, max_tokens_for
+from table_serializers import table_format_for
+
+INSIGHT_MODEL = "gpt-4"
+
+# Shared across generator instances so concurrent callers for the same question share one run
+_insight_flights = SingleFlight()
 
 class InsightGenerator:
     def __init__(self, api_key: Optional[str] = None):
@@ -23,6 +33,9 @@ class InsightGenerator:
         self.client = OpenAI(api_key=api_key)
         self.extractor = None
         self.prompt_builder = None
+        self.namespace = "default"
+        self.base_size = None  # Study-level fallback; each question's own base comes from the counts sheet
+        self.sink: Optional[ReportSink] = None
 
     def setup_project(self,
                       filepath: str,
@@ -33,10 +46,19 @@ class InsightGenerator:
         self.extractor.load_excel()
         self.prompt_builder = PromptBuilder(brand_name, study_context)
 
+    def setup_study(self, study_id: Optional[str] = None) -> None:
+        """Set up the project from a registered study (the default study if none is given)."""
+        assets = get_registry().assets(study_id)
+        self.extractor = assets.extractor
+        self.prompt_builder = assets.prompt_builder
+        self.namespace = assets.config.namespace
+        self.base_size = assets.config.base_size
+
     def generate_insights(self,
                           question_id: str,
                           num_insights: int = 3,
-                          num_recommendations: int = 2) -> Tuple[str, str, str]:
+                          num_recommendations: int = 2,
+                          structured: bool = False) -> Tuple[str, str, str]:
         """
         Generate insights for a specific question.
 
@@ -44,6 +66,7 @@ class InsightGenerator:
             question_id: The question ID (e.g., "Q10.1")
             num_insights: Number of insights to request
             num_recommendations: Number of recommendations to request
+            structured: Request schema-constrained JSON output (falls back to free-form text)
 
         Returns:
             Tuple[str, str, str]: (question_text, insights, google_doc_url)
@@ -51,79 +74,39 @@ class InsightGenerator:
         if self.extractor is None or self.prompt_builder is None:
             raise ValueError("Project not set up. Call setup_project() first.")
 
+        key = (self.extractor.filepath, question_id.strip().upper(), num_insights, num_recommendations, structured)
+        result, shared = _insight_flights.do(
+            key, self._generate_insights, question_id, num_insights, num_recommendations, structured
+        )
+        if shared:
+            print(f"\nJoined in-flight insight generation for {question_id}")
+        return result
+
+    def _generate_insights(self,
+                           question_id: str,
+                           num_insights: int,
+                           num_recommendations: int,
+                           structured: bool = False) -> Tuple[str, str, str]:
+        """Run the full extraction -> prompt -> GPT -> Docs pipeline for one question."""
         try:
-            # Extract and clean the table data
-            _, table_df = self.extractor.extract_question_table(question_id)
-
-            # Try to get the real question text from Pinecone
-            try:
-                matches = query_pinecone(question_id)
-                question_text = next((m for m in matches if question_id.lower() in m.lower()), matches[0])
-                question_text = question_text.split("\nQ")[0].strip()
-            except Exception:
-                question_text = question_id
-
-            # Filter good columns from the table
-            all_columns = [col for col in table_df.columns if pd.notna(col)]
-            relevant_columns = []
-            key_terms = ['total', 'base', 'male', 'female', 'age', 'nccs', 'years']
-
-            for col in all_columns:
-                col_str = str(col).lower()
-                if 'all' in col_str or any(term in col_str for term in key_terms):
-                    relevant_columns.append(col)
-
-            if len(relevant_columns) < 5:
-                relevant_columns.extend(all_columns[:10])
-
-            relevant_columns = list(dict.fromkeys(relevant_columns))[:10]
-            trimmed_df = table_df[relevant_columns].copy()
-
-            # Format the cleaned table
-            formatted_df = self.extractor.format_table(trimmed_df)
-            print("\n Formatted Table Preview:\n")
-            print(formatted_df)
-
-            # Build prompt
+            prepared = self.prepare_question(question_id)
             prompt = self.prompt_builder.build_insight_prompt(
-                question_text=question_text,
-                table_df=formatted_df,
-                base_size=2314,
+                question_text=prepared["question_text"],
+                table_df=prepared["table"],
+                base_size=prepared["base_size"] or self.base_size,
                 num_insights=num_insights,
-                num_recommendations=num_recommendations
+                num_recommendations=num_recommendations,
+                significant_differences=prepared["significant_differences"]
             )
 
             print("\nFinal Prompt Preview:\n")
             print(prompt)
 
             print(f"\nGenerating insights for {question_id}...")
-            response = self.client.chat.completions.create(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": "You are an expert market research analyst."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.7
-            )
-
-            if not response.choices or not response.choices[0].message.content:
-                raise RuntimeError("No response received from GPT")
-
-            insights = response.choices[0].message.content
-            if not isinstance(insights, str):
-                raise RuntimeError("Invalid response format from GPT")
-
-            # Extract trimmed content (Insights + Recommendations only)
-            trimmed_output = extract_insights_and_recommendations(insights)
-
-            # Save to Google Docs
-            url = create_insight_doc(
-                question_id=question_id,
-                question_text=question_text,
-                insights=trimmed_output
-            )
-            print(f"\nInsights saved to Google Doc: {url}")
+            trimmed_output = self.complete(prompt, num_insights, num_recommendations, structured)
 
+            question_text = prepared["question_text"]
+            url = self.save_insights(question_id, question_text, trimmed_output)
             return question_text, trimmed_output, url
 
         except Exception as e:
@@ -131,18 +114,89 @@ class InsightGenerator:
             print(f"\nERROR: {error_msg}")
             raise RuntimeError(error_msg)
 
+    def prepare_question(self, question_id: str) -> Dict[str, Any]:
+        """Extract, trim and test one question's table; returns the parts a prompt is built from."""
+        # Extract and clean the table data
+        _, table_df = self.extractor.extract_question_table(question_id)
+
+        # Try to get the real question text from Pinecone
+        try:
+            matches = query_pinecone(question_id, namespace=self.namespace)
+            question_text = next((m for m in matches if question_id.lower() in m.lower()), matches[0])
+            question_text = question_text.split("\nQ")[0].strip()
+        except Exception:
+            question_text = question_id
+
+        # Keep the Total / Gender / Age / NCCS banner columns (schema parsed once per workbook)
+        schema = self.extractor.banner_schema(table_df)
+        trimmed_df = schema.select(table_df).copy()
+
+        # Format the cleaned table in the format chosen for the insight model
+        formatted_df = self.extractor.format_table(trimmed_df, table_format_for(INSIGHT_MODEL))
+        print("\n Formatted Table Preview:\n")
+        print(formatted_df)
+
+        # Test all banner columns of the full table locally, against the real bases when the
+        # workbook has them (unweighted bases, else counts) rather than the col% sheet's base row
+        bases = self.extractor.base_sizes(question_id, "unweighted") or self.extractor.base_sizes(question_id)
+        significant = find_significant_differences(table_df, bases=bases, dimensions=schema.label_dimensions())
+
+        return {
+            "question_id": question_id,
+            "question_text": question_text,
+            "table": formatted_df,
+            "base_size": self.extractor.total_base(question_id),
+            "significant_differences": format_significant_differences(significant) if significant else None
+        }
+
+    def save_insights(self, question_id: str, question_text: str, insights: str) -> str:
+        """Save generated insights to the report sink (Google Docs unless set otherwise) and return its location."""
+        sink = self.sink or get_sink()
+        url = sink.write(question_id, question_text, insights)
+        print(f"\nInsights saved with the {sink.name} sink: {url}")
+        return url
+
+    def complete(self,
+                 prompt: str,
+                 num_insights: int = 3,
+                 num_recommendations: int = 2,
+                 structured: bool = False) -> str:
+        """Send a built prompt to GPT and return the trimmed insights and recommendations."""
+        if structured:
+            formatted = generate_structured_insights(self.client, prompt, num_insights, num_recommendations)
+            if formatted:
+                return formatted
+
+        response = get_scheduler().chat(
+            self.client,
+            model=INSIGHT_MODEL,
+            messages=[
+                {"role": "system", "content": "You are an expert market research analyst."},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0.7,
+            # Free-form text needs more room than JSON items, but is still bounded
+            max_tokens=2 * max_tokens_for(num_insights, num_recommendations)
+        )
+
+        if not response.choices or not response.choices[0].message.content:
+            raise RuntimeError("No response received from GPT")
+
+        insights = response.choices[0].message.content
+        if not isinstance(insights, str):
+            raise RuntimeError("Invalid response format from GPT")
+
+        # Extract trimmed content (Insights + Recommendations only)
+        return extract_insights_and_recommendations(insights)
+
 def test_insight_generation():
     """Test the insight generation pipeline."""
     try:
         # Initialize the generator
         generator = InsightGenerator()
 
-        # Set up the project
-        generator.setup_project(
-            filepath="Data/raw data/Tables.xlsx",
-            brand_name="TestBrand",
-            study_context="brand awareness study"
-        )
+        # Set up the project from the default registered study
+        generator.setup_study()
 
         # Generate insights for a question
         question_text, insights, url = generator.generate_insights("Q10.1")
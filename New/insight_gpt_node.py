@@ -1,5 +1,8 @@
 from openai import OpenAI
 from utils import load_keys
+from openai_scheduler import get_scheduler
+from structured_insights import generate_structured_insights, max_tokens_for
+import os
 import pandas as pd
 from typing import Dict, Any
 
@@ -8,6 +11,9 @@ def insight_gpt_node(state: Dict[str, Any]) -> Dict[str, Any]:
     question_id = state.get("question_id", "unknown")
     question_text = state.get("question_text", "")
     prompt = state.get("prompt", "")
+    num_insights = state.get("num_insights", 3)
+    num_recommendations = state.get("num_recommendations", 2)
+    structured = state.get("structured_output", os.getenv("INSIGHT_STRUCTURED_OUTPUT", "").lower() in ("1", "true"))
     
     # Convert table_dict back to DataFrame if available
     table_df = None
@@ -30,6 +36,14 @@ def insight_gpt_node(state: Dict[str, Any]) -> Dict[str, Any]:
             "insights": "No table data available for analysis"
         }
 
+    # Comparison questions already answered from the aggregate cube skip the LLM round trip
+    if state.get("direct_answer"):
+        print(f"\nAnswered {question_id} from the aggregate cube")
+        return {
+            **state,
+            "insights": state["direct_answer"]
+        }
+
     print(f"\nGenerating insights for {question_id}...")
 
     try:
@@ -37,14 +51,26 @@ def insight_gpt_node(state: Dict[str, Any]) -> Dict[str, Any]:
         keys = load_keys()
         client = OpenAI(api_key=keys["OPENAI_API_KEY"])
 
-        # Send prompt to GPT-4
-        response = client.chat.completions.create(
+        # Structured mode: schema-constrained JSON with a bounded output length
+        if structured:
+            insights = generate_structured_insights(client, prompt, num_insights, num_recommendations)
+            if insights:
+                print("\nInsights generated:\n", insights)
+                return {
+                    **state,
+                    "insights": insights
+                }
+
+        # Send prompt to GPT-4 (paced under the shared rate limits)
+        response = get_scheduler().chat(
+            client,
             model="gpt-4",
             messages=[
                 {"role": "system", "content": "You are an expert market research analyst."},
                 {"role": "user", "content": prompt}
             ],
-            temperature=0.7
+            temperature=0.7,
+            max_tokens=2 * max_tokens_for(num_insights, num_recommendations)
         )
 
         # Safely extract content from response
@@ -0,0 +1,299 @@
+import argparse
+import itertools
+import os
+import random
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import Future
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+# Priority classes (lower runs first)
+INTERACTIVE, NORMAL, BATCH = 0, 1, 2
+PRIORITY_CLASSES = {"interactive": INTERACTIVE, "normal": NORMAL, "batch": BATCH}
+CLASS_NAMES = {level: name for name, level in PRIORITY_CLASSES.items()}
+
+DEFAULT_WORKERS = 4
+DEFAULT_MAX_BATCH_WAIT = 300.0  # Seconds a queued job waits before it is promoted one class
+DEFAULT_URGENT_SLACK = 30.0  # Jobs this close to their deadline are promoted one class
+
+_context = threading.local()
+
+
+def current_priority() -> int:
+    """Priority class of the job running on this thread (NORMAL outside the scheduler)."""
+    return getattr(_context, "priority", NORMAL)
+
+
+@contextmanager
+def priority_context(priority):
+    """Run a block (and the OpenAI calls it makes) under a priority class."""
+    level = PRIORITY_CLASSES[priority] if isinstance(priority, str) else priority
+    previous = getattr(_context, "priority", None)
+    _context.priority = level
+    try:
+        yield
+    finally:
+        if previous is None:
+            del _context.priority
+        else:
+            _context.priority = previous
+
+
+class DeadlineExceeded(Exception):
+    """A job's deadline passed before a worker could start it."""
+
+
+@dataclass
+class Job:
+    job_id: int
+    priority: int
+    study_id: str
+    fn: Callable
+    args: tuple
+    kwargs: Dict[str, Any]
+    future: Future
+    submitted: float
+    deadline: Optional[float] = None  # time.monotonic() deadline
+    started: Optional[float] = None
+    finished: Optional[float] = None
+
+
+@dataclass
+class ClassStats:
+    latencies: List[float] = field(default_factory=list)  # Submit to finish
+    waits: List[float] = field(default_factory=list)  # Submit to start
+    failed: int = 0
+    expired: int = 0
+    missed_deadline: int = 0
+
+
+def _percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+class JobScheduler:
+    def __init__(self,
+                 workers: int = DEFAULT_WORKERS,
+                 batch_workers: Optional[int] = None,
+                 max_batch_wait: float = DEFAULT_MAX_BATCH_WAIT,
+                 urgent_slack: float = DEFAULT_URGENT_SLACK,
+                 drop_expired: bool = True):
+        """
+        Priority- and deadline-aware job queue in front of the pipeline.
+
+        Args:
+            workers: Jobs run concurrently
+            batch_workers: Most batch jobs running at once (default: workers - 1, so a
+                worker is always free for interactive questions)
+            max_batch_wait: Queue time after which a job is promoted one class (no starvation)
+            urgent_slack: Seconds before its deadline at which a job is promoted one class
+            drop_expired: Fail jobs whose deadline passed while queued instead of running them
+
+        Dispatch order: effective priority class, then the study that has used the least
+        worker time (fair sharing), then earliest deadline, then submission order. Running
+        jobs are never interrupted; lower classes are deferred instead, both here and at the
+        OpenAI rate limiter (see current_priority).
+        """
+        if workers < 1:
+            raise ValueError("workers must be at least 1")
+        self.workers = workers
+        self.batch_workers = max(1, workers - 1) if batch_workers is None else batch_workers
+        self.max_batch_wait = max_batch_wait
+        self.urgent_slack = urgent_slack
+        self.drop_expired = drop_expired
+
+        self._queue: List[Job] = []
+        self._running: Dict[int, Job] = {}
+        self._served: Dict[str, float] = defaultdict(float)  # Worker seconds used per study
+        self._ids = itertools.count(1)
+        self._cond = threading.Condition()
+        self._closed = False
+        self.stats: Dict[int, ClassStats] = {level: ClassStats() for level in CLASS_NAMES}
+
+        self._threads = [threading.Thread(target=self._worker, name=f"job-worker-{i}", daemon=True)
+                         for i in range(workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, fn: Callable, *args,
+               priority="normal",
+               study_id: Optional[str] = None,
+               deadline: Optional[float] = None,
+               **kwargs) -> Future:
+        """
+        Queue fn(*args, **kwargs).
+
+        Args:
+            priority: "interactive", "normal" or "batch" (or the class constant)
+            study_id: Study the job belongs to, for fair sharing
+            deadline: Seconds from now by which the job should finish
+        """
+        level = PRIORITY_CLASSES[priority] if isinstance(priority, str) else priority
+        now = time.monotonic()
+        job = Job(next(self._ids), level, study_id or "default", fn, args, kwargs, Future(), now,
+                  now + deadline if deadline is not None else None)
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Scheduler is shut down")
+            self._queue.append(job)
+            self._cond.notify()
+        return job.future
+
+    def submit_question(self, question: str, study_id: Optional[str] = None,
+                        priority="interactive", deadline: Optional[float] = None) -> Future:
+        """Queue a pipeline run for a question (interactive by default)."""
+        from langgraph_app import run_pipeline
+        return self.submit(run_pipeline, question, study_id, priority=priority, study_id=study_id, deadline=deadline)
+
+    def _effective_priority(self, job: Job, now: float) -> int:
+        if job.priority == INTERACTIVE:
+            return INTERACTIVE
+        promotions = int((now - job.submitted) // self.max_batch_wait) if self.max_batch_wait else 0
+        if job.deadline is not None and job.deadline - now <= self.urgent_slack:
+            promotions += 1
+        # Promotion never turns background work into interactive work
+        return max(NORMAL, job.priority - promotions)
+
+    def _pick(self, now: float) -> Optional[Job]:
+        """Next job to start (caller holds the lock), or None if nothing may start now."""
+        running_batch = sum(1 for job in self._running.values() if job.priority == BATCH)
+        candidates = [job for job in self._queue
+                      if job.priority != BATCH or running_batch < self.batch_workers]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda job: (
+            self._effective_priority(job, now),
+            self._served[job.study_id],
+            job.deadline if job.deadline is not None else float("inf"),
+            job.job_id,
+        ))
+
+    def _worker(self) -> None:
+        while True:
+            with self._cond:
+                while True:
+                    if self._closed and not self._queue:
+                        return
+                    now = time.monotonic()
+                    job = self._pick(now)
+                    if job is not None:
+                        break
+                    # Woken by submissions and finished jobs; the timeout re-evaluates aging
+                    self._cond.wait(timeout=1.0)
+                self._queue.remove(job)
+
+                if self.drop_expired and job.deadline is not None and now > job.deadline:
+                    self.stats[job.priority].expired += 1
+                    job.future.set_exception(DeadlineExceeded(
+                        f"Job {job.job_id} expired after {now - job.submitted:.1f}s in the queue"))
+                    continue
+                job.started = now
+                self._running[job.job_id] = job
+
+            if not job.future.set_running_or_notify_cancel():
+                with self._cond:
+                    del self._running[job.job_id]
+                    self._cond.notify_all()
+                continue
+
+            try:
+                with priority_context(job.priority):
+                    result = job.fn(*job.args, **job.kwargs)
+                job.future.set_result(result)
+            except BaseException as e:
+                self.stats[job.priority].failed += 1
+                job.future.set_exception(e)
+            finally:
+                job.finished = time.monotonic()
+                with self._cond:
+                    del self._running[job.job_id]
+                    self._served[job.study_id] += job.finished - job.started
+                    stats = self.stats[job.priority]
+                    stats.waits.append(job.started - job.submitted)
+                    stats.latencies.append(job.finished - job.submitted)
+                    if job.deadline is not None and job.finished > job.deadline:
+                        stats.missed_deadline += 1
+                    self._cond.notify_all()
+
+    def queued(self) -> Dict[str, int]:
+        with self._cond:
+            counts = defaultdict(int)
+            for job in self._queue:
+                counts[CLASS_NAMES[job.priority]] += 1
+            return dict(counts)
+
+    def report(self) -> str:
+        lines = [f"{'class':<12} {'done':>6} {'p50 s':>8} {'p95 s':>8} {'p95 wait':>9} "
+                 f"{'failed':>7} {'expired':>8} {'late':>6}"]
+        with self._cond:
+            for level, stats in self.stats.items():
+                p50, p95 = _percentile(stats.latencies, 50), _percentile(stats.latencies, 95)
+                wait = _percentile(stats.waits, 95)
+                fmt = lambda v: f"{v:.2f}" if v is not None else "-"
+                lines.append(f"{CLASS_NAMES[level]:<12} {len(stats.latencies):>6} {fmt(p50):>8} {fmt(p95):>8} "
+                             f"{fmt(wait):>9} {stats.failed:>7} {stats.expired:>8} {stats.missed_deadline:>6}")
+            served = ", ".join(f"{study}={seconds:.1f}s" for study, seconds in sorted(self._served.items()))
+        lines.append(f"Worker time by study: {served or '-'}")
+        return "\n".join(lines)
+
+    def shutdown(self, wait: bool = True, cancel_queued: bool = False) -> None:
+        with self._cond:
+            self._closed = True
+            if cancel_queued:
+                for job in self._queue:
+                    job.future.cancel()
+                self._queue.clear()
+            self._cond.notify_all()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+
+_job_scheduler: Optional[JobScheduler] = None
+_job_scheduler_lock = threading.Lock()
+
+
+def get_job_scheduler() -> JobScheduler:
+    """Process-wide job scheduler (size from JOB_WORKERS / JOB_BATCH_WORKERS)."""
+    global _job_scheduler
+    with _job_scheduler_lock:
+        if _job_scheduler is None:
+            workers = int(os.getenv("JOB_WORKERS", DEFAULT_WORKERS))
+            batch_workers = os.getenv("JOB_BATCH_WORKERS")
+            _job_scheduler = JobScheduler(workers, int(batch_workers) if batch_workers else None)
+        return _job_scheduler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulate interactive questions arriving during a batch sweep.")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument("--batch-workers", type=int, default=None)
+    parser.add_argument("--batch-jobs", type=int, default=60, help="Sweep questions queued up front")
+    parser.add_argument("--interactive", type=int, default=15, help="Interactive questions arriving during the sweep")
+    parser.add_argument("--job-seconds", type=float, default=0.5, help="Mean simulated pipeline time")
+    parser.add_argument("--no-priority", action="store_true", help="Treat every job alike, for comparison")
+    args = parser.parse_args()
+
+    scheduler = JobScheduler(args.workers, args.workers if args.no_priority else args.batch_workers)
+    work = lambda: time.sleep(random.uniform(0.5, 1.5) * args.job_seconds)
+    batch = [scheduler.submit(work, priority="normal" if args.no_priority else "batch",
+                              study_id=random.choice(["study_a", "study_b"]))
+             for _ in range(args.batch_jobs)]
+    interactive = []
+    for _ in range(args.interactive):
+        time.sleep(random.expovariate(1.0 / args.job_seconds))
+        interactive.append(scheduler.submit(work, priority="normal" if args.no_priority else "interactive",
+                                            study_id="analyst", deadline=10 * args.job_seconds))
+    for future in batch + interactive:
+        try:
+            future.result()
+        except DeadlineExceeded:
+            pass
+    scheduler.shutdown()
+    print(scheduler.report())
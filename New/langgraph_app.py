@@ -6,50 +6,240 @@ from prompt_builder_node import prompt_builder_node
 from insight_gpt_node import insight_gpt_node
 from save_to_doc_node import save_to_doc_node
 from output_node import output_node
-from typing import TypedDict, List, Dict, Any
+from study_registry import get_registry, workbook_version
+from request_coalescing import SingleFlight, normalize_question_key
+from semantic_cache import get_semantic_cache
+from checkpointing import NodeOutputCache, open_checkpointer, first_failed_stage
+from block_fingerprints import block_fingerprint, current_fingerprints
+from chunk_store import get_chunk_store
+from job_scheduler import priority_context
+from typing import TypedDict, List, Dict, Any, Optional
+import os
+import threading
+import time
+import uuid
 import pandas as pd
 
 # Define the keys we'll pass between nodes
 class WorkflowState(TypedDict):
     question: str
+    study_id: str
+    filters: Dict[str, Any]
+    candidate_budget: int
     question_id: str
     question_text: str
+    question_candidates: List[Dict[str, Any]]
     table_dict: Dict[str, Any]
     table_shape: tuple
+    direct_answer: Optional[str]
     prompt: str
+    num_insights: int
+    num_recommendations: int
+    structured_output: bool
     insights: str
+    output_sink: str
     doc_url: str
+    error: str
 
-# Create the graph
-rag_graph = StateGraph(WorkflowState)
-
-# Add nodes (functions)
-rag_graph.add_node("query_pdf", query_pdf_question_node)
-rag_graph.add_node("extract_table", table_extractor_node)
-rag_graph.add_node("build_prompt", prompt_builder_node)
-rag_graph.add_node("generate_insights", insight_gpt_node)
-rag_graph.add_node("save_to_doc", save_to_doc_node)
-rag_graph.add_node("output", output_node)
-
-# Define edges between nodes (order of execution)
-rag_graph.set_entry_point("query_pdf")
-rag_graph.add_edge("query_pdf", "extract_table")
-rag_graph.add_edge("extract_table", "build_prompt")
-rag_graph.add_edge("build_prompt", "generate_insights")
-rag_graph.add_edge("generate_insights", "save_to_doc")
-rag_graph.add_edge("save_to_doc", "output")
-rag_graph.set_finish_point("output")
+# Node execution order
+STAGES = ["query_pdf", "extract_table", "build_prompt", "generate_insights", "save_to_doc", "output"]
+
+QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", 24 * 3600))  # Seconds a cached retrieval result is reused
+
+def question_index_version(study_id: Optional[str]) -> List[Any]:
+    """
+    Version of the study's questionnaire index: its namespace's chunk-store version (changes
+    when the questionnaire is re-embedded here) plus a TTL bucket, for indexes changed elsewhere.
+    """
+    namespace = get_registry().get(study_id).namespace
+    bucket = int(time.time() // QUERY_CACHE_TTL) if QUERY_CACHE_TTL > 0 else 0
+    return [namespace, get_chunk_store().namespace_version(namespace), bucket]
+
+# Inputs that determine each expensive node's output, for reuse across runs
+NODE_CACHE_KEYS = {
+    "query_pdf": lambda s: [s.get("question"), s.get("study_id"), s.get("filters"), s.get("candidate_budget"),
+                            question_index_version(s.get("study_id"))],
+    # Keyed by the question's block fingerprint, so a new data cut only invalidates changed blocks
+    "extract_table": lambda s: [s.get("question_id"), s.get("question"), s.get("study_id"),
+                                block_fingerprint(s.get("study_id"), s.get("question_id"))],
+    "generate_insights": lambda s: [s.get("question_id"), s.get("prompt"), s.get("num_insights"),
+                                    s.get("num_recommendations"), s.get("structured_output"), s.get("direct_answer")],
+}
+
+def build_graph(node_cache: Optional[NodeOutputCache] = None) -> StateGraph:
+    """Build the pipeline graph, optionally reusing cached outputs of the expensive nodes."""
+    def node(name, fn):
+        if node_cache is not None and name in NODE_CACHE_KEYS:
+            return node_cache.wrap(name, fn, NODE_CACHE_KEYS[name])
+        return fn
+
+    # Create the graph
+    graph = StateGraph(WorkflowState)
+
+    # Add nodes (functions)
+    graph.add_node("query_pdf", node("query_pdf", query_pdf_question_node))
+    graph.add_node("extract_table", node("extract_table", table_extractor_node))
+    graph.add_node("build_prompt", node("build_prompt", prompt_builder_node))
+    graph.add_node("generate_insights", node("generate_insights", insight_gpt_node))
+    graph.add_node("save_to_doc", node("save_to_doc", save_to_doc_node))
+    graph.add_node("output", node("output", output_node))
+
+    # Define edges between nodes (order of execution)
+    graph.set_entry_point(STAGES[0])
+    for current, following in zip(STAGES, STAGES[1:]):
+        graph.add_edge(current, following)
+    graph.set_finish_point(STAGES[-1])
+    return graph
+
+rag_graph = build_graph()
 
 # Compile into a runnable app
 app = rag_graph.compile()
 
+_checkpointed_app = None
+_checkpointed_lock = threading.Lock()
+
+def get_checkpointed_app():
+    """The graph compiled with the SQLite checkpointer and cross-run node output cache."""
+    global _checkpointed_app
+    with _checkpointed_lock:
+        if _checkpointed_app is None:
+            _checkpointed_app = build_graph(NodeOutputCache()).compile(checkpointer=open_checkpointer())
+        return _checkpointed_app
+
+def run_config(run_id: str) -> Dict[str, Any]:
+    return {"configurable": {"thread_id": run_id}}
+
+def resume_run(run_id: str) -> Dict[str, Any]:
+    """
+    Continue a failed or interrupted run from its last completed node.
+
+    A run that stopped on an exception continues from the node that raised. A run that
+    finished with a failed stage (e.g. save_to_doc without a doc URL) is re-run from the
+    checkpoint taken just before that stage, so earlier nodes are not repeated.
+    """
+    checkpointed = get_checkpointed_app()
+    config = run_config(run_id)
+    snapshot = checkpointed.get_state(config)
+    if not snapshot.values:
+        raise ValueError(f"No checkpoints found for run '{run_id}'")
+
+    if snapshot.next:
+        print(f"\nResuming run {run_id} at node: {snapshot.next[0]}")
+        start = time.perf_counter()
+        final_state = {**checkpointed.invoke(None, config), "run_id": run_id}
+        remember_answer(final_state, time.perf_counter() - start)
+        return final_state
+
+    failed_stage = first_failed_stage(snapshot.values, STAGES)
+    if failed_stage is None:
+        print(f"\nRun {run_id} already completed successfully")
+        return {**snapshot.values, "run_id": run_id}
+
+    # Find the checkpoint saved right before the failed stage ran and continue from there
+    for past in checkpointed.get_state_history(config):
+        if past.next == (failed_stage,):
+            print(f"\nRe-running run {run_id} from node: {failed_stage}")
+            start = time.perf_counter()
+            final_state = {**checkpointed.invoke(None, past.config), "run_id": run_id}
+            remember_answer(final_state, time.perf_counter() - start)
+            return final_state
+
+    raise ValueError(f"No checkpoint before stage '{failed_stage}' for run '{run_id}'")
+
+# Concurrent identical questions share one pipeline run
+pipeline_flights = SingleFlight()
+
+def run_pipeline(question: str, study_id: str = None, run_id: str = None,
+                 speculative: Optional[bool] = None) -> Dict[str, Any]:
+    """
+    Run the graph for a question, coalescing concurrent identical requests per study.
+
+    With speculative (default: SPECULATIVE_GENERATION env), near-tied QID matches are
+    generated in parallel and the best one that succeeds is returned (see speculative.py).
+    """
+    routed_study, routed_question = get_registry().route(question)
+    study_id = study_id or routed_study
+
+    key = normalize_question_key(routed_question, study_id)
+    final_state, shared = pipeline_flights.do(key, answer_question, routed_question, study_id, run_id, speculative)
+    if shared:
+        print(f"\nReused in-flight pipeline run for: {routed_question}")
+
+    # Each caller gets its own copy of the shared state
+    return dict(final_state)
+
+def answer_question(question: str, study_id: str, run_id: str = None,
+                    speculative: Optional[bool] = None) -> Dict[str, Any]:
+    """Answer from the semantic cache when a near-duplicate was already answered, else run the graph."""
+    try:
+        # A refreshed workbook carries cached answers for unchanged blocks over to its new version
+        current_fingerprints(study_id)
+    except Exception as e:
+        # Migration only saves recomputation; skip it rather than fail the question
+        print(f"Skipping cache migration for study '{study_id}': {e}")
+    cache = None
+    try:
+        # A missing or moved workbook is reported by the table node, not raised from here
+        version = workbook_version(get_registry().get(study_id).workbook)
+        cache = get_semantic_cache()
+        cached = cache.lookup(question, study_id, version)
+        if cached:
+            print(f"\nSemantic cache hit (similarity {cached['similarity']:.3f}): {cached['similar_question']}")
+            print(cache.report())
+            return {"question": question, "study_id": study_id, "cache_hit": True, **cached}
+    except Exception as e:
+        # The cache is an optimization; never fail a question because of it
+        print(f"Semantic cache unavailable: {e}")
+
+    if speculative is None:
+        speculative = os.getenv("SPECULATIVE_GENERATION", "").lower() in ("1", "true")
+
+    start = time.perf_counter()
+    if speculative:
+        # Parallel candidates aren't checkpointed; there is no single run to resume
+        from speculative import answer_speculatively
+        final_state = answer_speculatively(question, study_id)
+    else:
+        # Checkpointed under the run ID so a failed run can be resumed with resume_run()
+        run_id = run_id or uuid.uuid4().hex
+        print(f"\nRun ID: {run_id}")
+        final_state = get_checkpointed_app().invoke({"question": question, "study_id": study_id}, run_config(run_id))
+        final_state = {**final_state, "run_id": run_id}
+    elapsed = time.perf_counter() - start
+
+    if cache is not None:
+        remember_answer(final_state, elapsed, cache, version)
+
+    return final_state
+
+def remember_answer(final_state: Dict[str, Any], elapsed: float, cache=None, version: Optional[str] = None) -> None:
+    """Store a successfully answered run in the semantic cache (failures and errors are skipped)."""
+    answered = final_state.get("doc_url") and final_state.get("question_id", "unknown") != "unknown"
+    if not answered:
+        return
+    study_id = final_state.get("study_id")
+    try:
+        cache = cache or get_semantic_cache()
+        version = version or workbook_version(get_registry().get(study_id).workbook)
+        cache.store(final_state["question"], study_id, version, final_state, elapsed)
+    except Exception as e:
+        print(f"Failed to store answer in semantic cache: {e}")
+
 # Test the full pipeline
 if __name__ == "__main__":
-    # Get user question via input node
-    initial_state = input_node()
+    import sys
+
+    if len(sys.argv) > 2 and sys.argv[1] == "--resume":
+        # Resume a failed run: python langgraph_app.py --resume <run_id>
+        final_state = resume_run(sys.argv[2])
+    else:
+        # Get user question via input node
+        initial_state = input_node()
 
-    # Run the LangGraph pipeline
-    final_state = app.invoke(initial_state)
+        # Run the LangGraph pipeline (an analyst is waiting, so its OpenAI calls go first)
+        with priority_context("interactive"):
+            final_state = run_pipeline(initial_state["question"])
 
     print("\nFull pipeline completed!")
     print("Final Output State:")
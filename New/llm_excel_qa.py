@@ -1,7 +1,10 @@
+import re
 import pandas as pd
 from tabulate import tabulate
 from openai import OpenAI
 from utils import load_keys
+from openai_scheduler import get_scheduler
+from workbook_sql import WorkbookSQL, get_query_engine
 
 def load_col_sheet(filepath: str, sheet_name: str = "col%") -> pd.DataFrame:
     xls = pd.ExcelFile(filepath)
@@ -30,29 +33,87 @@ Q: {question}
 A:"""
     return prompt
 
-def ask_question_to_llm(prompt: str):
+def ask_question_to_llm(prompt: str, temperature: float = 0.3):
     keys = load_keys()
     client = OpenAI(api_key=keys["OPENAI_API_KEY"])
 
-    response = client.chat.completions.create(
+    response = get_scheduler().chat(
+        client,
         model="gpt-4",
         messages=[
             {"role": "system", "content": "You are a helpful market research data analyst."},
             {"role": "user", "content": prompt}
         ],
-        temperature=0.3
+        temperature=temperature
     )
 
     return response.choices[0].message.content
 
+def prepare_sql_prompt(question: str, engine: WorkbookSQL, previous_error: str = None) -> str:
+    retry_note = f"\nYour previous query failed with: {previous_error}\nWrite a corrected query.\n" if previous_error else ""
+    return f"""
+You are a data analyst with read-only SQLite access to a market research survey workbook
+about OTT platform awareness, trust, and usage. Every question table of the workbook is loaded:
+
+{engine.describe()}
+
+Find question IDs by searching questions.question_text (e.g. with LIKE) when the user doesn't give one.
+Write ONE SQLite SELECT query that returns the few rows needed to answer the question below.
+Return only the SQL, with no explanation.
+{retry_note}
+Q: {question}
+SQL:"""
+
+def extract_sql(text: str) -> str:
+    """Pull the SQL statement out of an LLM reply (handles ```sql fences)."""
+    fenced = re.search(r"```(?:sql)?\s*(.*?)```", text, re.DOTALL | re.IGNORECASE)
+    return (fenced.group(1) if fenced else text).strip()
+
+def prepare_answer_prompt(question: str, sql: str, result_df: pd.DataFrame) -> str:
+    formatted_result = tabulate(result_df, headers="keys", tablefmt="pipe", showindex=False) if not result_df.empty else "(no rows)"
+    return f"""
+You are a data analyst answering a question about a market research survey workbook.
+
+This query was run against the full workbook:
+{sql}
+
+Result:
+{formatted_result}
+
+Now answer this question clearly, using only the result above:
+
+Q: {question}
+A:"""
+
+def answer_with_query_engine(question: str, filepath: str, max_attempts: int = 2) -> str:
+    """
+    Answer a question over the whole workbook: the LLM writes a small SQL query, the query
+    runs locally, and only its compact result goes back to the LLM.
+    """
+    engine = get_query_engine(filepath)
+
+    error = None
+    for attempt in range(max_attempts):
+        sql = extract_sql(ask_question_to_llm(prepare_sql_prompt(question, engine, error), temperature=0))
+        print(f"\nGenerated SQL (attempt {attempt + 1}):\n{sql}")
+        try:
+            result_df = engine.run_query(sql)
+            break
+        except Exception as e:
+            error = str(e)
+            print(f"Query failed: {error}")
+    else:
+        raise RuntimeError(f"Could not build a working query for: {question} ({error})")
+
+    print(f"Query returned {len(result_df)} rows")
+    return ask_question_to_llm(prepare_answer_prompt(question, sql, result_df))
+
 # Entry point
 if __name__ == "__main__":
     excel_path = r"Data\raw data\Tables.xlsx"
     question = "Which OTT app has the highest awareness?"
 
-    df = load_col_sheet(excel_path)
-    prompt = prepare_prompt(question, df)
-    answer = ask_question_to_llm(prompt)
+    answer = answer_with_query_engine(question, excel_path)
 
     print("\n🔍 GPT's Answer:")
     print(answer)
@@ -0,0 +1,375 @@
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import os
+import random
+import sys
+import re
+import tempfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+import insight_gpt_node
+import openai_scheduler
+import pdf_embedder
+import save_to_doc_node
+import study_registry
+from aggregate_cube import build_cube
+from benchmark_table_scan import APPS, build_workbook
+from langgraph_app import app
+from report_sinks import ReportSink
+from study_registry import StudyConfig, StudyRegistry
+
+LOAD_TEST_STUDY = "loadtest"
+EMBEDDING_DIM = 256
+QUESTION_TEMPLATES = [
+    "Which OTT apps have you used in the last month?",
+    "How often do you watch {app} in a typical week?",
+    "How satisfied are you with the content on {app}?",
+    "Which app would you recommend to a friend?",
+    "Which device do you mostly use to stream {app}?",
+]
+
+
+@dataclass
+class ServiceProfile:
+    """Behaviour of one fake backend."""
+    latency_ms: float = 100.0
+    jitter_ms: float = 30.0
+    error_rate: float = 0.0  # Share of calls failing with a 500
+    rate_limit_rpm: Optional[int] = None  # Calls over this rate get a 429 with Retry-After
+
+
+class FakeAPIError(Exception):
+    def __init__(self, status_code: int, retry_after: Optional[float] = None):
+        super().__init__(f"Fake backend returned {status_code}")
+        self.status_code = status_code
+        # Same shape the scheduler reads Retry-After from on real OpenAI errors
+        self.response = SimpleNamespace(headers={"retry-after": str(retry_after)} if retry_after else {})
+
+
+class FakeService:
+    def __init__(self, name: str, profile: ServiceProfile, seed: int = 0):
+        """Inject latency, errors and rate limiting in front of a fake backend call."""
+        self.name = name
+        self.profile = profile
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._recent = deque()  # Call times inside the last minute
+        self.in_flight = 0
+        self.stats = {"calls": 0, "errors": 0, "rate_limited": 0, "max_in_flight": 0}
+
+    def enter(self) -> None:
+        with self._lock:
+            self.stats["calls"] += 1
+            now = time.monotonic()
+            if self.profile.rate_limit_rpm:
+                while self._recent and now - self._recent[0] > 60:
+                    self._recent.popleft()
+                if len(self._recent) >= self.profile.rate_limit_rpm:
+                    self.stats["rate_limited"] += 1
+                    raise FakeAPIError(429, retry_after=60 - (now - self._recent[0]))
+                self._recent.append(now)
+            fail = self._random.random() < self.profile.error_rate
+            delay = max(0.0, self._random.gauss(self.profile.latency_ms, self.profile.jitter_ms)) / 1000
+            self.in_flight += 1
+            self.stats["max_in_flight"] = max(self.stats["max_in_flight"], self.in_flight)
+
+        try:
+            time.sleep(delay)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+        if fail:
+            with self._lock:
+                self.stats["errors"] += 1
+            raise FakeAPIError(500)
+
+
+def fake_embedding(text: str) -> List[float]:
+    """Deterministic bag-of-words hashing embedding, so similar texts score as similar."""
+    vector = np.zeros(EMBEDDING_DIM)
+    for word in re.findall(r'\w+', str(text).lower()):
+        vector[int(hashlib.md5(word.encode()).hexdigest(), 16) % EMBEDDING_DIM] += 1.0
+    norm = np.linalg.norm(vector)
+    return (vector / norm if norm else vector).tolist()
+
+
+class FakeOpenAI:
+    def __init__(self, chat: FakeService, embeddings: FakeService):
+        """Stand-in for the OpenAI client (chat completions and embeddings)."""
+        self.chat_service = chat
+        self.embeddings_service = embeddings
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._chat))
+        self.embeddings = SimpleNamespace(create=self._embed)
+
+    def __call__(self, api_key: Optional[str] = None):
+        # Patched in place of the OpenAI class, so "constructing" a client returns this fake
+        return self
+
+    def _chat(self, model: str, messages: List[Dict[str, str]], max_tokens: Optional[int] = None,
+              response_format: Optional[Dict[str, Any]] = None, **kwargs):
+        self.chat_service.enter()
+        if response_format:
+            content = json.dumps({"insights": [f"Synthetic insight {i + 1}." for i in range(3)],
+                                  "recommendations": [f"Synthetic recommendation {i + 1}." for i in range(2)]})
+        else:
+            content = "\n".join(f"{i + 1}. Synthetic point {i + 1}." for i in range(5))
+        prompt_tokens = sum(len(str(m.get("content", "")).split()) for m in messages)
+        completion_tokens = min(max_tokens or 200, 200)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+            usage=SimpleNamespace(total_tokens=prompt_tokens + completion_tokens)
+        )
+
+    def _embed(self, model: str, input: Any, **kwargs):
+        self.embeddings_service.enter()
+        texts = input if isinstance(input, list) else [input]
+        return SimpleNamespace(
+            data=[SimpleNamespace(index=i, embedding=fake_embedding(t)) for i, t in enumerate(texts)],
+            usage=SimpleNamespace(total_tokens=sum(len(str(t).split()) for t in texts))
+        )
+
+
+class FakePinecone:
+    def __init__(self, service: FakeService, questions: Dict[str, str]):
+        """Stand-in for the Pinecone client over an in-memory index of synthetic question chunks."""
+        self.service = service
+        self.ids = list(questions)
+        self.texts = [f"{qid} {text}" for qid, text in questions.items()]
+        self.vectors = np.array([fake_embedding(t) for t in self.texts])
+
+    def __call__(self, api_key: Optional[str] = None):
+        return self
+
+    def Index(self, name: Optional[str] = None, **kwargs):
+        return self
+
+    def query(self, vector: List[float], top_k: int = 3, include_metadata: bool = True,
+              namespace: str = "", filter: Optional[Dict[str, Any]] = None, **kwargs):
+        self.service.enter()
+        scores = self.vectors @ np.asarray(vector)
+        order = np.argsort(-scores)[:top_k]
+        return {"matches": [{
+            "id": f"{LOAD_TEST_STUDY}-chunk-{i}",
+            "score": float(scores[i]),
+            "metadata": {"qid": self.ids[i], "text": self.texts[i], "clean_text": self.texts[i]}
+        } for i in order]}
+
+
+class FakeDocsSink(ReportSink):
+    name = "fake-gdocs"
+
+    def __init__(self, service: FakeService):
+        """Stand-in for the Google Docs sink."""
+        self.service = service
+
+    def write(self, question_id: str, question_text: str, insights: str) -> str:
+        self.service.enter()
+        return f"https://docs.example.invalid/{question_id}/{random.getrandbits(32):08x}"
+
+
+def synthetic_questions(question_ids: List[str], seed: int = 0) -> Dict[str, str]:
+    rng = random.Random(seed)
+    return {qid: rng.choice(QUESTION_TEMPLATES).format(app=rng.choice(APPS)) for qid in question_ids}
+
+
+@contextlib.contextmanager
+def fake_backends(profiles: Dict[str, ServiceProfile], scheduler_limits: Optional[Dict[str, tuple]] = None,
+                  question_count: int = 50, seed: int = 0):
+    """
+    Patch the pipeline's OpenAI, Pinecone and Google Docs entry points with latency-injecting fakes.
+
+    Yields (services, questions): the FakeService per backend and the synthetic {qid: question text}.
+    """
+    services = {name: FakeService(name, profiles.get(name, ServiceProfile()), seed + i)
+                for i, name in enumerate(("chat", "embeddings", "pinecone", "docs"))}
+
+    with tempfile.TemporaryDirectory() as workdir:
+        workbook = os.path.join(workdir, "loadtest.xlsx")
+        block_rows = 2 + len(APPS)
+        question_ids = build_workbook(workbook, question_count * block_rows)
+        questions = synthetic_questions(question_ids, seed)
+
+        openai_client = FakeOpenAI(services["chat"], services["embeddings"])
+        pinecone_client = FakePinecone(services["pinecone"], questions)
+        docs_sink = FakeDocsSink(services["docs"])
+        keys = {"OPENAI_API_KEY": "fake", "PINECONE_API_KEY": "fake", "PINECONE_ENV": "fake",
+                "PINECONE_INDEX": "loadtest"}
+        registry = StudyRegistry([StudyConfig(study_id=LOAD_TEST_STUDY, workbook=workbook,
+                                              namespace=LOAD_TEST_STUDY)], default_study_id=LOAD_TEST_STUDY)
+        scheduler = openai_scheduler.OpenAIScheduler(scheduler_limits, base_delay=0.5)
+
+        patches = [
+            (insight_gpt_node, "OpenAI", openai_client),
+            (insight_gpt_node, "load_keys", lambda: keys),
+            (pdf_embedder, "OpenAI", openai_client),
+            (pdf_embedder, "Pinecone", pinecone_client),
+            (pdf_embedder, "load_keys", lambda: keys),
+            (save_to_doc_node, "get_sink", lambda name=None, *args, **kwargs: docs_sink),
+            (study_registry, "_registry", registry),
+            (openai_scheduler, "_scheduler", scheduler),
+            # Character-based token estimates: tiktoken may need to download its encodings
+            (scheduler, "_encoding", lambda model: None),
+        ]
+        originals = [(module, attr, getattr(module, attr)) for module, attr, _ in patches]
+        for module, attr, fake in patches:
+            setattr(module, attr, fake)
+        # Keep the synthetic workbook's cube out of the real cube directory
+        original_cube_dir = os.environ.get("CUBE_DIR")
+        os.environ["CUBE_DIR"] = os.path.join(workdir, "cubes")
+        try:
+            build_cube(LOAD_TEST_STUDY)
+            yield services, questions
+        finally:
+            for module, attr, original in originals:
+                setattr(module, attr, original)
+            if original_cube_dir is None:
+                del os.environ["CUBE_DIR"]
+            else:
+                os.environ["CUBE_DIR"] = original_cube_dir
+
+
+def run_one(question: str) -> Dict[str, Any]:
+    """Drive the graph for one question, timing each node from its streamed update."""
+    timings = {}
+    state = {}
+    start = last = time.perf_counter()
+    error = None
+    try:
+        for update in app.stream({"question": question, "study_id": LOAD_TEST_STUDY}, stream_mode="updates"):
+            now = time.perf_counter()
+            for node, delta in update.items():
+                timings[node] = now - last
+                state.update(delta or {})
+            last = now
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+
+    ok = error is None and bool(state.get("doc_url")) and state.get("question_id", "unknown") != "unknown"
+    return {"latency": time.perf_counter() - start, "nodes": timings, "ok": ok,
+            "error": error or state.get("error")}
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {"p50": round(p50 * 1000, 1), "p95": round(p95 * 1000, 1), "p99": round(p99 * 1000, 1)}
+
+
+def run_load(requests: int, concurrency: int, questions: Dict[str, str], seed: int = 0,
+             quiet: bool = True) -> Dict[str, Any]:
+    """Send `requests` synthetic questions through the graph with `concurrency` in flight."""
+    rng = random.Random(seed)
+    texts = [rng.choice(list(questions.values())) for _ in range(requests)]
+
+    output = io.StringIO() if quiet else None
+    start = time.perf_counter()
+    # Node logging from many threads is noise at this volume
+    with (contextlib.redirect_stdout(output) if quiet else contextlib.nullcontext()):
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(run_one, texts))
+    elapsed = time.perf_counter() - start
+
+    node_names = list(dict.fromkeys(node for r in results for node in r["nodes"]))
+    succeeded = sum(1 for r in results if r["ok"])
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        # Throughput and latency of a level where nothing succeeded only measure failing fast
+        "valid": succeeded > 0,
+        "succeeded": succeeded,
+        "failed": sum(1 for r in results if not r["ok"]),
+        "elapsed_seconds": round(elapsed, 2),
+        "throughput_rps": round(requests / elapsed, 2) if elapsed > 0 else 0.0,
+        "latency_ms": percentiles([r["latency"] for r in results]),
+        "node_latency_ms": {node: percentiles([r["nodes"][node] for r in results if node in r["nodes"]])
+                            for node in node_names},
+        "errors": sorted({r["error"] for r in results if r["error"]})[:5]
+    }
+
+
+def find_saturation(levels: List[Dict[str, Any]], min_gain: float = 0.1) -> Optional[int]:
+    """First concurrency level after which more concurrency adds less than min_gain throughput."""
+    levels = [level for level in levels if level["valid"]]
+    for previous, current in zip(levels, levels[1:]):
+        if current["throughput_rps"] < previous["throughput_rps"] * (1 + min_gain):
+            return previous["concurrency"]
+    return None
+
+
+def print_level(result: Dict[str, Any], services: Dict[str, FakeService]) -> None:
+    latency = result["latency_ms"]
+    if not result["valid"]:
+        print(f"\nConcurrency {result['concurrency']}: INVALID, no request succeeded")
+    print(f"\nConcurrency {result['concurrency']}: {result['throughput_rps']} req/s, "
+          f"{result['succeeded']}/{result['requests']} ok, "
+          f"p50 {latency['p50']} ms, p95 {latency['p95']} ms, p99 {latency['p99']} ms")
+    print(f"  {'node':<20}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for node, stats in result["node_latency_ms"].items():
+        print(f"  {node:<20}{stats['p50']:>10}{stats['p95']:>10}{stats['p99']:>10}")
+    print("  backends: " + ", ".join(
+        f"{name} {s.stats['calls']} calls/{s.stats['errors']} errors/{s.stats['rate_limited']} 429s/"
+        f"max {s.stats['max_in_flight']} in flight" for name, s in services.items()))
+    for error in result["errors"]:
+        print(f"  error: {error}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load-test the LangGraph pipeline against local fake backends.")
+    parser.add_argument("--requests", type=int, default=50, help="Questions per concurrency level")
+    parser.add_argument("--concurrency", default="1,2,4,8,16", help="Comma-separated concurrency levels")
+    parser.add_argument("--chat-ms", type=float, default=800, help="Mean chat completion latency")
+    parser.add_argument("--embed-ms", type=float, default=80, help="Mean embedding latency")
+    parser.add_argument("--pinecone-ms", type=float, default=40, help="Mean Pinecone query latency")
+    parser.add_argument("--docs-ms", type=float, default=1500, help="Mean Google Docs write latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of backend calls failing with a 500")
+    parser.add_argument("--chat-rpm", type=int, default=None, help="Fake server-side chat rate limit")
+    parser.add_argument("--scheduler-chat-rpm", type=int, default=None, help="Client-side chat RPM budget")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true", help="Show node logging")
+    parser.add_argument("--report", default=None, help="Write results as JSON to this path")
+    args = parser.parse_args()
+
+    profiles = {
+        "chat": ServiceProfile(args.chat_ms, args.chat_ms * 0.3, args.error_rate, args.chat_rpm),
+        "embeddings": ServiceProfile(args.embed_ms, args.embed_ms * 0.3, args.error_rate),
+        "pinecone": ServiceProfile(args.pinecone_ms, args.pinecone_ms * 0.3, args.error_rate),
+        "docs": ServiceProfile(args.docs_ms, args.docs_ms * 0.3, args.error_rate),
+    }
+    limits = dict(openai_scheduler.DEFAULT_LIMITS)
+    if args.scheduler_chat_rpm:
+        limits["chat"] = (args.scheduler_chat_rpm, limits["chat"][1])
+
+    levels = []
+    with fake_backends(profiles, limits, seed=args.seed) as (services, questions):
+        for concurrency in [int(c) for c in args.concurrency.split(",")]:
+            for service in services.values():
+                service.stats = {key: 0 for key in service.stats}
+            result = run_load(args.requests, concurrency, questions, args.seed, quiet=not args.verbose)
+            result["backends"] = {name: dict(s.stats) for name, s in services.items()}
+            levels.append(result)
+            print_level(result, services)
+
+    saturation = find_saturation(levels)
+    print("\nSaturation: " + (f"throughput stops scaling beyond concurrency {saturation}"
+                              if saturation else "not reached at the tested concurrency levels"))
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump({"levels": levels, "saturation_concurrency": saturation}, f, indent=2)
+
+    invalid = [level["concurrency"] for level in levels if not level["valid"]]
+    if invalid:
+        print(f"\nNo request succeeded at concurrency {', '.join(map(str, invalid))}; results are not valid")
+        sys.exit(1)
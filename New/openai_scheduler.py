@@ -0,0 +1,233 @@
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import openai
+import tiktoken
+
+from job_scheduler import BATCH, current_priority
+
+# Fallback limits per call kind; override with OPENAI_CHAT_RPM, OPENAI_CHAT_TPM, OPENAI_EMBED_RPM, OPENAI_EMBED_TPM
+DEFAULT_LIMITS = {
+    "chat": (500, 30_000),
+    "embeddings": (3_000, 1_000_000),
+}
+DEFAULT_COMPLETION_TOKENS = 512  # Assumed completion size when max_tokens isn't given
+DEFAULT_BATCH_RESERVE = 0.2  # Share of each budget that batch calls leave free
+CHARS_PER_TOKEN = 4  # Rough size of a token, for estimates when no tiktoken encoding can be loaded
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+RETRYABLE_ERRORS = (openai.RateLimitError, openai.APITimeoutError,
+                    openai.APIConnectionError, openai.InternalServerError)
+
+
+class TokenBucket:
+    def __init__(self, per_minute: float):
+        """Bucket holding up to one minute of budget, refilled continuously."""
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = float(per_minute)
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` is available (0 if available now)."""
+        self._refill()
+        amount = min(amount, self.capacity)
+        return 0.0 if self.tokens >= amount else (amount - self.tokens) / self.rate
+
+    def take(self, amount: float) -> None:
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+    def adjust(self, amount: float) -> None:
+        """Give back (positive) or charge extra (negative) budget once the real cost is known."""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+    def drain(self) -> None:
+        """Empty the bucket, e.g. after the API reports we are over the limit."""
+        self._refill()
+        self.tokens = min(self.tokens, 0.0)
+
+
+class OpenAIScheduler:
+    def __init__(self,
+                 limits: Optional[Dict[str, Tuple[int, int]]] = None,
+                 max_retries: int = 6,
+                 base_delay: float = 1.0,
+                 max_delay: float = 60.0,
+                 batch_reserve: float = DEFAULT_BATCH_RESERVE):
+        """
+        Pace OpenAI calls under shared requests-per-minute and tokens-per-minute budgets.
+
+        Args:
+            limits: {"chat": (rpm, tpm), "embeddings": (rpm, tpm)}
+            max_retries: Retries for rate-limit and transient errors
+            base_delay: First backoff ceiling in seconds (doubles per attempt, fully jittered)
+            max_delay: Upper bound for a single backoff
+            batch_reserve: Share of the RPM/TPM budget that batch calls may not use
+
+        Waiting calls are released by priority class (see job_scheduler), then in arrival
+        order, so interactive questions never queue behind a sweep's backlog.
+        """
+        self.limits = limits or DEFAULT_LIMITS
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.batch_reserve = batch_reserve
+
+        self._buckets = {kind: (TokenBucket(rpm), TokenBucket(tpm)) for kind, (rpm, tpm) in self.limits.items()}
+        self._bucket_lock = threading.Lock()
+        # Waiting calls per kind as (priority, arrival) tickets; only the first may take budget
+        self._waiting: Dict[str, List[Tuple[int, int]]] = {kind: [] for kind in self.limits}
+        self._tickets = itertools.count()
+        self._waiting_changed = threading.Condition(self._bucket_lock)
+        self._encodings: Dict[str, Any] = {}
+
+        self.stats = {"calls": 0, "retries": 0, "rate_limited": 0, "waited_seconds": 0.0}
+
+    def _encoding(self, model: str):
+        """tiktoken encoding for a model, or None when it can't be loaded (e.g. offline, no BPE cache)."""
+        if model not in self._encodings:
+            try:
+                try:
+                    self._encodings[model] = tiktoken.encoding_for_model(model)
+                except KeyError:
+                    self._encodings[model] = tiktoken.get_encoding("cl100k_base")
+            except Exception as e:
+                print(f"No tiktoken encoding for {model} ({type(e).__name__}); estimating tokens from characters")
+                self._encodings[model] = None
+        return self._encodings[model]
+
+    def _count(self, enc, text: str) -> int:
+        if enc is None:
+            return -(-len(text) // CHARS_PER_TOKEN)
+        return len(enc.encode(text))
+
+    def estimate_tokens(self, model: str,
+                        messages: Optional[List[Dict[str, str]]] = None,
+                        input: Any = None,
+                        max_tokens: Optional[int] = None) -> int:
+        """Estimate the tokens a request will count against the TPM limit."""
+        enc = self._encoding(model)
+        if messages is not None:
+            # ~4 tokens of framing per message plus 3 to prime the reply
+            prompt_tokens = sum(self._count(enc, str(m.get("content") or "")) + 4 for m in messages) + 3
+            return prompt_tokens + (max_tokens or DEFAULT_COMPLETION_TOKENS)
+
+        texts = input if isinstance(input, list) else [input]
+        return sum(self._count(enc, str(t)) for t in texts)
+
+    def _acquire(self, kind: str, tokens: int) -> None:
+        """Block until both the request and token budgets allow this call."""
+        priority = current_priority()
+        ticket = (priority, next(self._tickets))
+        # Batch calls leave a reserve of the budget free for everything else
+        reserve = self.batch_reserve if priority == BATCH else 0.0
+        with self._waiting_changed:
+            heapq.heappush(self._waiting[kind], ticket)
+            try:
+                while True:
+                    wait = None
+                    if self._waiting[kind][0] == ticket:
+                        rpm, tpm = self._buckets[kind]
+                        wait = max(rpm.wait_time(1 + reserve * rpm.capacity),
+                                   tpm.wait_time(tokens + reserve * tpm.capacity))
+                        if wait <= 0:
+                            rpm.take(1)
+                            tpm.take(tokens)
+                            return
+                        self.stats["waited_seconds"] += wait
+                    # A higher-priority arrival wakes us and takes the head of the queue
+                    self._waiting_changed.wait(timeout=wait)
+            finally:
+                self._waiting[kind].remove(ticket)
+                heapq.heapify(self._waiting[kind])
+                self._waiting_changed.notify_all()
+
+    def _is_retryable(self, error: Exception) -> bool:
+        return isinstance(error, RETRYABLE_ERRORS) or getattr(error, "status_code", None) in RETRYABLE_STATUS
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        """Full-jitter exponential backoff, honouring a Retry-After header when present."""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+        response = getattr(error, "response", None)
+        retry_after = getattr(response, "headers", {}).get("retry-after") if response is not None else None
+        try:
+            delay = max(delay, float(retry_after))
+        except (TypeError, ValueError):
+            pass
+        return delay
+
+    def _call(self, kind: str, fn, estimated: int, **kwargs):
+        for attempt in range(self.max_retries + 1):
+            self._acquire(kind, estimated)
+            try:
+                response = fn(**kwargs)
+            except Exception as e:
+                if not self._is_retryable(e) or attempt == self.max_retries:
+                    raise
+                if getattr(e, "status_code", None) == 429 or isinstance(e, openai.RateLimitError):
+                    self.stats["rate_limited"] += 1
+                    with self._bucket_lock:
+                        self._buckets[kind][1].drain()
+                delay = self._backoff(attempt, e)
+                self.stats["retries"] += 1
+                print(f"OpenAI {kind} call failed ({type(e).__name__}), retrying in {delay:.1f}s...")
+                time.sleep(delay)
+                continue
+
+            self.stats["calls"] += 1
+            # Reconcile the estimate with the real usage so the bucket tracks actual spend
+            usage = getattr(response, "usage", None)
+            actual = getattr(usage, "total_tokens", None)
+            if isinstance(actual, int):
+                with self._bucket_lock:
+                    self._buckets[kind][1].adjust(estimated - actual)
+            return response
+
+    @staticmethod
+    def _no_client_retries(client):
+        """The client with its own retries off, so retries (and their waits) all go through _call."""
+        with_options = getattr(client, "with_options", None)
+        return with_options(max_retries=0) if with_options is not None else client
+
+    def chat(self, client, **kwargs):
+        """Scheduled client.chat.completions.create(**kwargs)."""
+        estimated = self.estimate_tokens(kwargs.get("model", "gpt-4"),
+                                         messages=kwargs.get("messages", []),
+                                         max_tokens=kwargs.get("max_tokens"))
+        return self._call("chat", self._no_client_retries(client).chat.completions.create, estimated, **kwargs)
+
+    def embed(self, client, **kwargs):
+        """Scheduled client.embeddings.create(**kwargs)."""
+        estimated = self.estimate_tokens(kwargs.get("model", "text-embedding-ada-002"), input=kwargs.get("input"))
+        return self._call("embeddings", self._no_client_retries(client).embeddings.create, estimated, **kwargs)
+
+
+_scheduler: Optional[OpenAIScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> OpenAIScheduler:
+    """Return the process-wide scheduler shared by every OpenAI call site."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            limits = {
+                "chat": (int(os.getenv("OPENAI_CHAT_RPM", DEFAULT_LIMITS["chat"][0])),
+                         int(os.getenv("OPENAI_CHAT_TPM", DEFAULT_LIMITS["chat"][1]))),
+                "embeddings": (int(os.getenv("OPENAI_EMBED_RPM", DEFAULT_LIMITS["embeddings"][0])),
+                               int(os.getenv("OPENAI_EMBED_TPM", DEFAULT_LIMITS["embeddings"][1]))),
+            }
+            batch_reserve = float(os.getenv("OPENAI_BATCH_RESERVE", DEFAULT_BATCH_RESERVE))
+            _scheduler = OpenAIScheduler(limits, batch_reserve=batch_reserve)
+        return _scheduler
@@ -3,7 +3,11 @@ import fitz  # PyMuPDF
 import tiktoken
 from openai import OpenAI
 from pinecone import Pinecone
-from utils import load_keys
+from utils import load_keys, pinecone_namespace
+from openai_scheduler import get_scheduler
+from chunk_store import get_chunk_store, normalize_match
+from retrieval_filters import RetrievalFilter, question_number
+import bisect
 import re
 from typing import Dict, List, Optional, Any, cast, Union
 
@@ -15,15 +19,63 @@ def clean_text(text: str) -> str:
     text = re.sub(r'\s+', ' ', text)
     return text.strip()
 
-def extract_text_from_pdf(filepath: str) -> str:
-    """Extract full text from a PDF file."""
+SECTION_PATTERN = re.compile(r'\bSECTION\s+([A-Z0-9]+)\b', re.IGNORECASE)
+
+def extract_pages_from_pdf(filepath: str) -> List[str]:
+    """Extract the text of each page of a PDF file."""
     doc = fitz.open(filepath)
-    text = ""
+    pages = []
     for page_num in range(len(doc)):
         # Use string casting for PyMuPDF compatibility
-        text += str(doc[page_num].get_textpage().extractText())
+        pages.append(str(doc[page_num].get_textpage().extractText()))
     doc.close()
-    return text
+    return pages
+
+def extract_text_from_pdf(filepath: str) -> str:
+    """Extract full text from a PDF file."""
+    return "".join(extract_pages_from_pdf(filepath))
+
+def extract_pages_from_docx(filepath: str) -> List[str]:
+    """Extract the text of a DOCX file, split at explicit page breaks (table rows stay on their page)."""
+    from docx import Document
+    from docx.oxml.ns import qn
+    from docx.table import Table
+    from docx.text.paragraph import Paragraph
+
+    document = Document(filepath)
+    pages = [[]]
+    # Paragraphs and tables in document order, so a table lands on the page it appears on
+    for element in document.element.body.iterchildren():
+        if element.tag == qn("w:tbl"):
+            for row in Table(element, document).rows:
+                pages[-1].append("\t".join(cell.text.strip() for cell in row.cells) + "\n")
+            continue
+        if element.tag != qn("w:p"):
+            continue
+        for run in Paragraph(element, document).runs:
+            if run.text:
+                pages[-1].append(run.text)
+            if any(br.get(qn("w:type")) == "page" for br in run._element.findall(qn("w:br"))):
+                pages.append([])
+        pages[-1].append("\n")
+
+    return ["".join(page) for page in pages if "".join(page).strip()]
+
+def extract_text_from_docx(filepath: str) -> str:
+    """Extract full text from a DOCX file."""
+    return "".join(extract_pages_from_docx(filepath))
+
+def extract_pages(filepath: str) -> List[str]:
+    """Extract page texts with the extractor for the file's format."""
+    extension = os.path.splitext(filepath)[1].lower()
+    if extension not in PAGE_EXTRACTORS:
+        raise ValueError(f"Unsupported questionnaire format '{extension}' ({filepath})")
+    return PAGE_EXTRACTORS[extension](filepath)
+
+PAGE_EXTRACTORS = {
+    ".pdf": extract_pages_from_pdf,
+    ".docx": extract_pages_from_docx,
+}
 
 def chunk_text(text: str, max_tokens: int = 400, overlap: int = 100) -> list:
     """Split long text into overlapping chunks (~400 tokens with 100-token overlap)."""
@@ -37,6 +89,36 @@ def chunk_text(text: str, max_tokens: int = 400, overlap: int = 100) -> list:
 
     return chunks
 
+def chunk_pages(pages: List[str], max_tokens: int = 400, overlap: int = 100) -> List[Dict[str, Any]]:
+    """Chunk page texts like chunk_text, recording the (1-based) page range and section of each chunk."""
+    enc = tiktoken.get_encoding("cl100k_base")
+    tokens = []
+    page_starts = []  # Token offset where each page begins
+    for page in pages:
+        page_starts.append(len(tokens))
+        tokens.extend(enc.encode(page))
+
+    chunks = []
+    section = None
+    for i in range(0, len(tokens), max_tokens - overlap):
+        text = enc.decode(tokens[i:i + max_tokens])
+        last_token = min(i + max_tokens, len(tokens)) - 1
+
+        # A chunk belongs to the first section heading it contains, else the one in effect before it
+        headings = SECTION_PATTERN.findall(text)
+        chunk_section = headings[0].upper() if headings else section
+        if headings:
+            section = headings[-1].upper()
+
+        chunks.append({
+            "text": text,
+            "page_start": bisect.bisect_right(page_starts, i),
+            "page_end": bisect.bisect_right(page_starts, last_token),
+            "section": chunk_section
+        })
+
+    return chunks
+
 def extract_question_info(text: str) -> Dict[str, str]:
     """Extract question ID and clean text from chunk."""
     # Extract question ID
@@ -51,8 +133,17 @@ def extract_question_info(text: str) -> Dict[str, str]:
         "text": clean_content
     }
 
-def embed_and_store(chunks: List[str], namespace: str = "default") -> None:
-    """Embed text chunks and store in Pinecone."""
+EMBED_BATCH_SIZE = 100  # Chunks per embeddings request / upsert
+
+def embed_and_store(chunks: List[Union[str, Dict[str, Any]]], namespace: str = "default",
+                    study_id: Optional[str] = None, batch_size: int = EMBED_BATCH_SIZE) -> None:
+    """
+    Embed text chunks in batches and store in Pinecone.
+
+    Chunks are plain strings or dicts from chunk_pages (with page range and section),
+    which become filterable vector metadata. A dict may carry its own "chunk_id";
+    otherwise IDs are numbered within the namespace.
+    """
     keys = load_keys()
     index_name = keys.get("PINECONE_INDEX")
     if not index_name:
@@ -63,36 +154,57 @@ def embed_and_store(chunks: List[str], namespace: str = "default") -> None:
     
     index = pc.Index(name=cast(str, index_name))
 
+    records = []
     for i, chunk in enumerate(chunks):
-        # Create embedding
-        response = openai_client.embeddings.create(
+        chunk_info = chunk if isinstance(chunk, dict) else {"text": chunk}
+        chunk_id = chunk_info.get("chunk_id") or f"{namespace}-chunk-{i}"
+        records.append((chunk_id, chunk_info, extract_question_info(chunk_info["text"])))
+
+    for start in range(0, len(records), batch_size):
+        batch = records[start:start + batch_size]
+
+        # One embeddings request per batch
+        response = get_scheduler().embed(
+            openai_client,
             model="text-embedding-ada-002",
-            input=chunk
+            input=[chunk_info["text"] for _, chunk_info, _ in batch]
         )
-        vector = response.data[0].embedding
+        vectors = [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
 
-        # Extract question info
-        info = extract_question_info(chunk)
-        
-        # Store embedding with metadata
+        # Keep the text in the local side-store; the vector only carries its ID and QID
+        get_chunk_store().put_many([{
+            "chunk_id": chunk_id,
+            "namespace": namespace,
+            "qid": info["qid"],
+            "text": chunk_info["text"],
+            "clean_text": info["text"]
+        } for chunk_id, chunk_info, info in batch])
         index.upsert(vectors=[{
-            "id": f"{namespace}-chunk-{i}",
+            "id": chunk_id,
             "values": vector,
-            "metadata": {
-                "text": chunk,
-                "qid": info["qid"],
-                "clean_text": info["text"]
-            }
-        }])
+            "metadata": build_vector_metadata(info["qid"], chunk_info, study_id or namespace)
+        } for (chunk_id, chunk_info, info), vector in zip(batch, vectors)], namespace=pinecone_namespace(namespace))
 
-        print(f"Chunk {i+1} (qid: {info['qid']}) embedded and stored.")
+        print(f"Chunks {start + 1}-{start + len(batch)} of {len(records)} embedded and stored.")
+
+def build_vector_metadata(qid: str, chunk_info: Dict[str, Any], study_id: str) -> Dict[str, Any]:
+    """Small, filterable metadata for a vector (Pinecone rejects null values, so unknowns are omitted)."""
+    metadata = {"qid": qid, "study": study_id}
+    qnum = question_number(qid)
+    if qnum is not None:
+        metadata["qnum"] = qnum
+    for key in ("section", "page_start", "page_end"):
+        if chunk_info.get(key) is not None:
+            metadata[key] = chunk_info[key]
+    return metadata
 
 def embed_pdf_file(filepath: str, namespace: str = "default") -> None:
+    """Extract, chunk and embed one questionnaire (PDF or DOCX)."""
     print(f"Extracting text from: {filepath}")
-    text = extract_text_from_pdf(filepath)
-    print(f"Extracted {len(text)} characters")
+    pages = extract_pages(filepath)
+    print(f"Extracted {sum(len(p) for p in pages)} characters from {len(pages)} pages")
 
-    chunks = chunk_text(text)
+    chunks = chunk_pages(pages)
     print(f"Total chunks created: {len(chunks)}")
 
     embed_and_store(chunks, namespace=namespace)
@@ -117,8 +229,19 @@ def parse_pinecone_response(response: Any) -> Dict[str, Any]:
         "matches": matches
     }
 
-def query_pdf_question(question: str, top_k: int = 3) -> Dict[str, Any]:
-    """Search Pinecone for the most relevant question chunks."""
+def query_pdf_question(question: str, top_k: int = 3, namespace: str = "default",
+                       filters: Optional[RetrievalFilter] = None, local_filter: bool = False) -> Dict[str, Any]:
+    """
+    Search Pinecone for the most relevant question chunks.
+
+    Args:
+        question: User question
+        top_k: Candidate budget (number of matches returned)
+        namespace: Study questionnaire namespace
+        filters: Structured constraints (section, QID prefix, study, page range)
+        local_filter: Apply filters client-side instead of as a Pinecone metadata filter,
+            for indexes whose vectors predate the filter metadata
+    """
     keys = load_keys()
     index_name = keys.get("PINECONE_INDEX")
     if not index_name:
@@ -133,20 +256,32 @@ def query_pdf_question(question: str, top_k: int = 3) -> Dict[str, Any]:
     query_text = f"Survey question about: {question}"
     
     # Embed the query
-    embedding = openai_client.embeddings.create(
+    embedding = get_scheduler().embed(
+        openai_client,
         model="text-embedding-ada-002",
         input=query_text
     ).data[0].embedding
 
-    # Query Pinecone with higher top_k to ensure we get good matches
+    filters = filters or RetrievalFilter()
+    query_args = {}
+    if not filters.is_empty() and not local_filter:
+        query_args["filter"] = filters.to_pinecone()
+        print(f"Debug: Metadata filter {query_args['filter']}")
+
+    # A local pre-filter needs headroom to still return top_k matches after filtering
     response = index.query(
         vector=embedding,
-        top_k=top_k * 2,  # Get more results to filter
-        include_metadata=True
+        top_k=top_k * 4 if local_filter and not filters.is_empty() else top_k,
+        include_metadata=True,
+        namespace=pinecone_namespace(namespace),
+        **query_args
     )
     
     # Parse response into standard format
     result = parse_pinecone_response(response)
+    if local_filter and not filters.is_empty():
+        matches = [normalize_match(m) for m in result["matches"]]
+        result["matches"] = [m for m in matches if filters.matches(m["metadata"])][:top_k]
     
     print("\nDebug: Examining Pinecone query results")
     print(f"Debug: Found {len(result['matches'])} matches")
@@ -1,7 +1,27 @@
 from pdf_embedder import query_pdf_question
+from study_registry import get_registry
+from chunk_store import hydrate_matches, normalize_match
+from retrieval_filters import RetrievalFilter, filters_from_question
 from typing import Dict, Any, List, Tuple, Union, Optional
+import os
 import re
 
+CANDIDATE_BUDGET = int(os.getenv("RETRIEVAL_CANDIDATES", 10))  # Matches fetched from the vector search
+TEXT_CANDIDATES = 8  # Matches whose text is fetched from the side-store for relevance scoring
+QUESTION_CANDIDATES = 3  # Ranked QIDs kept in state for speculative generation
+
+def prerank_matches(matches: List[Any], keep: int = TEXT_CANDIDATES) -> List[Dict[str, Any]]:
+    """Rank matches by embedding score alone (no text needed) and keep the top few."""
+    normalized = [normalize_match(m) for m in matches]
+    normalized.sort(key=lambda m: float(m["score"] or 0), reverse=True)
+    return normalized[:keep]
+
+def build_filters(state: Dict[str, Any], question: str, study_filters: Dict[str, Any]) -> RetrievalFilter:
+    """Combine study defaults, QIDs named in the question and explicit state filters (most specific wins)."""
+    return (RetrievalFilter.from_dict(study_filters)
+            .merged(filters_from_question(question))
+            .merged(RetrievalFilter.from_dict(state.get("filters"))))
+
 def clean_text(text: str) -> str:
     """Clean and format survey text."""
     # Remove survey artifacts
@@ -38,11 +58,11 @@ def score_match(text: str, query: str) -> float:
     
     return relevance + usage + query_match
 
-def extract_best_question(matches: List[Dict[str, Any]], query: str) -> Tuple[str, str]:
-    """Extract best matching question based on relevance scoring."""
-    best_score = -1
-    best_qid = "unknown"
-    best_text = ""
+def rank_questions(matches: List[Dict[str, Any]], query: str) -> List[Dict[str, Any]]:
+    """Score every match and keep the best-scoring chunk per QID, best first."""
+    best: Dict[str, Dict[str, Any]] = {}
+    textless: Dict[str, float] = {}
+    relevances: List[float] = []
     
     for match in matches:
         metadata = match.get('metadata', {})
@@ -51,6 +71,10 @@ def extract_best_question(matches: List[Dict[str, Any]], query: str) -> Tuple[st
         # Get clean text from metadata
         text = metadata.get('clean_text', '') or metadata.get('text', '')
         if not text:
+            # Text missing from the side-store: keep the vector's own QID, scored after the loop
+            qid = metadata.get('qid', '')
+            if qid and qid != 'unknown':
+                textless[qid] = max(embedding_score, textless.get(qid, embedding_score))
             continue
             
         # Clean the text
@@ -64,13 +88,10 @@ def extract_best_question(matches: List[Dict[str, Any]], query: str) -> Tuple[st
             
         # Calculate relevance score
         relevance_score = score_match(clean_content, query)
+        relevances.append(relevance_score)
         
         # Combine scores
         final_score = 0.7 * embedding_score + 0.3 * relevance_score
-        
-        # Boost Q10.x and Q11.x questions (OTT related)
-        if qid.startswith('Q10') or qid.startswith('Q11'):
-            final_score *= 1.5
             
         print(f"\nDebug: {qid}")
         print(f"Embedding score: {embedding_score:.3f}")
@@ -78,13 +99,28 @@ def extract_best_question(matches: List[Dict[str, Any]], query: str) -> Tuple[st
         print(f"Final score: {final_score:.3f}")
         print(f"Text: {clean_content[:100]}...")
         
-        if final_score > best_score:
-            best_score = final_score
-            best_qid = qid
-            best_text = clean_content
+        if qid not in best or final_score > best[qid]["score"]:
+            best[qid] = {"question_id": qid, "question_text": clean_content, "score": final_score}
+    
+    # Textless matches get the mean relevance of the scored ones, so both sit on the same scale;
+    # a QID seen with text keeps its scored entry, and ties rank the scored candidate first
+    neutral_relevance = sum(relevances) / len(relevances) if relevances else 0.0
+    for qid, embedding_score in textless.items():
+        best.setdefault(qid, {"question_id": qid, "question_text": qid,
+                              "score": 0.7 * embedding_score + 0.3 * neutral_relevance})
+
+    # Stable sort: among equal scores the earlier match wins, as before
+    return sorted(best.values(), key=lambda c: c["score"], reverse=True)
+
+def extract_best_question(matches: List[Dict[str, Any]], query: str) -> Tuple[str, str]:
+    """Extract best matching question based on relevance scoring."""
+    ranked = rank_questions(matches, query)
+    if not ranked:
+        print("\nBest match: unknown (score: -1.000)")
+        return "unknown", ""
     
-    print(f"\nBest match: {best_qid} (score: {best_score:.3f})")
-    return best_qid, best_text
+    print(f"\nBest match: {ranked[0]['question_id']} (score: {ranked[0]['score']:.3f})")
+    return ranked[0]["question_id"], ranked[0]["question_text"]
 
 def query_pdf_question_node(state: Dict[str, Any]) -> Dict[str, Any]:
     """LangGraph node to find relevant survey questions."""
@@ -97,11 +133,28 @@ def query_pdf_question_node(state: Dict[str, Any]) -> Dict[str, Any]:
             "question_text": "No question provided"
         }
 
-    print(f"\nSearching PDF for question: {user_question}")
+    # Route the question to its study (an explicit study_id in state wins)
+    registry = get_registry()
+    study_id, routed_question = registry.route(user_question)
+    study_id = state.get("study_id") or study_id
+    state = {**state, "study_id": study_id, "question": routed_question}
+    user_question = routed_question
+
+    print(f"\nSearching PDF for question: {user_question} (study: {study_id})")
 
     try:
-        # Get matches from PDF embeddings
-        result = query_pdf_question(user_question, top_k=40)
+        # Get matches from PDF embeddings, filtered inside the vector search
+        study = registry.get(study_id)
+        filters = build_filters(state, user_question, study.retrieval_filters)
+        budget = state.get("candidate_budget") or CANDIDATE_BUDGET
+        local_filter = os.getenv("RETRIEVAL_FILTER_MODE", "pinecone") == "local"
+        result = query_pdf_question(user_question, top_k=budget, namespace=study.namespace,
+                                    filters=filters, local_filter=local_filter)
+
+        if isinstance(result, dict) and not result.get('matches') and not filters.is_empty():
+            # Vectors embedded before filter metadata existed can't match a filter
+            print("No matches with filters, retrying without them")
+            result = query_pdf_question(user_question, top_k=budget, namespace=study.namespace)
         
         if not isinstance(result, dict) or 'matches' not in result:
             print("Invalid response from PDF query")
@@ -120,8 +173,14 @@ def query_pdf_question_node(state: Dict[str, Any]) -> Dict[str, Any]:
                 "question_text": "No matches found in survey"
             }
             
-        # Extract best matching question
-        question_id, question_text = extract_best_question(matches, user_question)
+        # Fetch chunk text only for the candidates that survive pre-ranking
+        candidates = hydrate_matches(prerank_matches(matches))
+
+        # Rank candidate questions; the runner-ups are kept for speculative generation
+        ranked = rank_questions(candidates, user_question)
+        question_id = ranked[0]["question_id"] if ranked else "unknown"
+        question_text = ranked[0]["question_text"] if ranked else ""
+        print(f"\nBest match: {question_id} (score: {ranked[0]['score'] if ranked else -1:.3f})")
         
         if question_id == "unknown":
             print("No relevant question found in survey")
@@ -137,7 +196,8 @@ def query_pdf_question_node(state: Dict[str, Any]) -> Dict[str, Any]:
         return {
             **state,
             "question_id": question_id,
-            "question_text": question_text
+            "question_text": question_text,
+            "question_candidates": ranked[:QUESTION_CANDIDATES]
         }
         
     except Exception as e:
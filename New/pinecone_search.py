@@ -1,9 +1,11 @@
 from pinecone import Pinecone
 from openai import OpenAI
-from utils import load_keys
+from utils import load_keys, pinecone_namespace
+from openai_scheduler import get_scheduler
+from chunk_store import hydrate_matches
 import os
 
-def query_pinecone(question_id: str, top_k: int = 3) -> list:
+def query_pinecone(question_id: str, top_k: int = 3, namespace: str = "default") -> list:
     """Search Pinecone for chunks relevant to the question ID."""
     keys = load_keys()
     openai_client = OpenAI(api_key=keys["OPENAI_API_KEY"])
@@ -12,7 +14,8 @@ def query_pinecone(question_id: str, top_k: int = 3) -> list:
 
     # Generate embedding for the search query (e.g., "Q10.1")
     print(f"Generating embedding for query: {question_id}")
-    query_response = openai_client.embeddings.create(
+    query_response = get_scheduler().embed(
+        openai_client,
         model="text-embedding-ada-002",
         input=question_id
     )
@@ -22,16 +25,18 @@ def query_pinecone(question_id: str, top_k: int = 3) -> list:
     search_result = index.query(
         vector=query_vector,
         top_k=top_k,
-        include_metadata=True
+        include_metadata=True,
+        namespace=pinecone_namespace(namespace)
     )
 
-    # Extract matching chunks
-    matches = search_result.matches
+    # Extract matching chunks (text comes from the local side-store)
+    matches = hydrate_matches(search_result.matches)
+    matches = [m for m in matches if m["metadata"].get("text")]
     print(f"Found {len(matches)} matching chunks:\n")
     for i, match in enumerate(matches):
-        print(f"Match {i+1} (score={match.score:.4f}):\n{match.metadata['text'][:500]}\n")
+        print(f"Match {i+1} (score={match['score']:.4f}):\n{match['metadata']['text'][:500]}\n")
 
-    return [match.metadata["text"] for match in matches]
+    return [match["metadata"]["text"] for match in matches]
 
 if __name__ == "__main__":
     question_id = "Q10.1"  # Replace with any question label
@@ -3,15 +3,16 @@ class PromptBuilder:
         self.brand_name = brand_name or "the brand"
         self.study_context = study_context or "a general market research study"
 
-    def build_insight_prompt(self, question_text: str, table_df: str, base_size: int = 1000, num_insights: int = 3, num_recommendations: int = 2) -> str:
+    def build_insight_prompt(self, question_text: str, table_df: str, base_size: int = None, num_insights: int = 3, num_recommendations: int = 2, significant_differences: str = None) -> str:
         """
         Build a basic prompt to send to GPT.
         Args:
             question_text: Actual question being analyzed
             table_df: Cleaned table in markdown format
-            base_size: Total number of respondents
+            base_size: Respondents who answered the question (omitted when unknown)
             num_insights: How many insights to ask for
             num_recommendations: How many action points to ask for
+            significant_differences: Pre-computed significant column differences (optional)
         Returns:
             Full prompt string
         """
@@ -24,13 +25,65 @@ Below is the question and the response data table:
 
 **Question:**
 {question_text}
-
-**Base size:** {base_size} respondents
-
+{self._base_section(base_size)}
 **Data Table:**
 {table_df}
-
+{self._significance_section(significant_differences)}
 Please generate {num_insights} clear, concise insights from this data.
 Then provide {num_recommendations} actionable recommendations based on the insights.
 """
         return prompt
+
+    def build_packed_insight_prompt(self, questions: list, base_size: int = None, num_insights: int = 3, num_recommendations: int = 2) -> str:
+        """
+        Build one prompt covering several questions, with the instruction block stated once.
+        Args:
+            questions: Dicts with question_id, question_text, table, significant_differences
+                and optionally base_size
+            base_size: Respondents, for questions without their own base_size
+            num_insights: How many insights to ask for per question
+            num_recommendations: How many action points to ask for per question
+        Returns:
+            Full prompt string
+        """
+        sections = "".join(
+            f"""
+### {q["question_id"]}
+
+**Question:**
+{q["question_text"]}
+{self._base_section(q.get("base_size") or base_size)}
+**Data Table:**
+{q["table"]}
+{self._significance_section(q.get("significant_differences"))}"""
+            for q in questions
+        )
+        question_ids = ", ".join(q["question_id"] for q in questions)
+        prompt = f"""
+You are an expert market research analyst.
+
+This data is from a survey about {self.brand_name}. The study focuses on {self.study_context}.
+
+Below are {len(questions)} questions ({question_ids}), each with its response data table.
+{sections}
+For EACH question separately, generate {num_insights} clear, concise insights from its data.
+Then provide {num_recommendations} actionable recommendations based on those insights.
+Label every answer with its question ID and do not mix data between questions.
+"""
+        return prompt
+
+    def _base_section(self, base_size: int = None) -> str:
+        if not base_size:
+            return ""
+        return f"""
+**Base size:** {base_size} respondents
+"""
+
+    def _significance_section(self, significant_differences: str = None) -> str:
+        if not significant_differences:
+            return ""
+        return f"""
+**Statistically significant differences (95% confidence):**
+{significant_differences}
+Base your insights on these differences rather than on raw percentage gaps.
+"""
@@ -1,7 +1,10 @@
-from tabulate import tabulate
+import os
 import pandas as pd
 import numpy as np
 from typing import Dict, Any
+from significance import find_significant_differences, format_significant_differences
+from structured_insights import STRUCTURED_MODEL
+from table_serializers import serialize_table, table_format_for
 
 def preprocess_table(df: pd.DataFrame) -> pd.DataFrame:
     """Preprocess and summarize large tables."""
@@ -29,15 +32,26 @@ def prompt_builder_node(state: Dict[str, Any]) -> Dict[str, Any]:
     """Build a prompt combining question text and table data."""
     question_id = state.get("question_id", "unknown")
     question_text = state.get("question_text", "")
+    # Same counts insight_gpt_node asks for and validates against
+    num_insights = state.get("num_insights", 3)
+    num_recommendations = state.get("num_recommendations", 2)
     
     # Convert table_dict back to DataFrame if available
     table_df = None
+    significant = []
+    base_size = None
     if "table_dict" in state:
         try:
             table_dict = state["table_dict"]
             table_df = pd.DataFrame(table_dict["data"], columns=table_dict["columns"])
+            base_size = table_dict.get("base_size")
             print(f"\nFull table shape: {table_df.shape}")
             
+            # Test all banner columns locally so only significant differences reach the prompt
+            significant = find_significant_differences(table_df, bases=table_dict.get("bases"),
+                                                      dimensions=table_dict.get("dimensions"))
+            print(f"Significant differences found: {len(significant)}")
+            
             # Preprocess table
             table_df = preprocess_table(table_df)
             print(f"Processed table shape: {table_df.shape}")
@@ -56,17 +70,24 @@ def prompt_builder_node(state: Dict[str, Any]) -> Dict[str, Any]:
         }
 
     try:
-        # Convert DataFrame to list format for tabulate
-        headers = table_df.columns.tolist()
-        table_data = table_df.values.tolist()
+        # Table format picked for the model that will read the prompt
+        structured = state.get("structured_output", os.getenv("INSIGHT_STRUCTURED_OUTPUT", "").lower() in ("1", "true"))
+        table_format = table_format_for(STRUCTURED_MODEL if structured else "gpt-4")
         
-        # Format table as markdown
-        formatted_table = tabulate(
-            table_data,
-            headers=headers,
-            tablefmt="github",
-            showindex=True
-        )
+        # Send significant differences when the table could be tested, otherwise the summary table
+        if significant:
+            data_section = ("Statistically significant differences between columns "
+                            "(95% confidence, column-proportion z-test):\n"
+                            + format_significant_differences(significant))
+        else:
+            # Summary statistics keep their index (mean/min/max) as row labels
+            fmt = "pipe" if table_format == "markdown" else table_format
+            data_section = "Survey Response Data (showing key statistics):\n" + serialize_table(
+                table_df, fmt, index=True
+            )
+
+        # Real base from the workbook's counts sheet, when it has one
+        base_line = f"\nBase size: {base_size} respondents\n" if base_size else ""
 
         # Build prompt
         prompt = f"""
@@ -76,17 +97,16 @@ Question ID: {question_id}
 
 Question Text: 
 {question_text}
-
-Survey Response Data (showing key statistics):
-{formatted_table}
+{base_line}
+{data_section}
 
 Please provide:
 1. Key Findings:
-   - Top 3 clear and data-driven insights
+   - Top {num_insights} clear and data-driven insights
    - Focus on usage patterns, preferences, and trends
 
 2. Recommendations:
-   - 2 actionable recommendations based on the findings
+   - {num_recommendations} actionable recommendations based on the findings
    - Consider business implications and opportunities
 
 Format your response with clear sections and bullet points.
@@ -1,23 +1,19 @@
 from utils import load_keys
-from table_extractor import TableExtractor
-from prompt_builder import PromptBuilder
 from pinecone_search import query_pinecone
+from study_registry import get_registry
 
-def preview_prompt_for_question(question_id: str):
+def preview_prompt_for_question(question_id: str, study_id: str = None):
     # Load keys and setup
     keys = load_keys()
-    filepath = "Data/raw data/Tables.xlsx"
-    brand_name = "SonyLiv"
-    study_context = "OTT usage and brand perception survey"
 
-    # Set up data extractor and prompt builder
-    extractor = TableExtractor(filepath)
-    extractor.load_excel()
-    prompt_builder = PromptBuilder(brand_name, study_context)
+    # Set up data extractor and prompt builder for the study
+    assets = get_registry().assets(study_id)
+    extractor = assets.extractor
+    prompt_builder = assets.prompt_builder
 
     # Load question text from Pinecone (PDF)
     try:
-        matches = query_pinecone(question_id)
+        matches = query_pinecone(question_id, namespace=assets.config.namespace)
         question_text = next((m for m in matches if question_id.lower() in m.lower()), matches[0])
     except Exception:
         question_text = question_id
@@ -32,7 +28,7 @@ def preview_prompt_for_question(question_id: str):
     prompt = prompt_builder.build_insight_prompt(
         question_text=question_text,
         table_df=formatted_table,
-        base_size=2314,
+        base_size=extractor.total_base(question_id) or assets.config.base_size,
         num_insights=3,
         num_recommendations=2
     )
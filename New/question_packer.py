@@ -0,0 +1,172 @@
+import json
+import os
+from typing import Any, Dict, List
+
+from openai_scheduler import get_scheduler
+from structured_insights import STRUCTURED_MODEL, format_insights, max_tokens_for, parse_insight_items
+
+PACK_TOKEN_BUDGET = int(os.getenv("QUESTION_PACK_TOKENS", "3000"))  # Prompt tokens per packed request
+MAX_QUESTIONS_PER_PACK = 8
+
+
+def section_tokens(prepared: Dict[str, Any]) -> int:
+    """Approximate prompt tokens one question adds to a packed prompt."""
+    text = "\n".join(str(prepared.get(k) or "") for k in ("question_text", "table", "significant_differences"))
+    return get_scheduler().estimate_tokens(STRUCTURED_MODEL, input=text)
+
+
+def pack_questions(prepared: List[Dict[str, Any]],
+                   token_budget: int = PACK_TOKEN_BUDGET,
+                   max_per_pack: int = MAX_QUESTIONS_PER_PACK) -> List[List[Dict[str, Any]]]:
+    """
+    Greedily group prepared questions (in order) into packs that fit the token budget.
+
+    A question larger than the budget on its own gets a pack to itself.
+    """
+    packs, current, current_tokens = [], [], 0
+    for item in prepared:
+        tokens = section_tokens(item)
+        if current and (current_tokens + tokens > token_budget or len(current) >= max_per_pack):
+            packs.append(current)
+            current, current_tokens = [], 0
+        current.append(item)
+        current_tokens += tokens
+    if current:
+        packs.append(current)
+    return packs
+
+
+def build_packed_schema(question_ids: List[str], num_insights: int, num_recommendations: int) -> Dict[str, Any]:
+    """JSON schema with one answer object per question, keyed by question ID."""
+    return {
+        "type": "object",
+        "properties": {
+            "answers": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "question_id": {"type": "string", "enum": question_ids},
+                        "insights": {
+                            "type": "array",
+                            "description": f"Exactly {num_insights} concise, data-driven insights",
+                            "items": {"type": "string"}
+                        },
+                        "recommendations": {
+                            "type": "array",
+                            "description": f"Exactly {num_recommendations} actionable recommendations",
+                            "items": {"type": "string"}
+                        }
+                    },
+                    "required": ["question_id", "insights", "recommendations"],
+                    "additionalProperties": False
+                }
+            }
+        },
+        "required": ["answers"],
+        "additionalProperties": False
+    }
+
+
+def parse_packed_response(content: str, question_ids: List[str],
+                          num_insights: int, num_recommendations: int) -> Dict[str, str]:
+    """
+    Split a packed response into formatted insights per QID.
+
+    Answers that are missing, malformed or for unknown QIDs are left out, so the
+    caller can retry just those questions.
+    """
+    try:
+        answers = json.loads(content or "").get("answers", [])
+    except (json.JSONDecodeError, AttributeError):
+        return {}
+
+    wanted = {qid.upper(): qid for qid in question_ids}
+    results = {}
+    for answer in answers:
+        if not isinstance(answer, dict):
+            continue
+        qid = wanted.get(str(answer.get("question_id", "")).strip().upper())
+        if qid is None or qid in results:
+            continue
+        try:
+            insights, recommendations = parse_insight_items(answer, num_insights, num_recommendations)
+        except ValueError:
+            continue
+        results[qid] = format_insights(insights, recommendations)
+    return results
+
+
+def complete_pack(generator, pack: List[Dict[str, Any]],
+                  num_insights: int = 3,
+                  num_recommendations: int = 2) -> Dict[str, str]:
+    """Send one packed request and return the insights that parsed cleanly, by QID."""
+    question_ids = [item["question_id"] for item in pack]
+    prompt = generator.prompt_builder.build_packed_insight_prompt(
+        pack, base_size=generator.base_size,
+        num_insights=num_insights, num_recommendations=num_recommendations
+    )
+    try:
+        response = get_scheduler().chat(
+            generator.client,
+            model=STRUCTURED_MODEL,
+            messages=[
+                {"role": "system", "content": "You are an expert market research analyst."},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0.7,
+            max_tokens=len(pack) * max_tokens_for(num_insights, num_recommendations),
+            response_format={
+                "type": "json_schema",
+                "json_schema": {
+                    "name": "packed_insight_report",
+                    "strict": True,
+                    "schema": build_packed_schema(question_ids, num_insights, num_recommendations)
+                }
+            }
+        )
+        content = response.choices[0].message.content
+    except Exception as e:
+        print(f"Packed request for {', '.join(question_ids)} failed: {e}")
+        return {}
+
+    return parse_packed_response(content, question_ids, num_insights, num_recommendations)
+
+
+def run_pack(generator, pack: List[Dict[str, Any]],
+             num_insights: int = 3,
+             num_recommendations: int = 2) -> Dict[str, Any]:
+    """
+    Generate and save insights for a pack of prepared questions.
+
+    Questions the packed response didn't answer cleanly are retried alone.
+
+    Returns:
+        {qid: (question_text, insights, doc_url)} with an Exception in place of the
+        tuple for questions that failed even when retried alone
+    """
+    answered = complete_pack(generator, pack, num_insights, num_recommendations) if len(pack) > 1 else {}
+
+    results: Dict[str, Any] = {}
+    for item in pack:
+        qid = item["question_id"]
+        try:
+            insights = answered.get(qid)
+            if insights is None:
+                if len(pack) > 1:
+                    print(f"No usable packed answer for {qid}, retrying it alone")
+                prompt = generator.prompt_builder.build_insight_prompt(
+                    question_text=item["question_text"],
+                    table_df=item["table"],
+                    base_size=item.get("base_size") or generator.base_size,
+                    num_insights=num_insights,
+                    num_recommendations=num_recommendations,
+                    significant_differences=item["significant_differences"]
+                )
+                insights = generator.complete(prompt, num_insights, num_recommendations)
+            url = generator.save_insights(qid, item["question_text"], insights)
+            results[qid] = (item["question_text"], insights, url)
+        except Exception as e:
+            results[qid] = e
+    return results
+
@@ -0,0 +1,200 @@
+import abc
+import argparse
+import html
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import markdown
+
+DEFAULT_REPORT_DIR = "Data/reports"
+BOLD_HEADING = re.compile(r'^\*\*(.+?):?\*\*:?$')
+NUMBERED_ITEM = re.compile(r'^\d+\.\s+(.*)$')
+
+# (question_id, question_text, insights)
+Report = Tuple[str, str, str]
+
+
+def _qid_sort_key(question_id: str):
+    return [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', question_id)]
+
+
+def render_markdown(question_id: str, question_text: str, insights: str) -> str:
+    """One question's report as Markdown (same content as the Google Doc)."""
+    return f"## Insights for {question_id}\n\n{(question_text or '').strip()}\n\n{(insights or '').strip()}\n"
+
+
+class ReportSink(abc.ABC):
+    """Where generated insight reports end up; write() returns the report's location."""
+    name = "base"
+
+    @abc.abstractmethod
+    def write(self, question_id: str, question_text: str, insights: str) -> str:
+        """Store one report and return where it can be found."""
+
+    def write_many(self, reports: List[Report], workers: int = 8) -> List[str]:
+        """Write several reports in parallel; locations are returned in input order."""
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            locations = list(pool.map(lambda r: self.write(*r), reports))
+        self.flush()
+        return locations
+
+    def flush(self) -> None:
+        """Write out anything buffered (combined documents)."""
+
+
+class GoogleDocsSink(ReportSink):
+    name = "gdocs"
+
+    def write(self, question_id: str, question_text: str, insights: str) -> str:
+        # Imported on use so local sinks work on hosts without the Google client libraries
+        import google_doc_saver
+        return google_doc_saver.create_insight_doc(question_id, question_text, insights)
+
+
+class LocalReportSink(ReportSink):
+    extension = ""
+
+    def __init__(self, output: str = DEFAULT_REPORT_DIR, combined: bool = False):
+        """
+        Render reports to local files.
+
+        Args:
+            output: Directory for one file per question, or the combined document's path
+            combined: Buffer every report and write them as one document on flush()
+        """
+        self.output = output
+        self.combined = combined
+        self._sections: Dict[str, Report] = {}
+        self._lock = threading.Lock()
+        if not combined:
+            os.makedirs(output, exist_ok=True)
+        elif not output.endswith(self.extension):
+            self.output = output + self.extension
+
+    def write(self, question_id: str, question_text: str, insights: str) -> str:
+        if self.combined:
+            with self._lock:
+                self._sections[question_id] = (question_id, question_text, insights)
+            return f"{os.path.abspath(self.output)}#{question_id}"
+
+        path = os.path.join(self.output, f"{question_id}{self.extension}")
+        self.render([(question_id, question_text, insights)], path)
+        return os.path.abspath(path)
+
+    def flush(self) -> None:
+        with self._lock:
+            if not self.combined or not self._sections:
+                return
+            reports = [self._sections[qid] for qid in sorted(self._sections, key=_qid_sort_key)]
+        os.makedirs(os.path.dirname(self.output) or ".", exist_ok=True)
+        self.render(reports, self.output)
+        print(f"Wrote {len(reports)} reports to {self.output}")
+
+    @abc.abstractmethod
+    def render(self, reports: List[Report], path: str) -> None:
+        """Write the given reports as one document at path."""
+
+
+class MarkdownSink(LocalReportSink):
+    name = "markdown"
+    extension = ".md"
+
+    def render(self, reports: List[Report], path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n".join(render_markdown(*r) for r in reports))
+
+
+class HTMLSink(LocalReportSink):
+    name = "html"
+    extension = ".html"
+
+    def render(self, reports: List[Report], path: str) -> None:
+        # Model output is text, not markup: escape it so only the Markdown formatting becomes HTML
+        body = "\n".join(markdown.markdown(render_markdown(*(html.escape(part or "", quote=False) for part in r)))
+                         for r in reports)
+        title = html.escape(reports[0][0] if len(reports) == 1 else "Insights Report")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(f"<!DOCTYPE html>\n<html>\n<head><meta charset=\"utf-8\"><title>{title}</title></head>\n"
+                    f"<body>\n{body}\n</body>\n</html>\n")
+
+
+class DocxSink(LocalReportSink):
+    name = "docx"
+    extension = ".docx"
+
+    def render(self, reports: List[Report], path: str) -> None:
+        from docx import Document
+
+        document = Document()
+        for i, (question_id, question_text, insights) in enumerate(reports):
+            if i:
+                document.add_page_break()
+            document.add_heading(f"Insights for {question_id}", level=1)
+            document.add_paragraph((question_text or "").strip())
+            for line in (insights or "").splitlines():
+                line = line.strip()
+                if not line:
+                    continue
+                heading = BOLD_HEADING.match(line)
+                item = NUMBERED_ITEM.match(line)
+                if heading:
+                    document.add_heading(heading.group(1), level=2)
+                elif item:
+                    document.add_paragraph(item.group(1), style="List Number")
+                else:
+                    document.add_paragraph(line)
+        document.save(path)
+
+
+SINKS = {
+    "gdocs": GoogleDocsSink,
+    "markdown": MarkdownSink,
+    "md": MarkdownSink,
+    "html": HTMLSink,
+    "docx": DocxSink,
+}
+
+_sinks: Dict[Tuple[str, str, bool], ReportSink] = {}
+_sinks_lock = threading.Lock()
+
+
+def get_sink(name: Optional[str] = None, output: Optional[str] = None, combined: bool = False) -> ReportSink:
+    """
+    Return a shared report sink.
+
+    Args:
+        name: gdocs, docx, markdown or html (default from REPORT_SINK, else gdocs)
+        output: Report directory or combined document path (default from REPORT_OUTPUT)
+        combined: Collect reports into one document written on flush()
+    """
+    name = (name or os.getenv("REPORT_SINK", "gdocs")).lower()
+    if name not in SINKS:
+        raise ValueError(f"Unknown report sink '{name}'. Choose from: {', '.join(sorted(SINKS))}")
+
+    output = output or os.getenv("REPORT_OUTPUT", DEFAULT_REPORT_DIR)
+    key = (name, output, combined)
+    with _sinks_lock:
+        if key not in _sinks:
+            sink_cls = SINKS[name]
+            _sinks[key] = sink_cls() if sink_cls is GoogleDocsSink else sink_cls(output, combined)
+        return _sinks[key]
+
+
+if __name__ == "__main__":
+    from survey_sweep import load_progress
+
+    parser = argparse.ArgumentParser(description="Render finished sweep results into reports.")
+    parser.add_argument("progress", help="Sweep progress file (JSONL)")
+    parser.add_argument("--sink", default="docx", help="gdocs, docx, markdown or html")
+    parser.add_argument("--output", default=None, help="Report directory, or document path with --combined")
+    parser.add_argument("--combined", action="store_true", help="Write one combined document")
+    parser.add_argument("--workers", type=int, default=8, help="Reports written in parallel")
+    args = parser.parse_args()
+
+    done = [r for r in load_progress(args.progress).values() if r.get("status") == "done"]
+    sink = get_sink(args.sink, args.output, args.combined)
+    locations = sink.write_many([(r["qid"], r.get("question_text", ""), r["insights"]) for r in done], args.workers)
+    print(f"Rendered {len(locations)} reports with the {sink.name} sink")
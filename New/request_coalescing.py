@@ -0,0 +1,87 @@
+import re
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+
+def normalize_question_key(question: str, study_id: str = "default") -> Tuple[str, str]:
+    """Build a coalescing key that ignores case, extra whitespace and trailing punctuation."""
+    normalized = re.sub(r'\s+', ' ', (question or "").strip().lower())
+    normalized = normalized.rstrip("?.! ")
+    return study_id or "default", normalized
+
+
+class SingleFlight:
+    """
+    Share one in-flight computation between concurrent callers with the same key.
+
+    The first caller for a key runs the function; callers arriving while it is still
+    running wait for and receive the same result (or exception). Nothing is cached
+    once the call finishes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, Future] = {}
+        self.executed = 0
+        self.coalesced = 0
+
+    def do(self, key: Hashable, fn: Callable[..., Any], *args, **kwargs) -> Tuple[Any, bool]:
+        """
+        Run fn(*args, **kwargs) once per key across concurrent callers.
+
+        Returns:
+            Tuple[Any, bool]: (result, shared) where shared is True if another caller computed it
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                future = Future()
+                self._calls[key] = future
+                self.executed += 1
+                leader = True
+
+        if not leader:
+            return future.result(), True
+
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+        return future.result(), False
+
+    def stats(self) -> Dict[str, int]:
+        """Number of executed computations and of callers that joined one in flight."""
+        with self._lock:
+            return {
+                "executed": self.executed,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._calls)
+            }
+
+
+# Test the coalescer
+if __name__ == "__main__":
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+
+    flights = SingleFlight()
+
+    def slow_answer(question):
+        time.sleep(1)
+        return f"answer to {question}"
+
+    questions = ["Which OTT apps are used most?", "which OTT apps are used most", "  Which  OTT apps are used most?? "]
+    with ThreadPoolExecutor(max_workers=len(questions)) as pool:
+        futures = [pool.submit(flights.do, normalize_question_key(q), slow_answer, q) for q in questions]
+        for f in futures:
+            print(f.result())
+
+    print("Stats:", flights.stats())
@@ -0,0 +1,324 @@
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import os
+import re
+import sqlite3
+import statistics
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+import pdf_query_node
+from chunk_store import get_chunk_store
+from pdf_embedder import build_vector_metadata, chunk_pages, extract_pages, extract_question_info
+from pdf_query_node import CANDIDATE_BUDGET, prerank_matches, query_pdf_question_node, rank_questions
+from retrieval_filters import RetrievalFilter
+
+EVAL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "eval")
+DEFAULT_GOLDEN = os.path.join(EVAL_DIR, "golden_questions.jsonl")
+DEFAULT_BASELINE = os.path.join(EVAL_DIR, "retrieval_baseline.json")
+DEFAULT_EMBED_CACHE = "Data/cache/eval_embeddings.sqlite"
+EMBED_MODEL = "text-embedding-ada-002"
+K_VALUES = (1, 3, 5)
+HASH_DIMENSIONS = 1024
+
+# Allowed drop against the baseline before the gate fails
+DEFAULT_ACCURACY_TOLERANCE = 0.02  # Absolute, for recall@k and MRR
+DEFAULT_LATENCY_TOLERANCE = 0.5  # Relative, for p95 latency
+LATENCY_FLOOR_MS = 5.0  # Latency changes below this are noise
+
+
+def load_golden(path: str = DEFAULT_GOLDEN) -> List[Dict[str, Any]]:
+    """Golden pairs, one JSON object per line: {"question": ..., "expected_qid": ... or "expected_qids": [...]}."""
+    items = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            expected = item.get("expected_qids") or [item.get("expected_qid")]
+            if not item.get("question") or not all(expected):
+                raise ValueError(f"{path}:{line_no}: needs a question and expected_qid(s)")
+            items.append({**item, "expected_qids": [q.upper() for q in expected]})
+    return items
+
+
+class EmbeddingCache:
+    def __init__(self, db_path: str = DEFAULT_EMBED_CACHE):
+        """Embeddings by (model, text) hash, so repeated evaluations don't call the API."""
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(db_path)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+        self._conn.commit()
+
+    @staticmethod
+    def key(model: str, text: str) -> str:
+        return hashlib.sha256(f"{model}\n{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        found = {}
+        for start in range(0, len(keys), 500):
+            batch = keys[start:start + 500]
+            rows = self._conn.execute(f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})",
+                                      batch).fetchall()
+            found.update({key: np.frombuffer(blob, dtype=np.float32) for key, blob in rows})
+        return found
+
+    def put_many(self, items: Dict[str, np.ndarray]) -> None:
+        self._conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?)",
+                               [(key, vector.astype(np.float32).tobytes()) for key, vector in items.items()])
+        self._conn.commit()
+
+
+class OpenAIEmbedder:
+    name = "openai"
+
+    def __init__(self, cache: Optional[EmbeddingCache] = None, model: str = EMBED_MODEL):
+        """The production embedding model; only texts missing from the cache are sent."""
+        self.cache = cache or EmbeddingCache(os.getenv("EVAL_EMBED_CACHE", DEFAULT_EMBED_CACHE))
+        self.model = model
+        self._client = None
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        keys = [EmbeddingCache.key(self.model, t) for t in texts]
+        found = self.cache.get_many(keys)
+        missing = [(k, t) for k, t in dict(zip(keys, texts)).items() if k not in found]
+        if missing:
+            from openai import OpenAI
+            from openai_scheduler import get_scheduler
+            from utils import load_keys
+
+            if self._client is None:
+                self._client = OpenAI(api_key=load_keys()["OPENAI_API_KEY"])
+            for start in range(0, len(missing), 100):
+                batch = missing[start:start + 100]
+                response = get_scheduler().embed(self._client, model=self.model, input=[t for _, t in batch])
+                vectors = [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+                new = {k: np.array(v, dtype=np.float32) for (k, _), v in zip(batch, vectors)}
+                self.cache.put_many(new)
+                found.update(new)
+        return np.stack([found[k] for k in keys])
+
+
+class HashingEmbedder:
+    name = "hash"
+
+    def __init__(self, dimensions: int = HASH_DIMENSIONS):
+        """Deterministic bag-of-words vectors: no API key or network, for CI runs of the gate."""
+        self.dimensions = dimensions
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in re.findall(r'[a-z0-9]+', text.lower()):
+                bucket = int(hashlib.md5(word.encode("utf-8")).hexdigest()[:8], 16)
+                vectors[row, bucket % self.dimensions] += 1.0 if bucket & (1 << 31) else -1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
+
+
+EMBEDDERS = {"openai": OpenAIEmbedder, "hash": HashingEmbedder}
+
+
+class LocalIndex:
+    def __init__(self, ids: List[str], vectors: np.ndarray, metadata: List[Dict[str, Any]], embedder):
+        """In-memory cosine index with the same match format and filters as the Pinecone index."""
+        self.ids = ids
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        self.vectors = vectors / np.where(norms == 0, 1, norms)
+        self.metadata = metadata
+        self.embedder = embedder
+
+    @classmethod
+    def from_questionnaire(cls, path: str, embedder, namespace: str = "default",
+                           study_id: Optional[str] = None) -> "LocalIndex":
+        """Chunk a questionnaire with the current chunking code (so chunking changes are measured)."""
+        chunks = chunk_pages(extract_pages(path))
+        ids, metadata = [], []
+        for i, chunk in enumerate(chunks):
+            info = extract_question_info(chunk["text"])
+            ids.append(f"{namespace}-chunk-{i}")
+            metadata.append({**build_vector_metadata(info["qid"], chunk, study_id or namespace),
+                             "text": chunk["text"], "clean_text": info["text"]})
+        print(f"Indexed {len(chunks)} chunks of {path}")
+        return cls(ids, embedder.embed([c["text"] for c in chunks]), metadata, embedder)
+
+    @classmethod
+    def from_chunk_store(cls, namespace: str, embedder) -> "LocalIndex":
+        """Index the chunks already stored locally for a namespace (chunking as last ingested)."""
+        store = get_chunk_store()
+        with store._lock:
+            rows = store._conn.execute("SELECT chunk_id, qid, text, clean_text FROM chunks WHERE namespace = ?",
+                                       (namespace,)).fetchall()
+        if not rows:
+            raise ValueError(f"No chunks stored for namespace '{namespace}'; pass --questionnaire")
+        metadata = [{**build_vector_metadata(qid, {}, namespace), "text": text, "clean_text": clean}
+                    for _, qid, text, clean in rows]
+        print(f"Indexed {len(rows)} stored chunks of namespace '{namespace}'")
+        return cls([r[0] for r in rows], embedder.embed([r[2] for r in rows]), metadata, embedder)
+
+    def search(self, question: str, top_k: int = 3, namespace: str = "default",
+               filters: Optional[RetrievalFilter] = None, local_filter: bool = False) -> Dict[str, Any]:
+        """Drop-in for pdf_embedder.query_pdf_question."""
+        query = self.embedder.embed([f"Survey question about: {question}"])[0]
+        scores = self.vectors @ (query / (np.linalg.norm(query) or 1))
+        filters = filters or RetrievalFilter()
+        matches = []
+        for i in np.argsort(-scores):
+            if filters.is_empty() or filters.matches(self.metadata[i]):
+                matches.append({"id": self.ids[i], "score": float(scores[i]), "metadata": dict(self.metadata[i])})
+                if len(matches) >= top_k:
+                    break
+        return {"matches": matches}
+
+
+def unique_qids(qids: List[str]) -> List[str]:
+    # Extracted QIDs can keep the numbering's trailing dot ("Q12.")
+    return list(dict.fromkeys(q.upper().rstrip(".") for q in qids if q and q != "unknown"))
+
+
+def strategy_embedding(index: LocalIndex, item: Dict[str, Any], budget: int) -> List[str]:
+    """Embedding score alone."""
+    matches = index.search(item["question"], top_k=budget)["matches"]
+    return unique_qids([m["metadata"].get("qid") for m in prerank_matches(matches, keep=budget)])
+
+
+def strategy_rerank(index: LocalIndex, item: Dict[str, Any], budget: int) -> List[str]:
+    """Embedding pre-rank plus score_match relevance, as extract_best_question ranks."""
+    matches = index.search(item["question"], top_k=budget)["matches"]
+    return unique_qids([c["question_id"] for c in rank_questions(prerank_matches(matches), item["question"])])
+
+
+def strategy_node(index: LocalIndex, item: Dict[str, Any], budget: int) -> List[str]:
+    """query_pdf_question_node end to end (routing, filters, fallback), searching the local index."""
+    original = pdf_query_node.query_pdf_question
+    pdf_query_node.query_pdf_question = index.search
+    try:
+        state = query_pdf_question_node({"question": item["question"], "study_id": item.get("study_id"),
+                                         "candidate_budget": budget})
+    finally:
+        pdf_query_node.query_pdf_question = original
+    return unique_qids([c["question_id"] for c in state.get("question_candidates", [])])
+
+
+STRATEGIES: Dict[str, Callable[[LocalIndex, Dict[str, Any], int], List[str]]] = {
+    "embedding": strategy_embedding,
+    "rerank": strategy_rerank,
+    "node": strategy_node,
+}
+
+
+def is_hit(qid: str, expected: List[str]) -> bool:
+    # An expected bare question number ("Q10") accepts any of its parts
+    return any(qid == e or qid.startswith(e + ".") for e in expected)
+
+
+def evaluate(strategy: str, index: LocalIndex, golden: List[Dict[str, Any]],
+             budget: int = CANDIDATE_BUDGET) -> Dict[str, Any]:
+    """recall@k, MRR and per-query latency of one strategy over the golden set."""
+    ranks, latencies, misses = [], [], []
+    for item in golden:
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            ranked = STRATEGIES[strategy](index, item, budget)
+        latencies.append((time.perf_counter() - start) * 1000)
+        rank = next((i + 1 for i, qid in enumerate(ranked) if is_hit(qid, item["expected_qids"])), None)
+        ranks.append(rank)
+        if rank != 1:
+            misses.append({"question": item["question"], "expected": item["expected_qids"], "got": ranked[:3]})
+
+    ordered = sorted(latencies)
+    return {
+        "queries": len(golden),
+        **{f"recall@{k}": round(sum(1 for r in ranks if r and r <= k) / len(golden), 4) for k in K_VALUES},
+        "mrr": round(statistics.mean(1 / r if r else 0 for r in ranks), 4),
+        "latency_p50_ms": round(statistics.median(latencies), 2),
+        "latency_p95_ms": round(ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))], 2),
+        "misses": misses,
+    }
+
+
+def compare_to_baseline(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]],
+                        tolerance: float = DEFAULT_ACCURACY_TOLERANCE,
+                        latency_tolerance: float = DEFAULT_LATENCY_TOLERANCE) -> List[str]:
+    """Regressions against the stored baseline (empty when the gate passes)."""
+    failures = []
+    for strategy, current in results.items():
+        previous = baseline.get(strategy)
+        if previous is None:
+            continue
+        for metric in [f"recall@{k}" for k in K_VALUES] + ["mrr"]:
+            if current[metric] < previous[metric] - tolerance:
+                failures.append(f"{strategy}: {metric} {current[metric]:.3f} < baseline {previous[metric]:.3f}")
+        limit = max(previous["latency_p95_ms"] * (1 + latency_tolerance), previous["latency_p95_ms"] + LATENCY_FLOOR_MS)
+        if current["latency_p95_ms"] > limit:
+            failures.append(f"{strategy}: p95 latency {current['latency_p95_ms']:.1f}ms > limit {limit:.1f}ms "
+                            f"(baseline {previous['latency_p95_ms']:.1f}ms)")
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluate question-to-QID retrieval against the golden set.")
+    parser.add_argument("--golden", default=DEFAULT_GOLDEN, help="Golden question -> QID pairs (JSONL)")
+    parser.add_argument("--questionnaire", default=None,
+                        help="Questionnaire to chunk and index (default: chunks stored for the namespace)")
+    parser.add_argument("--namespace", default="default", help="Study questionnaire namespace")
+    parser.add_argument("--embedder", default="openai", choices=list(EMBEDDERS),
+                        help="openai (cached locally after the first run) or hash (no network)")
+    parser.add_argument("--strategies", nargs="+", default=list(STRATEGIES), choices=list(STRATEGIES))
+    parser.add_argument("--budget", type=int, default=CANDIDATE_BUDGET, help="Candidates fetched per query")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--update-baseline", action="store_true", help="Store these results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_ACCURACY_TOLERANCE,
+                        help="Allowed absolute drop in recall@k / MRR")
+    parser.add_argument("--latency-tolerance", type=float, default=DEFAULT_LATENCY_TOLERANCE,
+                        help="Allowed relative growth of p95 latency")
+    parser.add_argument("--report", default=None, help="Write the full results (with misses) to this JSON file")
+    args = parser.parse_args()
+
+    golden = load_golden(args.golden)
+    embedder = EMBEDDERS[args.embedder]()
+    index = (LocalIndex.from_questionnaire(args.questionnaire, embedder, args.namespace) if args.questionnaire
+             else LocalIndex.from_chunk_store(args.namespace, embedder))
+
+    results = {strategy: evaluate(strategy, index, golden, args.budget) for strategy in args.strategies}
+    print(f"\n{'strategy':<10} " + " ".join(f"{'recall@' + str(k):>9}" for k in K_VALUES)
+          + f" {'MRR':>7} {'p50 ms':>8} {'p95 ms':>8}")
+    for strategy, r in results.items():
+        print(f"{strategy:<10} " + " ".join(f"{r[f'recall@{k}']:>9.3f}" for k in K_VALUES)
+              + f" {r['mrr']:>7.3f} {r['latency_p50_ms']:>8.2f} {r['latency_p95_ms']:>8.2f}")
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    # Baselines are kept per embedder, since scores aren't comparable across them
+    stored = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            stored = json.load(f)
+    summary = {s: {k: v for k, v in r.items() if k != "misses"} for s, r in results.items()}
+
+    if args.update_baseline:
+        stored[args.embedder] = {**stored.get(args.embedder, {}), **summary}
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(stored, f, indent=2)
+        print(f"\nBaseline updated: {args.baseline}")
+        sys.exit(0)
+
+    if args.embedder not in stored:
+        print(f"\nNo {args.embedder} baseline in {args.baseline} yet; record one with --update-baseline")
+        sys.exit(0)
+
+    failures = compare_to_baseline(summary, stored[args.embedder], args.tolerance, args.latency_tolerance)
+    if failures:
+        print("\nRetrieval regression:")
+        for failure in failures:
+            print(f"  {failure}")
+        sys.exit(1)
+    print("\nRetrieval quality and latency within baseline")
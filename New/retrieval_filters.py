@@ -0,0 +1,110 @@
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+QID_PATTERN = re.compile(r'\bQ(\d+)(?:\.\d+)*\b', re.IGNORECASE)
+
+
+def question_number(qid: str) -> Optional[int]:
+    """Major question number of a QID ("Q10.1" -> 10)."""
+    match = QID_PATTERN.match(qid or "")
+    return int(match.group(1)) if match else None
+
+
+@dataclass
+class RetrievalFilter:
+    """Structured constraints applied inside the vector search."""
+    sections: List[str] = field(default_factory=list)
+    qid_prefixes: List[str] = field(default_factory=list)
+    study_id: Optional[str] = None
+    page_range: Optional[Tuple[int, int]] = None
+
+    @classmethod
+    def from_dict(cls, raw: Optional[Dict[str, Any]]) -> "RetrievalFilter":
+        raw = raw or {}
+        page_range = raw.get("page_range")
+        return cls(
+            sections=list(raw.get("sections", [])),
+            qid_prefixes=list(raw.get("qid_prefixes", [])),
+            study_id=raw.get("study_id"),
+            page_range=tuple(page_range) if page_range else None
+        )
+
+    def merged(self, other: "RetrievalFilter") -> "RetrievalFilter":
+        """Combine with another filter; values set on `other` take precedence."""
+        return RetrievalFilter(
+            sections=other.sections or self.sections,
+            qid_prefixes=other.qid_prefixes or self.qid_prefixes,
+            study_id=other.study_id or self.study_id,
+            page_range=other.page_range or self.page_range
+        )
+
+    def is_empty(self) -> bool:
+        return not (self.sections or self.qid_prefixes or self.study_id or self.page_range)
+
+    def _split_prefixes(self) -> Tuple[List[int], List[str]]:
+        """
+        Question numbers to match with all their parts, and IDs to match exactly.
+
+        A bare question number ("Q10") matches all its parts; a full ID ("Q10.1") or an ID
+        without a question number ("S", "DEMO1") only matches itself.
+        """
+        numbers, exact = [], []
+        for prefix in self.qid_prefixes:
+            prefix = str(prefix).strip().upper()
+            if not prefix:
+                continue
+            number = question_number(prefix) if "." not in prefix else None
+            if number is not None:
+                numbers.append(number)
+            else:
+                exact.append(prefix)
+        return numbers, exact
+
+    def to_pinecone(self) -> Optional[Dict[str, Any]]:
+        """Translate into a Pinecone metadata filter (None when there is nothing to filter on)."""
+        clauses = []
+        if self.sections:
+            clauses.append({"section": {"$in": [s.upper() for s in self.sections]}})
+        if self.study_id:
+            clauses.append({"study": {"$eq": self.study_id}})
+        if self.page_range:
+            first, last = self.page_range
+            # Chunks overlapping the range
+            clauses.append({"page_start": {"$lte": last}})
+            clauses.append({"page_end": {"$gte": first}})
+        numbers, exact = self._split_prefixes()
+        qid_clauses = []
+        if numbers:
+            qid_clauses.append({"qnum": {"$in": numbers}})
+        if exact:
+            qid_clauses.append({"qid": {"$in": exact}})
+        if qid_clauses:
+            clauses.append(qid_clauses[0] if len(qid_clauses) == 1 else {"$or": qid_clauses})
+
+        if not clauses:
+            return None
+        return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+    def matches(self, metadata: Dict[str, Any]) -> bool:
+        """Local pre-filter with the same semantics, for indexes queried without server-side filters."""
+        if self.sections and str(metadata.get("section", "")).upper() not in [s.upper() for s in self.sections]:
+            return False
+        if self.study_id and metadata.get("study") != self.study_id:
+            return False
+        if self.page_range:
+            first, last = self.page_range
+            if metadata.get("page_start", first) > last or metadata.get("page_end", last) < first:
+                return False
+        numbers, exact = self._split_prefixes()
+        if numbers or exact:
+            qid = str(metadata.get("qid", "")).upper()
+            if qid not in exact and question_number(qid) not in numbers:
+                return False
+        return True
+
+
+def filters_from_question(question: str) -> RetrievalFilter:
+    """Restrict retrieval to question IDs the user names explicitly (e.g. "What does Q10.1 ask?")."""
+    qids = [m.group(0).upper() for m in QID_PATTERN.finditer(question or "")]
+    return RetrievalFilter(qid_prefixes=list(dict.fromkeys(qids)))
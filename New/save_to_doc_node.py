@@ -1,20 +1,16 @@
-from google_doc_saver import create_insight_doc
+from report_sinks import get_sink
 
 def save_to_doc_node(state):
-    """LangGraph node that saves insights to Google Docs."""
+    """LangGraph node that saves insights to the configured report sink (Google Docs by default)."""
     question_id = state.get("question_id", "unknown")
     question_text = state.get("question_text", "No question text provided")
     insights = state.get("insights", "No insights generated")
 
-    print(f"\nSaving insights to Google Doc for {question_id}...")
-
     try:
-        doc_url = create_insight_doc(
-            question_id=question_id,
-            question_text=question_text,
-            insights=insights
-        )
-        print(f"Google Doc created: {doc_url}")
+        sink = get_sink(state.get("output_sink"))
+        print(f"\nSaving insights with the {sink.name} sink for {question_id}...")
+        doc_url = sink.write(question_id, question_text, insights)
+        print(f"Report saved: {doc_url}")
 
         return {
             **state,
@@ -22,9 +18,9 @@ def save_to_doc_node(state):
         }
 
     except Exception as e:
-        print(f"Failed to save Google Doc: {e}")
+        print(f"Failed to save report: {e}")
         return {
             **state,
             "doc_url": None,
             "error": str(e)
-        }
\ No newline at end of file
+        }
\ No newline at end of file
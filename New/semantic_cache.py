@@ -0,0 +1,276 @@
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+from openai import OpenAI
+from utils import load_keys
+from openai_scheduler import get_scheduler
+
+DEFAULT_CACHE_PATH = "Data/cache/semantic_cache"
+DEFAULT_THRESHOLD = 0.95
+EMBEDDING_MODEL = "text-embedding-ada-002"
+# Stored answers are appended to a journal; the full snapshot is rewritten this often
+COMPACT_EVERY = 200
+
+# Capitalised words that open or frame a question rather than name something in it
+QUESTION_WORDS = {"what", "which", "who", "whom", "why", "how", "when", "where", "do", "does", "did",
+                  "is", "are", "was", "were", "can", "could", "should", "would", "will", "the", "a",
+                  "an", "among", "in", "for", "of", "and", "or", "by", "i", "we", "show", "give", "tell",
+                  "compare", "list", "please"}
+
+# State keys worth returning for a repeated question
+CACHED_KEYS = ["question_id", "question_text", "insights", "doc_url"]
+
+
+def named_terms(question: str) -> frozenset:
+    """
+    Brands, QIDs and figures a question names (capitalised words and anything with a digit).
+
+    Embeddings put "Netflix" and "Hulu" versions of one question very close together, so two
+    questions only share an answer when they also name the same things.
+    """
+    terms = set()
+    for token in re.findall(r"[A-Za-z0-9][\w.&'+-]*", question):
+        token = token.rstrip(".")
+        if any(ch.isdigit() for ch in token) or (token[0].isupper() and token.lower() not in QUESTION_WORDS):
+            terms.add(token.lower())
+    return frozenset(terms)
+
+
+def openai_embed(text: str) -> List[float]:
+    """Embed a question with the same model used for the questionnaire index."""
+    keys = load_keys()
+    client = OpenAI(api_key=keys["OPENAI_API_KEY"])
+    response = get_scheduler().embed(client, model=EMBEDDING_MODEL, input=text)
+    return response.data[0].embedding
+
+
+class SemanticAnswerCache:
+    def __init__(self,
+                 path: str = DEFAULT_CACHE_PATH,
+                 threshold: float = DEFAULT_THRESHOLD,
+                 embed_fn: Optional[Callable[[str], List[float]]] = None,
+                 max_entries: int = 5000):
+        """
+        Answer cache keyed by question meaning rather than exact wording.
+
+        Args:
+            path: File prefix for the persisted cache (<path>.json and <path>.npy)
+            threshold: Minimum cosine similarity for a cached answer to be reused (the
+                questions must also name the same brands and QIDs)
+            embed_fn: Function embedding a question (defaults to OpenAI embeddings)
+            max_entries: Oldest entries are dropped beyond this many
+        """
+        self.path = path
+        self.threshold = threshold
+        self.embed_fn = embed_fn or openai_embed
+        self.max_entries = max_entries
+
+        self._lock = threading.Lock()
+        self._recent_lock = threading.Lock()
+        self._journaled = 0
+        self._entries: List[Dict[str, Any]] = []
+        self._vectors = np.zeros((0, 0), dtype=np.float32)
+        self._recent: "OrderedDict[str, np.ndarray]" = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.seconds_saved = 0.0
+
+        self._load()
+
+    @property
+    def _journal_path(self) -> str:
+        return f"{self.path}.journal.jsonl"
+
+    def _load(self) -> None:
+        if os.path.exists(f"{self.path}.json") and os.path.exists(f"{self.path}.npy"):
+            with open(f"{self.path}.json", "r", encoding="utf-8") as f:
+                self._entries = json.load(f)
+            self._vectors = np.load(f"{self.path}.npy")
+
+        # Answers stored since the last snapshot
+        if os.path.exists(self._journal_path):
+            with open(self._journal_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A write cut short by a crash; everything before it is intact
+                        break
+                    self._append(record["entry"], np.asarray(record["vector"], dtype=np.float32))
+                    self._journaled += 1
+
+        if self._entries:
+            print(f"Semantic cache loaded: {len(self._entries)} answers")
+
+    def _append(self, entry: Dict[str, Any], vector: np.ndarray) -> None:
+        vectors = self._vectors if self._vectors.size else np.zeros((0, len(vector)), dtype=np.float32)
+        self._entries.append(entry)
+        self._vectors = np.vstack([vectors, vector[None, :]])
+
+        if len(self._entries) > self.max_entries:
+            self._entries = self._entries[-self.max_entries:]
+            self._vectors = self._vectors[-self.max_entries:]
+
+    def _save(self) -> None:
+        """Rewrite the full snapshot and empty the journal."""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(f"{self.path}.json", "w", encoding="utf-8") as f:
+            json.dump(self._entries, f)
+        np.save(f"{self.path}.npy", self._vectors)
+        if os.path.exists(self._journal_path):
+            os.remove(self._journal_path)
+        self._journaled = 0
+
+    def _journal(self, entry: Dict[str, Any], vector: np.ndarray) -> None:
+        """Append one answer to the journal, compacting into the snapshot every COMPACT_EVERY answers."""
+        if self._journaled + 1 >= COMPACT_EVERY:
+            self._save()
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self._journal_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"entry": entry, "vector": vector.tolist()}) + "\n")
+        self._journaled += 1
+
+    def embed(self, question: str) -> np.ndarray:
+        """Return the unit-length embedding of a question (recent questions are memoized)."""
+        key = question.strip().lower()
+        with self._recent_lock:
+            if key in self._recent:
+                self._recent.move_to_end(key)
+                return self._recent[key]
+
+        # Embedded outside the lock; two threads racing on one question both get the same vector
+        vector = np.asarray(self.embed_fn(question), dtype=np.float32)
+        vector /= np.linalg.norm(vector) or 1.0
+
+        with self._recent_lock:
+            self._recent[key] = vector
+            if len(self._recent) > 256:
+                self._recent.popitem(last=False)
+        return vector
+
+    def lookup(self, question: str, study_id: str, version: str) -> Optional[Dict[str, Any]]:
+        """
+        Return a stored answer for a near-duplicate question on the same workbook version.
+
+        Returns:
+            The cached state (plus "similar_question" and "similarity") or None on a miss
+        """
+        start = time.perf_counter()
+        query = self.embed(question)
+        terms = named_terms(question)
+
+        with self._lock:
+            best = None
+            if self._entries:
+                same_data = np.array([e["study_id"] == study_id and e["workbook_version"] == version
+                                      for e in self._entries])
+                scores = np.where(same_data, self._vectors @ query, -1.0)
+                # Best-scoring close match that names the same brands and QIDs
+                for idx in np.argsort(-scores):
+                    if scores[idx] < self.threshold:
+                        break
+                    if named_terms(self._entries[idx]["question"]) == terms:
+                        best = (self._entries[idx], float(scores[idx]))
+                        break
+
+            if best is None:
+                self.misses += 1
+                return None
+
+            entry, similarity = best
+            self.hits += 1
+            self.seconds_saved += max(entry["pipeline_seconds"] - (time.perf_counter() - start), 0.0)
+
+        return {
+            **entry["state"],
+            "similar_question": entry["question"],
+            "similarity": round(similarity, 4)
+        }
+
+    def store(self, question: str, study_id: str, version: str,
+              state: Dict[str, Any], pipeline_seconds: float) -> None:
+        """Remember a successfully answered question."""
+        vector = self.embed(question)
+        entry = {
+            "question": question,
+            "study_id": study_id,
+            "workbook_version": version,
+            "pipeline_seconds": pipeline_seconds,
+            "created": time.time(),
+            "state": {k: state.get(k) for k in CACHED_KEYS}
+        }
+
+        with self._lock:
+            self._append(entry, vector)
+            self._journal(entry, vector)
+
+    def migrate(self, study_id: str, old_version: str, new_version: str, stale_qids: List[str]) -> Dict[str, int]:
+        """
+        Carry answers over to a refreshed workbook, dropping those for questions whose data changed.
+
+        Only entries stamped with old_version are touched; their unchanged answers are restamped
+        with new_version so they keep hitting.
+        """
+        stale = {qid.upper() for qid in stale_qids}
+        kept = dropped = 0
+        with self._lock:
+            keep_rows = []
+            for i, entry in enumerate(self._entries):
+                if entry["study_id"] == study_id and entry["workbook_version"] == old_version:
+                    if str(entry["state"].get("question_id") or "").upper() in stale:
+                        dropped += 1
+                        continue
+                    entry["workbook_version"] = new_version
+                    kept += 1
+                keep_rows.append(i)
+
+            if dropped or kept:
+                self._entries = [self._entries[i] for i in keep_rows]
+                self._vectors = self._vectors[keep_rows] if self._vectors.size else self._vectors
+                self._save()
+        return {"kept": kept, "dropped": dropped}
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit rate and latency saved since this process started."""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "lookups": lookups,
+            "hits": self.hits,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "seconds_saved": round(self.seconds_saved, 2)
+        }
+
+    def report(self) -> str:
+        s = self.stats()
+        return (f"Semantic cache: {s['hits']}/{s['lookups']} hits ({s['hit_rate']:.1%}), "
+                f"~{s['seconds_saved']:.1f}s saved, {s['entries']} stored answers")
+
+
+_cache: Optional[SemanticAnswerCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_semantic_cache() -> SemanticAnswerCache:
+    """Return the process-wide semantic cache (configured via SEMANTIC_CACHE_PATH / SEMANTIC_CACHE_THRESHOLD)."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = SemanticAnswerCache(
+                path=os.getenv("SEMANTIC_CACHE_PATH", DEFAULT_CACHE_PATH),
+                threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", DEFAULT_THRESHOLD))
+            )
+        return _cache
+
+
+if __name__ == "__main__":
+    cache = get_semantic_cache()
+    print(cache.report())
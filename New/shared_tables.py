@@ -0,0 +1,251 @@
+import argparse
+import json
+import os
+import threading
+import time
+from dataclasses import asdict, dataclass
+from multiprocessing import resource_tracker, shared_memory
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from table_extractor import QUESTION_ROW_PATTERN, mentions_question
+
+DEFAULT_MANIFEST = "Data/cache/shared_tables.json"
+
+
+@dataclass
+class SharedSheetHandle:
+    """Everything a worker needs to attach to a published sheet (small and picklable)."""
+    shm_name: str
+    size: int
+    workbook: str
+    sheet_name: str
+    num_columns: int
+    num_rows: int
+    workbook_version: str = ""
+
+
+def _encode_sheet(df: pd.DataFrame) -> pa.Table:
+    """
+    Arrow table with two typed columns per sheet column (numbers and text), since sheet
+    columns mix labels and values. Also stores each row's text and question ID for lookups.
+    """
+    arrays, names = [], []
+    for i in range(df.shape[1]):
+        column = df.iloc[:, i]
+        numbers = pd.to_numeric(column.where(column.map(lambda v: isinstance(v, (int, float, np.number))
+                                                        and not isinstance(v, bool))), errors="coerce")
+        text = column.where(column.notna() & numbers.isna())
+        arrays.append(pa.array(numbers.to_numpy(dtype="float64"), type=pa.float64()))
+        arrays.append(pa.array([None if pd.isna(v) else str(v) for v in text], type=pa.string()))
+        names += [f"c{i}_num", f"c{i}_str"]
+
+    row_text = [" ".join(str(cell) for cell in row if pd.notna(cell)).lower() for row in df.itertuples(index=False)]
+    question_ids = []
+    for row in df.itertuples(index=False):
+        first = next((str(cell) for cell in row if pd.notna(cell) and str(cell).strip()), "")
+        match = QUESTION_ROW_PATTERN.match(first)
+        question_ids.append(match.group(0).strip().upper() if match else None)
+
+    arrays += [pa.array(row_text, type=pa.string()), pa.array(question_ids, type=pa.string())]
+    names += ["row_text", "qid"]
+    return pa.Table.from_arrays(arrays, names=names)
+
+
+class SharedSheet:
+    def __init__(self, handle: SharedSheetHandle, shm: shared_memory.SharedMemory, table: pa.Table, owner: bool):
+        """A parsed sheet living in shared memory; use publish() or attach() to create one."""
+        self.handle = handle
+        self._shm = shm
+        self.table = table
+        self.owner = owner
+        qids = table.column("qid")
+        self._question_rows = pc.indices_nonzero(pc.is_valid(qids)).to_numpy()
+
+    @classmethod
+    def publish(cls, df: pd.DataFrame, workbook: str, sheet_name: str, version: str = "") -> "SharedSheet":
+        """
+        Serialize a parsed sheet into a new shared-memory block (the caller owns and must close it).
+
+        version is the workbook_version() of the file the sheet was read from, so workers can
+        tell a stale block from the current data cut.
+        """
+        table = _encode_sheet(df)
+        sink = pa.MockOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        size = sink.size()
+
+        shm = shared_memory.SharedMemory(create=True, size=size)
+        stream = pa.FixedSizeBufferWriter(pa.py_buffer(shm.buf))
+        with pa.ipc.new_stream(stream, table.schema) as writer:
+            writer.write_table(table)
+
+        handle = SharedSheetHandle(shm.name, size, workbook, sheet_name, df.shape[1], df.shape[0], version)
+        return cls(handle, shm, cls._read(shm, size), owner=True)
+
+    @classmethod
+    def attach(cls, handle: SharedSheetHandle) -> "SharedSheet":
+        """Map a published sheet read-only; Arrow columns point straight into the shared block."""
+        shm = shared_memory.SharedMemory(name=handle.shm_name)
+        if os.name == "posix":
+            # Attaching processes must not unlink the block when they exit; the publisher owns it
+            resource_tracker.unregister(shm._name, "shared_memory")
+        return cls(handle, shm, cls._read(shm, handle.size), owner=False)
+
+    @staticmethod
+    def _read(shm: shared_memory.SharedMemory, size: int) -> pa.Table:
+        return pa.ipc.open_stream(pa.py_buffer(shm.buf)[:size]).read_all()
+
+    def close(self) -> None:
+        """Release the mapping (and free the block if this process published it)."""
+        self.table = None
+        self._shm.close()
+        if self.owner:
+            self._shm.unlink()
+
+    @property
+    def num_rows(self) -> int:
+        return self.handle.num_rows
+
+    def rows(self, start: int, stop: int) -> pd.DataFrame:
+        """Materialize rows [start, stop) with the sheet's original mixed-type columns."""
+        block = self.table.slice(start, max(stop - start, 0))
+        columns = {}
+        for i in range(self.handle.num_columns):
+            numbers = block.column(f"c{i}_num").to_numpy(zero_copy_only=False)
+            text = block.column(f"c{i}_str").to_pylist()
+            columns[i] = [t if t is not None else (n if not np.isnan(n) else np.nan) for n, t in zip(numbers, text)]
+        return pd.DataFrame(columns, index=range(start, start + block.num_rows))
+
+    def question_rows(self) -> np.ndarray:
+        """Row indices that start a question block."""
+        return self._question_rows
+
+    def question_id_at(self, row: int) -> Optional[str]:
+        return self.table.column("qid")[row].as_py()
+
+    def row_text(self, row: int) -> str:
+        return self.table.column("row_text")[row].as_py()
+
+    def find_question(self, question_id: str) -> Optional[int]:
+        """First row mentioning the question ID (question rows are checked first, without copying)."""
+        matches = pc.indices_nonzero(pc.equal(self.table.column("qid"), question_id.strip().upper()))
+        if len(matches):
+            return int(matches[0].as_py())
+        # Rare: the ID only appears inside another row's text
+        for batch_start in range(0, self.num_rows, 10_000):
+            texts = self.table.column("row_text").slice(batch_start, 10_000).to_pylist()
+            for offset, text in enumerate(texts):
+                if text and mentions_question(text, question_id):
+                    return batch_start + offset
+        return None
+
+    def iter_rows(self, chunk_rows: int = 5_000) -> Iterator[Tuple]:
+        """Yield sheet rows as tuples, materializing a chunk at a time."""
+        for start in range(0, self.num_rows, chunk_rows):
+            yield from self.rows(start, min(start + chunk_rows, self.num_rows)).itertuples(index=False)
+
+
+def write_manifest(sheets: List[SharedSheet], path: str = DEFAULT_MANIFEST) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump([asdict(s.handle) for s in sheets], f, indent=2)
+
+
+def find_handle(workbook: str, sheet_name: str, version: Optional[str] = None,
+                path: Optional[str] = None) -> Optional[SharedSheetHandle]:
+    """
+    Handle for a published workbook sheet, from the manifest named by SHARED_TABLES_MANIFEST.
+
+    When version is given, a handle published from a different workbook version is ignored
+    (the caller parses the file itself until the publisher republishes the new cut).
+    """
+    path = path or os.getenv("SHARED_TABLES_MANIFEST")
+    if not path or not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        for entry in json.load(f):
+            if (os.path.abspath(entry["workbook"]) == os.path.abspath(workbook)
+                    and entry["sheet_name"] == sheet_name):
+                handle = SharedSheetHandle(**entry)
+                if version and handle.workbook_version != version:
+                    print(f" Shared copy of {workbook} ({sheet_name}) is from an older workbook version; ignoring it")
+                    return None
+                return handle
+    return None
+
+
+_attached: Dict[Tuple[str, str], SharedSheet] = {}
+_attached_lock = threading.Lock()
+
+
+def attach_cached(handle: SharedSheetHandle) -> SharedSheet:
+    """
+    Attach once per process and reuse the mapping.
+
+    Mappings are kept per workbook sheet, so attaching a republished block (a refreshed
+    workbook) closes the mapping of the block it replaces.
+    """
+    key = (os.path.abspath(handle.workbook), handle.sheet_name)
+    with _attached_lock:
+        sheet = _attached.get(key)
+        if sheet is not None and sheet.handle.shm_name != handle.shm_name:
+            print(f" Closing stale shared sheet {sheet.handle.shm_name} of {handle.workbook} ({handle.sheet_name})")
+            del _attached[key]
+            try:
+                sheet.close()
+            except BufferError:
+                # A reader still holds a slice of the old block; it is unmapped once that is released
+                pass
+            sheet = None
+        if sheet is None:
+            sheet = _attached[key] = SharedSheet.attach(handle)
+        return sheet
+
+
+if __name__ == "__main__":
+    from study_registry import get_registry, workbook_version
+
+    parser = argparse.ArgumentParser(description="Publish study workbooks as shared-memory tables for worker processes.")
+    parser.add_argument("--study", action="append", default=None, help="Study to publish (repeatable; default: all)")
+    parser.add_argument("--manifest", default=os.getenv("SHARED_TABLES_MANIFEST", DEFAULT_MANIFEST))
+    parser.add_argument("--poll", type=float, default=30.0, help="Seconds between checks for refreshed workbooks")
+    args = parser.parse_args()
+
+    registry = get_registry()
+
+    def publish_study(study_id: str) -> SharedSheet:
+        config = registry.get(study_id)
+        version = workbook_version(config.workbook)
+        df = pd.read_excel(config.workbook, sheet_name=config.sheet_name, header=None)
+        sheet = SharedSheet.publish(df, config.workbook, config.sheet_name, version)
+        print(f"Published {study_id} ({config.sheet_name}, version {version}): {df.shape[0]} rows in "
+              f"{sheet.handle.size / 1e6:.1f} MB of shared memory ({sheet.handle.shm_name})")
+        return sheet
+
+    published = {study_id: publish_study(study_id) for study_id in args.study or registry.study_ids()}
+    write_manifest(list(published.values()), args.manifest)
+    print(f"Manifest written to {args.manifest}; workers attach with SHARED_TABLES_MANIFEST={args.manifest}")
+    print("Serving until interrupted...")
+    try:
+        while True:
+            time.sleep(args.poll)
+            # Republish refreshed workbooks; workers that already mapped the old block keep it until they reload
+            changed = [study_id for study_id, sheet in published.items()
+                       if workbook_version(sheet.handle.workbook) != sheet.handle.workbook_version]
+            for study_id in changed:
+                old = published[study_id]
+                published[study_id] = publish_study(study_id)
+                write_manifest(list(published.values()), args.manifest)
+                old.close()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for sheet in published.values():
+            sheet.close()
+        os.remove(args.manifest)
@@ -0,0 +1,192 @@
+import re
+import pandas as pd
+import numpy as np
+from statistics import NormalDist
+from typing import Dict, Any, List, Optional, Tuple
+from banner_schema import infer_dimension
+
+MIN_BASE = 30  # Columns with fewer respondents are too small to test
+
+# Rows of a block that aren't answer proportions (bases, counts, summary statistics)
+NON_PROPORTION_ROW = re.compile(r'\b(bases?|sample size|mean|average|median|std\.?|standard (deviation|error))\b',
+                                re.IGNORECASE)
+
+
+def _row_label(df: pd.DataFrame, i: int) -> str:
+    return " ".join(str(v) for v in df.iloc[i].values if isinstance(v, str)).lower()
+
+
+def find_base_row(df: pd.DataFrame) -> Optional[int]:
+    """Return the position of the row holding base sizes (label contains 'base'), if any."""
+    for i in range(len(df)):
+        if "base" in _row_label(df, i):
+            return i
+    return None
+
+
+def find_base_rows(df: pd.DataFrame) -> List[int]:
+    """Positions of every row that isn't an answer proportion (weighted and unweighted bases, means, ...)."""
+    return [i for i in range(len(df)) if NON_PROPORTION_ROW.search(_row_label(df, i))]
+
+
+def prepare_crosstab(df: pd.DataFrame,
+                     bases: Optional[Dict[str, float]] = None,
+                     percent: Optional[bool] = None) -> Optional[Tuple[List[str], List[str], np.ndarray, np.ndarray]]:
+    """
+    Split a question table into row labels, banner columns, proportions and base sizes.
+
+    Args:
+        df: Question table (answer rows x banner columns), labels in the first text column
+        bases: Base size per banner column; read from the table's base row when omitted
+            (the unweighted base when the block has both)
+        percent: Whether values are percentages (45.0) rather than fractions (0.45);
+            judged from the answer rows when omitted
+
+    Returns:
+        (row_labels, columns, proportions[R, C], bases[C]) or None if the table can't be tested
+    """
+    numeric = df.apply(pd.to_numeric, errors="coerce")
+    value_cols = [col for col in df.columns if numeric[col].notna().any()]
+    label_cols = [col for col in df.columns if col not in value_cols]
+    if not value_cols:
+        return None
+
+    excluded = find_base_rows(df)
+    base_rows = [i for i in excluded if "base" in _row_label(df, i)]
+    if bases is not None:
+        base_values = np.array([float(bases.get(str(col).strip(), np.nan)) for col in value_cols])
+    elif base_rows:
+        # Significance is tested on the unweighted sample when the block states it
+        base_row = next((i for i in base_rows if "unweighted" in _row_label(df, i)), base_rows[0])
+        base_values = numeric.iloc[base_row][value_cols].to_numpy(dtype=float)
+    else:
+        return None
+
+    data = numeric.drop(index=df.index[excluded])
+    data = data[value_cols]
+    data = data[data.notna().any(axis=1)]
+    if data.empty:
+        return None
+
+    if label_cols:
+        labels = df.loc[data.index, label_cols[0]].fillna("").astype(str).str.strip().tolist()
+    else:
+        labels = [str(idx) for idx in data.index]
+
+    proportions = data.to_numpy(dtype=float)
+    # col% sheets hold either fractions (0.45) or percentages (45.0); only answer rows are left here
+    if percent is None:
+        percent = bool(np.nanmax(proportions) > 1.0)
+    if percent:
+        proportions = proportions / 100.0
+
+    return labels, [str(col) for col in value_cols], proportions, base_values
+
+
+def column_proportion_tests(proportions: np.ndarray, bases: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Two-proportion z-tests between every pair of banner columns for every row, in one pass.
+
+    Args:
+        proportions: Array of shape (rows, columns) with values in [0, 1]
+        bases: Array of shape (columns,) with respondent counts
+
+    Returns:
+        (diff, z) arrays of shape (rows, columns, columns); entry [r, i, j] compares column i with j
+    """
+    p_i = proportions[:, :, None]
+    p_j = proportions[:, None, :]
+    n_i = bases[None, :, None]
+    n_j = bases[None, None, :]
+
+    diff = p_i - p_j
+    pooled = (p_i * n_i + p_j * n_j) / (n_i + n_j)
+    se = np.sqrt(pooled * (1 - pooled) * (1 / n_i + 1 / n_j))
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        z = np.where(se > 0, diff / se, 0.0)
+
+    return diff, np.nan_to_num(z)
+
+
+def find_significant_differences(df: pd.DataFrame,
+                                 bases: Optional[Dict[str, float]] = None,
+                                 dimensions: Optional[Dict[str, str]] = None,
+                                 percent: Optional[bool] = None,
+                                 confidence: float = 0.95,
+                                 min_base: int = MIN_BASE,
+                                 max_results: int = 15) -> List[Dict[str, Any]]:
+    """
+    Return the statistically significant column differences in a question table, strongest first.
+
+    Only segments of the same banner dimension are compared (Male vs Female, not Male vs
+    NCCS A), and the Total column is left out: it contains every other column's respondents,
+    so the samples aren't independent.
+
+    Args:
+        df: Question table (answer rows x banner columns)
+        bases: Base size per banner column; read from the table's base row when omitted
+        dimensions: Banner dimension per column label (see BannerSchema.label_dimensions);
+            inferred from the labels when omitted
+        percent: Whether values are percentages (judged from the answer rows when omitted)
+        confidence: Confidence level for the two-sided test
+        min_base: Columns with a smaller base are left out
+        max_results: Maximum number of differences to return
+    """
+    prepared = prepare_crosstab(df, bases, percent)
+    if prepared is None:
+        return []
+
+    labels, columns, proportions, base_values = prepared
+    column_dimensions = np.array([(dimensions or {}).get(col) or infer_dimension(col) for col in columns])
+    testable = (np.nan_to_num(base_values) >= min_base) & (column_dimensions != "Total")
+    if testable.sum() < 2:
+        return []
+
+    _, z = column_proportion_tests(proportions, base_values)
+    critical = NormalDist().inv_cdf(1 - (1 - confidence) / 2)
+
+    # Keep each pair once (higher column first), only for testable columns and known values
+    valid = np.isfinite(proportions)
+    mask = (z >= critical) & valid[:, :, None] & valid[:, None, :]
+    mask &= testable[None, :, None] & testable[None, None, :]
+    mask &= (column_dimensions[:, None] == column_dimensions[None, :])[None, :, :]
+
+    rows, higher, lower = np.nonzero(mask)
+    order = np.argsort(-z[rows, higher, lower])[:max_results]
+
+    return [
+        {
+            "row": labels[rows[k]],
+            "higher": columns[higher[k]],
+            "lower": columns[lower[k]],
+            "higher_pct": round(float(proportions[rows[k], higher[k]]) * 100, 1),
+            "lower_pct": round(float(proportions[rows[k], lower[k]]) * 100, 1),
+            "z": round(float(z[rows[k], higher[k], lower[k]]), 2),
+        }
+        for k in order
+    ]
+
+
+def format_significant_differences(differences: List[Dict[str, Any]]) -> str:
+    """Format significant differences as compact prompt lines."""
+    if not differences:
+        return "No statistically significant differences between columns."
+
+    return "\n".join(
+        f"- {d['row']}: {d['higher']} {d['higher_pct']:.1f}% vs {d['lower']} {d['lower_pct']:.1f}% "
+        f"(+{d['higher_pct'] - d['lower_pct']:.1f} pts, z={d['z']:.1f})"
+        for d in differences
+    )
+
+
+# Test the engine
+if __name__ == "__main__":
+    test_df = pd.DataFrame({
+        "Option": ["Base", "Netflix", "Prime", "Hotstar"],
+        "Total": [2314, 45.0, 38.0, 52.0],
+        "Male": [1200, 50.0, 40.0, 51.0],
+        "Female": [1114, 39.6, 35.8, 53.1],
+    })
+    results = find_significant_differences(test_df)
+    print(format_significant_differences(results))
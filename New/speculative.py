@@ -0,0 +1,202 @@
+import argparse
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from checkpointing import STAGE_FAILED
+from insight_gpt_node import insight_gpt_node
+from job_scheduler import current_priority, priority_context
+from output_node import output_node
+from pdf_query_node import query_pdf_question_node
+from prompt_builder_node import prompt_builder_node
+from request_coalescing import normalize_question_key
+from save_to_doc_node import save_to_doc_node
+from table_extractor_node import table_extractor_node
+
+SPECULATION_GAP = float(os.getenv("SPECULATION_GAP", 0.02))  # Final-score gap that counts as a near tie
+MAX_SPECULATIVE = int(os.getenv("SPECULATIVE_CANDIDATES", 3))
+MAX_ALTERNATES = 256  # Alternates kept per process for re-asks
+
+# Nodes run per candidate QID; saving to a document only happens for the chosen one
+GENERATION_NODES = [("extract_table", table_extractor_node),
+                    ("build_prompt", prompt_builder_node),
+                    ("generate_insights", insight_gpt_node)]
+
+
+class Cancelled(Exception):
+    """A speculative candidate was abandoned before its next node started."""
+
+
+def near_ties(candidates: List[Dict[str, Any]], gap: float = SPECULATION_GAP,
+              limit: int = MAX_SPECULATIVE) -> List[Dict[str, Any]]:
+    """The best candidate plus any runner-ups whose final score is within gap of it."""
+    known = [c for c in candidates if c.get("question_id", "unknown") != "unknown"]
+    if not known:
+        return []
+    return [c for c in known[:limit] if known[0]["score"] - c["score"] <= gap]
+
+
+def generation_failed(state: Dict[str, Any]) -> bool:
+    return bool(state.get("error")) or any(STAGE_FAILED[name](state) for name, _ in GENERATION_NODES)
+
+
+def generate_for(state: Dict[str, Any], candidate: Dict[str, Any],
+                 cancel: Optional[threading.Event] = None) -> Dict[str, Any]:
+    """Table, prompt and insights for one candidate QID (nothing is saved)."""
+    state = {**state, "question_id": candidate["question_id"], "question_text": candidate["question_text"],
+             "match_score": candidate.get("score")}
+    for name, node in GENERATION_NODES:
+        # Checked between nodes: a running LLM call can't be aborted, but the next one needn't start
+        if cancel is not None and cancel.is_set():
+            raise Cancelled(candidate["question_id"])
+        state = node(state)
+        if state.get("error"):
+            break
+    return state
+
+
+class AlternateCache:
+    def __init__(self, max_entries: int = MAX_ALTERNATES):
+        """Generated results for runner-up QIDs, so a re-ask with the other QID returns at once."""
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, question: str, study_id: str, state: Dict[str, Any]) -> None:
+        key = (normalize_question_key(question, study_id), state["question_id"].upper())
+        with self._lock:
+            self._entries[key] = state
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, question: str, study_id: str, question_id: str) -> Optional[Dict[str, Any]]:
+        key = (normalize_question_key(question, study_id), question_id.upper())
+        with self._lock:
+            return self._entries.get(key)
+
+
+alternates = AlternateCache()
+
+
+def summarize_alternate(state: Dict[str, Any]) -> Dict[str, Any]:
+    return {key: state.get(key) for key in ("question_id", "question_text", "match_score", "insights")}
+
+
+def answer_speculatively(question: str, study_id: Optional[str] = None,
+                         gap: float = SPECULATION_GAP, limit: int = MAX_SPECULATIVE,
+                         keep_alternates: bool = True) -> Dict[str, Any]:
+    """
+    Answer a question, generating for near-tied QID matches in parallel.
+
+    When the top candidates' scores are within gap, table extraction, prompt building and
+    insight generation start for all of them at once. The best-ranked candidate that
+    succeeds is saved and returned as soon as it is done; a failed pick falls through to
+    the next one without a rerun. Runner-ups either finish in the background and are kept
+    as alternates (for answer_with_question_id), or are stopped before their next node.
+
+    Args:
+        question: User question
+        study_id: Registered study (routed from the question if None)
+        gap: Final-score gap below which candidates count as tied
+        limit: Most candidates to generate for
+        keep_alternates: Keep runner-ups' results instead of cancelling them
+    """
+    state = query_pdf_question_node({"question": question, "study_id": study_id})
+    question, study_id = state["question"], state["study_id"]
+    tied = near_ties(state.get("question_candidates", []), gap, limit)
+
+    if len(tied) < 2:
+        # Nothing to speculate on: the usual sequential pipeline
+        chosen = state
+        if state.get("question_id", "unknown") != "unknown":
+            chosen = generate_for(state, tied[0] if tied else {"question_id": state["question_id"],
+                                                               "question_text": state["question_text"]})
+        return output_node(save_to_doc_node(chosen))
+
+    print(f"\nSpeculating on {len(tied)} near-tied questions: "
+          + ", ".join(f"{c['question_id']} ({c['score']:.3f})" for c in tied))
+    start = time.perf_counter()
+    cancel = threading.Event()
+    pool = ThreadPoolExecutor(max_workers=len(tied), thread_name_prefix="speculative")
+    # Priority is per thread; candidates' OpenAI calls keep the caller's class
+    priority = current_priority()
+
+    def generate_with_priority(candidate):
+        with priority_context(priority):
+            return generate_for(state, candidate, cancel)
+
+    futures = [pool.submit(generate_with_priority, candidate) for candidate in tied]
+
+    def keep(future):
+        # Runner-ups finishing after the answer was returned are kept for re-asks
+        if not future.cancelled() and future.exception() is None and not generation_failed(future.result()):
+            alternates.put(question, study_id, future.result())
+
+    chosen = None
+    for candidate, future in zip(tied, futures):
+        # In rank order: the best candidate's result is used the moment it is ready
+        result = future.result()
+        if not generation_failed(result):
+            chosen = result
+            break
+        print(f"Speculative candidate {candidate['question_id']} failed; using the next one")
+
+    finished = [f.result() for f in futures if f.done() and not generation_failed(f.result())]
+    if keep_alternates:
+        for future in futures:
+            future.add_done_callback(keep)
+    else:
+        cancel.set()
+    pool.shutdown(wait=False, cancel_futures=True)
+
+    if chosen is None:
+        print("Every speculative candidate failed")
+        chosen = futures[0].result()
+    print(f"Speculative answer for {chosen['question_id']} ready in {time.perf_counter() - start:.2f}s")
+
+    final_state = save_to_doc_node(chosen)
+    final_state["alternates"] = [summarize_alternate(s) for s in finished if s is not chosen]
+    final_state["speculated_question_ids"] = [c["question_id"] for c in tied]
+    return output_node(final_state)
+
+
+def answer_with_question_id(question: str, question_id: str, study_id: Optional[str] = None,
+                            question_text: str = "") -> Dict[str, Any]:
+    """Re-ask a question against a specific QID, reusing a speculative alternate when one was kept."""
+    from study_registry import get_registry
+
+    study_id, question = get_registry().route(question) if study_id is None else (study_id, question)
+    cached = alternates.get(question, study_id, question_id)
+    if cached is not None:
+        print(f"\nUsing speculative alternate for {question_id}")
+        return output_node(save_to_doc_node(cached))
+
+    if not question_text:
+        try:
+            from aggregate_cube import get_cube
+            question_text = get_cube(study_id).question_texts.get(question_id.upper(), "")
+        except Exception as e:
+            print(f"Question text not found for {question_id}: {e}")
+
+    state = {"question": question, "study_id": study_id}
+    return output_node(save_to_doc_node(generate_for(state, {"question_id": question_id,
+                                                             "question_text": question_text or question_id})))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Answer a question with speculative generation for near-tied QIDs.")
+    parser.add_argument("question")
+    parser.add_argument("--study", default=None, help="Registered study ID (routed from the question if omitted)")
+    parser.add_argument("--gap", type=float, default=SPECULATION_GAP, help="Score gap that counts as a tie")
+    parser.add_argument("--limit", type=int, default=MAX_SPECULATIVE, help="Most candidates to generate for")
+    parser.add_argument("--cancel-alternates", action="store_true", help="Stop runner-ups once an answer is ready")
+    args = parser.parse_args()
+
+    result = answer_speculatively(args.question, args.study, gap=args.gap, limit=args.limit,
+                                  keep_alternates=not args.cancel_alternates)
+    for alternate in result.get("alternates", []):
+        print(f"\nAlternate {alternate['question_id']} (score {alternate['match_score']:.3f}):\n{alternate['insights']}")
@@ -0,0 +1,103 @@
+import json
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+from openai_scheduler import get_scheduler
+
+# json_schema response formats need a model that supports structured outputs
+STRUCTURED_MODEL = os.getenv("OPENAI_STRUCTURED_MODEL", "gpt-4o")
+TOKENS_PER_ITEM = 80  # One or two sentences per insight / recommendation
+RESPONSE_OVERHEAD = 40  # JSON keys, brackets and quoting
+
+
+def build_insight_schema(num_insights: int, num_recommendations: int) -> Dict[str, Any]:
+    """JSON schema for an insights + recommendations response."""
+    return {
+        "type": "object",
+        "properties": {
+            "insights": {
+                "type": "array",
+                "description": f"Exactly {num_insights} concise, data-driven insights",
+                "items": {"type": "string"}
+            },
+            "recommendations": {
+                "type": "array",
+                "description": f"Exactly {num_recommendations} actionable recommendations",
+                "items": {"type": "string"}
+            }
+        },
+        "required": ["insights", "recommendations"],
+        "additionalProperties": False
+    }
+
+
+def response_format(num_insights: int, num_recommendations: int) -> Dict[str, Any]:
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": "insight_report",
+            "strict": True,
+            "schema": build_insight_schema(num_insights, num_recommendations)
+        }
+    }
+
+
+def max_tokens_for(num_insights: int, num_recommendations: int) -> int:
+    """Output token cap sized to the number of requested items."""
+    return (num_insights + num_recommendations) * TOKENS_PER_ITEM + RESPONSE_OVERHEAD
+
+
+def parse_structured_insights(content: str, num_insights: int,
+                              num_recommendations: int) -> Tuple[List[str], List[str]]:
+    """Parse a structured response, raising ValueError if it doesn't fit the schema."""
+    return parse_insight_items(json.loads(content), num_insights, num_recommendations)
+
+
+def parse_insight_items(data: Dict[str, Any], num_insights: int,
+                        num_recommendations: int) -> Tuple[List[str], List[str]]:
+    """Pull trimmed insight and recommendation lists out of a decoded response object."""
+    insights = [str(i).strip() for i in data.get("insights", []) if str(i).strip()]
+    recommendations = [str(r).strip() for r in data.get("recommendations", []) if str(r).strip()]
+    if not insights or not recommendations:
+        raise ValueError("Structured response is missing insights or recommendations")
+    return insights[:num_insights], recommendations[:num_recommendations]
+
+
+def format_insights(insights: List[str], recommendations: List[str]) -> str:
+    """Render parsed items in the same layout as extract_insights_and_recommendations."""
+    insight_lines = "\n".join(f"{i}. {text}" for i, text in enumerate(insights, start=1))
+    recommendation_lines = "\n".join(f"{i}. {text}" for i, text in enumerate(recommendations, start=1))
+    return f"**Insights:**\n\n{insight_lines}\n\n**Recommendations:**\n\n{recommendation_lines}"
+
+
+def generate_structured_insights(client, prompt: str,
+                                 num_insights: int = 3,
+                                 num_recommendations: int = 2,
+                                 system_prompt: str = "You are an expert market research analyst.",
+                                 temperature: float = 0.7) -> Optional[str]:
+    """
+    Ask for insights as schema-constrained JSON with a bounded output length.
+
+    Returns:
+        Formatted insights, or None if the model/API can't produce a valid structured
+        response (callers then fall back to free-form generation)
+    """
+    try:
+        response = get_scheduler().chat(
+            client,
+            model=STRUCTURED_MODEL,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=temperature,
+            max_tokens=max_tokens_for(num_insights, num_recommendations),
+            response_format=response_format(num_insights, num_recommendations)
+        )
+        content = response.choices[0].message.content
+        insights, recommendations = parse_structured_insights(content or "", num_insights, num_recommendations)
+        return format_insights(insights, recommendations)
+
+    except Exception as e:
+        print(f"Structured output unavailable, falling back to free-form: {e}")
+        return None
@@ -0,0 +1,236 @@
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from table_extractor import TableExtractor
+from prompt_builder import PromptBuilder
+from shared_tables import attach_cached, find_handle
+
+DEFAULT_STUDY_ID = "default"
+DEFAULT_REGISTRY_PATH = "Data/studies.json"
+DEFAULT_MAX_LOADED = 32
+
+# Explicit study tags at the start of a question, e.g. "[ott_2024] Which apps..." or "ott_2024: Which apps..."
+STUDY_TAG_PATTERN = re.compile(r'^\s*(?:\[(?P<bracket>[\w.-]+)\]|(?P<prefix>[\w.-]+):)\s*')
+
+
+@dataclass
+class StudyConfig:
+    """Everything needed to answer questions for one study."""
+    study_id: str
+    workbook: str
+    namespace: str = "default"
+    brand_name: Optional[str] = None
+    study_context: Optional[str] = None
+    base_size: Optional[int] = None  # Fallback when a question's base isn't in the workbook's counts sheet
+    sheet_name: str = "col%"
+    # Other sheets by kind when their names aren't the usual ones, e.g. {"counts": "Frequencies"}
+    sheets: Dict[str, str] = field(default_factory=dict)
+    aliases: List[str] = field(default_factory=list)
+    # Default retrieval filters, e.g. {"qid_prefixes": ["Q10", "Q11"], "sections": ["B"]}
+    retrieval_filters: Dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass
+class StudyAssets:
+    """Loaded (and therefore memory-holding) objects for a study."""
+    config: StudyConfig
+    extractor: TableExtractor
+    prompt_builder: PromptBuilder
+
+
+def default_study() -> StudyConfig:
+    """The single study the pipeline used before the registry existed."""
+    return StudyConfig(
+        study_id=DEFAULT_STUDY_ID,
+        workbook="Data/raw data/Tables.xlsx",
+        namespace="default",
+        brand_name="SonyLiv",
+        study_context="OTT platform usage & brand preference",
+    )
+
+
+class StudyRegistry:
+    def __init__(self, studies: Optional[List[StudyConfig]] = None,
+                 default_study_id: str = DEFAULT_STUDY_ID,
+                 max_loaded: int = DEFAULT_MAX_LOADED):
+        """
+        Map study IDs to their workbook, questionnaire namespace and context.
+
+        Args:
+            studies: Study configurations to register
+            default_study_id: Study used when a question carries no study hint
+            max_loaded: How many studies may hold loaded assets at once (LRU bound)
+        """
+        if max_loaded < 1:
+            raise ValueError("max_loaded must be at least 1")
+
+        self.default_study_id = default_study_id
+        self.max_loaded = max_loaded
+        self._studies: Dict[str, StudyConfig] = {}
+        self._loaded: "OrderedDict[str, StudyAssets]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        for study in studies or []:
+            self.register(study)
+
+    @classmethod
+    def from_json(cls, path: str, max_loaded: int = DEFAULT_MAX_LOADED) -> "StudyRegistry":
+        """
+        Build a registry from a JSON file shaped like:
+            {"default_study": "ott_2024",
+             "studies": [{"study_id": "ott_2024", "workbook": "...", "namespace": "...", ...}]}
+        """
+        with open(path, "r", encoding="utf-8") as f:
+            raw = json.load(f)
+
+        studies = [StudyConfig(**entry) for entry in raw.get("studies", [])]
+        default_id = raw.get("default_study") or (studies[0].study_id if studies else DEFAULT_STUDY_ID)
+        return cls(studies, default_study_id=default_id, max_loaded=max_loaded)
+
+    def register(self, study: StudyConfig) -> None:
+        """Add or replace a study. Replacing drops any loaded assets for it."""
+        with self._lock:
+            self._studies[study.study_id] = study
+            self._loaded.pop(study.study_id, None)
+
+    def study_ids(self) -> List[str]:
+        return list(self._studies)
+
+    def get(self, study_id: Optional[str] = None) -> StudyConfig:
+        """Return the configuration for a study (the default study if none is given)."""
+        study_id = study_id or self.default_study_id
+        if study_id not in self._studies:
+            raise ValueError(f"Unknown study '{study_id}'. Registered studies: {self.study_ids()}")
+        return self._studies[study_id]
+
+    def route(self, question: str) -> Tuple[str, str]:
+        """
+        Work out which study a question belongs to.
+
+        An explicit tag ("[study_id] ..." or "study_id: ...") wins, then any registered
+        alias mentioned in the question, then the default study.
+
+        Returns:
+            Tuple[str, str]: (study_id, question with any study tag removed)
+        """
+        tag = STUDY_TAG_PATTERN.match(question or "")
+        if tag:
+            tagged_id = tag.group("bracket") or tag.group("prefix")
+            if tagged_id in self._studies:
+                return tagged_id, question[tag.end():].strip()
+
+        question_lower = (question or "").lower()
+        for study in self._studies.values():
+            for alias in [study.study_id] + study.aliases:
+                if re.search(rf'\b{re.escape(alias.lower())}\b', question_lower):
+                    return study.study_id, question
+
+        return self.default_study_id, question
+
+    def assets(self, study_id: Optional[str] = None) -> StudyAssets:
+        """Return loaded assets for a study, loading them on first use and evicting the least recently used."""
+        config = self.get(study_id)
+
+        with self._lock:
+            if config.study_id in self._loaded:
+                self._loaded.move_to_end(config.study_id)
+                return self._loaded[config.study_id]
+
+        # Load outside the lock so a slow workbook doesn't block other studies
+        extractor = TableExtractor(config.workbook)
+        extractor.sheets = dict(config.sheets)
+        handle = find_handle(config.workbook, config.sheet_name, workbook_version(config.workbook))
+        shared = None
+        if handle is not None:
+            # A loader process has published this sheet; map it instead of parsing a private copy
+            try:
+                shared = attach_cached(handle)
+            except OSError as e:
+                # The publisher exited or republished since the manifest was read
+                print(f" Could not attach shared sheet {handle.shm_name} ({e}); reading the workbook instead")
+        if shared is not None:
+            extractor.attach_shared(shared)
+        else:
+            extractor.load_excel(config.sheet_name)
+        loaded = StudyAssets(
+            config=config,
+            extractor=extractor,
+            prompt_builder=PromptBuilder(config.brand_name, config.study_context),
+        )
+
+        with self._lock:
+            # Another thread may have loaded the same study meanwhile; keep the first one
+            existing = self._loaded.get(config.study_id)
+            if existing is not None:
+                self._loaded.move_to_end(config.study_id)
+                return existing
+
+            self._loaded[config.study_id] = loaded
+            while len(self._loaded) > self.max_loaded:
+                evicted_id, _ = self._loaded.popitem(last=False)
+                print(f"Evicted study assets: {evicted_id}")
+
+        return loaded
+
+    def unload(self, study_id: Optional[str] = None) -> None:
+        """Drop a study's loaded assets so the next request re-reads its workbook."""
+        with self._lock:
+            self._loaded.pop(self.get(study_id).study_id, None)
+
+    def loaded_study_ids(self) -> List[str]:
+        """Studies currently holding loaded assets, least recently used first."""
+        with self._lock:
+            return list(self._loaded)
+
+
+_version_cache: Dict[Tuple[str, int, int], str] = {}
+
+
+def workbook_version(path: str) -> str:
+    """Content hash of a workbook, recomputed only when its size or modification time changes."""
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+    if key not in _version_cache:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        _version_cache[key] = digest.hexdigest()[:16]
+    return _version_cache[key]
+
+
+_registry: Optional[StudyRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> StudyRegistry:
+    """
+    Return the process-wide registry.
+
+    Loaded from STUDY_REGISTRY_PATH (default Data/studies.json) when that file exists,
+    otherwise it only knows the original single study.
+    """
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            path = os.getenv("STUDY_REGISTRY_PATH", DEFAULT_REGISTRY_PATH)
+            max_loaded = int(os.getenv("STUDY_CACHE_SIZE", DEFAULT_MAX_LOADED))
+            if os.path.exists(path):
+                _registry = StudyRegistry.from_json(path, max_loaded=max_loaded)
+                print(f"Loaded {len(_registry.study_ids())} studies from {path}")
+            else:
+                _registry = StudyRegistry([default_study()], max_loaded=max_loaded)
+        return _registry
+
+
+if __name__ == "__main__":
+    registry = get_registry()
+    print("Registered studies:", registry.study_ids())
+    for question in ["Which OTT apps are used most?", "[default] Top streaming apps by usage"]:
+        print(question, "->", registry.route(question))
@@ -0,0 +1,214 @@
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, List, Optional
+
+from insight_generator import InsightGenerator
+from job_scheduler import PRIORITY_CLASSES, priority_context
+from question_packer import MAX_QUESTIONS_PER_PACK, pack_questions, run_pack
+from report_sinks import get_sink
+
+DEFAULT_PROGRESS_DIR = "Data/sweeps"
+
+
+def load_progress(progress_path: str) -> Dict[str, Dict[str, Any]]:
+    """Return the latest progress record per QID from a JSONL progress file."""
+    progress = {}
+    if not os.path.exists(progress_path):
+        return progress
+
+    with open(progress_path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A sweep killed mid-write can leave a partial last line
+                continue
+            progress[record["qid"]] = record
+    return progress
+
+
+class ProgressLog:
+    def __init__(self, progress_path: str):
+        """Append-only JSONL log of finished questions, safe to write from worker threads."""
+        self.progress_path = progress_path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(progress_path) or ".", exist_ok=True)
+
+    def record(self, entry: Dict[str, Any]) -> None:
+        with self._lock:
+            with open(self.progress_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+
+def run_sweep(study_id: Optional[str] = None,
+              workers: int = 4,
+              progress_path: Optional[str] = None,
+              question_ids: Optional[List[str]] = None,
+              num_insights: int = 3,
+              num_recommendations: int = 2,
+              restart: bool = False,
+              pack_tokens: Optional[int] = None,
+              sink: Optional[str] = None,
+              output: Optional[str] = None,
+              combined: bool = False,
+              priority: str = "batch") -> Dict[str, Any]:
+    """
+    Generate insights for every question in a study's workbook across a worker pool.
+
+    Args:
+        study_id: Registered study to sweep (default study if None)
+        workers: Number of questions processed concurrently
+        progress_path: JSONL file recording finished questions (resumed if it exists)
+        question_ids: Restrict the sweep to these QIDs (default: every QID in the sheet)
+        num_insights: Number of insights per question
+        num_recommendations: Number of recommendations per question
+        restart: Ignore existing progress and sweep everything again
+        pack_tokens: Pack several small questions into one request up to this many prompt tokens
+        sink: Report sink (gdocs, docx, markdown, html; default from REPORT_SINK)
+        output: Report directory, or the combined document path
+        combined: Write every report of the sweep into one document
+        priority: Job class of the sweep's OpenAI calls (batch calls yield to interactive questions)
+
+    Returns:
+        Summary with counts, elapsed time and throughput
+    """
+    generator = InsightGenerator()
+    generator.setup_study(study_id)
+    generator.sink = get_sink(sink, output, combined)
+
+    study_name = study_id or "default"
+    progress_path = progress_path or os.path.join(DEFAULT_PROGRESS_DIR, f"{study_name}_progress.jsonl")
+    if restart and os.path.exists(progress_path):
+        os.remove(progress_path)
+
+    all_qids = question_ids or generator.extractor.list_question_ids()
+    previous = {qid: rec for qid, rec in load_progress(progress_path).items() if rec.get("status") == "done"}
+    done = set(previous)
+    if combined:
+        # A resumed sweep's combined document still covers the questions finished earlier
+        for qid in done & set(all_qids):
+            generator.sink.write(qid, previous[qid].get("question_text", ""), previous[qid]["insights"])
+    pending = [qid for qid in all_qids if qid not in done]
+
+    print(f"\nSweep for study '{study_name}': {len(all_qids)} questions, "
+          f"{len(done & set(all_qids))} already done, {len(pending)} to run with {workers} workers")
+
+    log = ProgressLog(progress_path)
+
+    def process(qid: str) -> Dict[str, Any]:
+        start = time.perf_counter()
+        try:
+            question_text, insights, url = generator.generate_insights(qid, num_insights, num_recommendations)
+            entry = {"qid": qid, "status": "done", "question_text": question_text,
+                     "insights": insights, "doc_url": url}
+        except Exception as e:
+            entry = {"qid": qid, "status": "failed", "error": str(e)}
+        entry["seconds"] = round(time.perf_counter() - start, 2)
+        entry["finished_at"] = time.time()
+        log.record(entry)
+        return entry
+
+    def process_pack(pack: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        start = time.perf_counter()
+        results = run_pack(generator, pack, num_insights, num_recommendations)
+        # Requests are shared, so each question gets an equal share of the pack's time
+        seconds = round((time.perf_counter() - start) / len(pack), 2)
+        entries = []
+        for qid, result in results.items():
+            if isinstance(result, Exception):
+                entry = {"qid": qid, "status": "failed", "error": str(result)}
+            else:
+                question_text, insights, url = result
+                entry = {"qid": qid, "status": "done", "question_text": question_text,
+                         "insights": insights, "doc_url": url}
+            entry.update({"seconds": seconds, "packed_with": len(pack), "finished_at": time.time()})
+            log.record(entry)
+            entries.append(entry)
+        return entries
+
+    def prepare(qid: str) -> Dict[str, Any]:
+        try:
+            return generator.prepare_question(qid)
+        except Exception as e:
+            entry = {"qid": qid, "status": "failed", "error": str(e), "seconds": 0.0, "finished_at": time.time()}
+            log.record(entry)
+            return entry
+
+    def in_class(fn, *args):
+        with priority_context(priority):
+            return fn(*args)
+
+    counts = {"done": 0, "failed": 0}
+
+    def report(entry: Dict[str, Any]) -> None:
+        counts[entry["status"]] += 1
+        print(f"[{sum(counts.values())}/{len(pending)}] {entry['qid']}: {entry['status']} ({entry['seconds']}s)")
+
+    sweep_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        if pack_tokens:
+            # Tables must be extracted before their token sizes (and so the packs) are known
+            prepared = list(pool.map(lambda qid: in_class(prepare, qid), pending))
+            for entry in (p for p in prepared if p.get("status") == "failed"):
+                report(entry)
+            packs = pack_questions([p for p in prepared if "status" not in p], pack_tokens, MAX_QUESTIONS_PER_PACK)
+            print(f"Packed {sum(len(p) for p in packs)} questions into {len(packs)} requests")
+            futures = {pool.submit(in_class, process_pack, pack): pack for pack in packs}
+        else:
+            futures = {pool.submit(in_class, process, qid): qid for qid in pending}
+
+        for future in as_completed(futures):
+            result = future.result()
+            for entry in (result if isinstance(result, list) else [result]):
+                report(entry)
+    generator.sink.flush()
+    elapsed = time.perf_counter() - sweep_start
+    completed, failed = counts["done"], counts["failed"]
+
+    summary = {
+        "study_id": study_name,
+        "total_questions": len(all_qids),
+        "skipped": len(all_qids) - len(pending),
+        "completed": completed,
+        "failed": failed,
+        "elapsed_seconds": round(elapsed, 2),
+        "questions_per_minute": round((completed + failed) / elapsed * 60, 2) if elapsed > 0 else 0.0,
+        "progress_path": progress_path,
+        "batches": len(futures)
+    }
+
+    print("\nSweep Summary")
+    print("=========================")
+    for key, value in summary.items():
+        print(f"{key}: {value}")
+
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate insights for every question in a study workbook.")
+    parser.add_argument("--study", default=None, help="Registered study ID (default study if omitted)")
+    parser.add_argument("--workers", type=int, default=4, help="Questions processed concurrently")
+    parser.add_argument("--progress", default=None, help="Progress file to write and resume from")
+    parser.add_argument("--restart", action="store_true", help="Ignore previous progress")
+    parser.add_argument("--pack-tokens", type=int, default=None,
+                        help="Pack small questions into shared requests up to this many prompt tokens")
+    parser.add_argument("--sink", default=None, help="Report sink: gdocs, docx, markdown or html")
+    parser.add_argument("--output", default=None, help="Report directory, or document path with --combined")
+    parser.add_argument("--combined", action="store_true", help="Write all reports into one document")
+    parser.add_argument("--priority", default="batch", choices=list(PRIORITY_CLASSES),
+                        help="Job class of the sweep's OpenAI calls")
+    args = parser.parse_args()
+
+    run_sweep(study_id=args.study, workers=args.workers, progress_path=args.progress, restart=args.restart,
+              pack_tokens=args.pack_tokens, sink=args.sink, output=args.output, combined=args.combined,
+              priority=args.priority)
@@ -1,72 +1,342 @@
 import pandas as pd
 import os
+import re
+import threading
+from openpyxl import load_workbook
+from typing import Dict, Optional
+from banner_schema import MAX_HEADER_ROWS, BannerSchema, cell_label, is_header_row, parse_banner
+from significance import find_base_row
+from table_serializers import serialize_table
+
+# A question block starts with a row whose first non-empty cell begins with a question ID (e.g. "Q10.1 ...")
+QUESTION_ROW_PATTERN = re.compile(r'^\s*Q\d+(?:\.\d+)*\b', re.IGNORECASE)
+
+# Other views of the same tables, found by sheet name (case-insensitive) unless a study names them
+SHEET_ALIASES = {
+    "col%": ["col%", "col %", "column%", "column %"],
+    "row%": ["row%", "row %", "row pct"],
+    "counts": ["counts", "count", "frequencies", "n"],
+    "unweighted": ["unweighted bases", "unweighted base", "unweighted", "unwtd bases", "unwtd"],
+}
+
+def is_question_row(values) -> bool:
+    """Check whether a row of cell values starts a new question block."""
+    for cell in values:
+        if cell is None or (isinstance(cell, float) and pd.isna(cell)) or str(cell).strip() == "":
+            continue
+        return bool(QUESTION_ROW_PATTERN.match(str(cell)))
+    return False
+
+def question_id_of(values) -> str:
+    """Return the question ID that starts a question row."""
+    first_cell = next(str(cell) for cell in values if pd.notna(cell) and str(cell).strip())
+    return QUESTION_ROW_PATTERN.match(first_cell).group(0).strip()
+
+def mentions_question(row_text: str, question_id: str) -> bool:
+    """Check whether row text mentions a question ID as a whole ID (so "Q1" doesn't match "Q10.1")."""
+    return re.search(rf'(?<![\w.]){re.escape(question_id.lower())}(?!\.?\d)', row_text.lower()) is not None
 
 class TableExtractor:
-    def __init__(self, filepath: str):
+    def __init__(self, filepath: str, streaming: bool = False):
+        """
+        Args:
+            filepath: Path to the tables workbook
+            streaming: Scan rows through a read-only worksheet instead of parsing the whole sheet
+        """
         self.filepath = filepath
         self.excel = None
+        self.workbook = None
+        self.streaming = streaming
         self.sheet_name = "col%"  # Default sheet name
+        self.sheets = {}  # Sheet names by kind (see SHEET_ALIASES) where a workbook uses unusual names
+        self._frames = {}  # Parsed sheets, each parsed on first use and reused for later questions
+        self._bases = {}  # Base sizes by (kind, question ID)
+        self._banners = {}  # Banner schemas by flattened header, parsed once per distinct banner
+        self.shared = None  # SharedSheet attached from another process's published copy
+        self._lock = threading.Lock()
+
+    def attach_shared(self, shared_sheet) -> None:
+        """Read the sheet from a shared-memory copy (see shared_tables) instead of parsing it here."""
+        self.shared = shared_sheet
+        self.sheet_name = shared_sheet.handle.sheet_name
+        print(f" Attached shared sheet '{self.sheet_name}' of {self.filepath} ({shared_sheet.num_rows} rows)")
 
     def load_excel(self, sheet_name: str = None):
         """Load the Excel file and optionally override the default sheet name."""
         if not os.path.exists(self.filepath):
             raise FileNotFoundError(f"File not found: {self.filepath}")
 
-        self.excel = pd.ExcelFile(self.filepath)
+        if self.streaming:
+            # Read-only mode only reads sheet metadata here; rows are streamed on demand
+            self.workbook = load_workbook(self.filepath, read_only=True, data_only=True)
+            sheet_names = self.workbook.sheetnames
+        else:
+            self.excel = pd.ExcelFile(self.filepath)
+            sheet_names = self.excel.sheet_names
         print(f" Excel file loaded: {self.filepath}")
-        print(" Sheets available:", self.excel.sheet_names)
+        print(" Sheets available:", sheet_names)
 
         if sheet_name:
-            if sheet_name not in self.excel.sheet_names:
+            if sheet_name not in sheet_names:
                 raise ValueError(f"Sheet '{sheet_name}' not found in Excel file.")
             self.sheet_name = sheet_name  # Override default
 
-    def extract_question_table(self, question_id: str, window_size: int = 25) -> tuple:
+    def sheet_names(self) -> list:
+        """Sheet names of the workbook (from its metadata; no sheet is parsed)."""
+        if self.workbook is not None:
+            return self.workbook.sheetnames
+        return self._open_excel().sheet_names
+
+    def resolve_sheet(self, kind: str) -> Optional[str]:
+        """Name of the sheet holding a kind of table ("counts", "row%", "unweighted", ...), or None."""
+        if kind in self.sheets:
+            return self.sheets[kind]
+        names = {name.strip().lower(): name for name in self.sheet_names()}
+        for alias in SHEET_ALIASES.get(kind, [kind]):
+            if alias in names:
+                return names[alias]
+        return None
+
+    def _open_excel(self) -> pd.ExcelFile:
+        """Open the workbook for parsing, for extractors that attached or streamed their main sheet."""
+        with self._lock:
+            if self.excel is None:
+                self.excel = pd.ExcelFile(self.filepath)
+            return self.excel
+
+    def extract_question_table(self, question_id: str, window_size: int = 25, sheet_name: str = None) -> tuple:
         """
         Extract a block of rows under a specific question ID (like Q10.1).
         Returns (question_text, DataFrame)
+
+        Args:
+            question_id: Question ID
+            window_size: Most rows read under the question row
+            sheet_name: Another sheet of the workbook (default: the loaded one); it is parsed
+                on first use and cached alongside the others
         """
+        sheet_name = sheet_name or self.sheet_name
+        if sheet_name == self.sheet_name and self.shared is not None:
+            return self._shared_question_table(question_id, window_size)
+        if self.streaming:
+            return self.scan_question_table(question_id, window_size, sheet_name)
+
+        if sheet_name != self.sheet_name:
+            # Only the main sheet is shared between processes; other sheets are parsed here
+            self._open_excel()
         if self.excel is None:
             raise ValueError("Excel file not loaded. Call load_excel() first.")
 
-        df = self.excel.parse(self.sheet_name, header=None)
-        print(f"\n Searching for question ID: {question_id} in sheet '{self.sheet_name}'...")
+        df = self._load_sheet(sheet_name)
+        print(f"\n Searching for question ID: {question_id} in sheet '{sheet_name}'...")
 
         # Find the row containing the question ID
         start_row = None
         for i in range(len(df)):
             row_text = " ".join(str(cell) for cell in df.iloc[i].values if pd.notna(cell)).lower()
-            if question_id.lower() in row_text:
+            if mentions_question(row_text, question_id):
                 start_row = i
                 break
 
+        if start_row is None:
+            raise ValueError(f" Question ID '{question_id}' not found in sheet '{sheet_name}'.")
+
+        print(f" Found question at row {start_row}:  {row_text[:100]}...")
+
+        # Extract a window of rows under the question, stopping where the next question begins
+        end_row = min(start_row + 1 + window_size, len(df))
+        for i in range(start_row + 1, end_row):
+            if is_question_row(df.iloc[i].values):
+                end_row = i
+                break
+        table_data = df.iloc[start_row + 1 : end_row]
+
+        return row_text.strip(), self._promote_header(table_data)
+
+    def scan_question_table(self, question_id: str, window_size: int = 25, sheet_name: str = None) -> tuple:
+        """
+        Stream rows through a read-only worksheet and materialize only the question's block.
+        Stops reading as soon as the block ends, so memory stays flat whatever the sheet size.
+        Returns (question_text, DataFrame)
+        """
+        if self.workbook is None:
+            raise ValueError("Excel file not loaded. Call load_excel() first.")
+
+        sheet_name = sheet_name or self.sheet_name
+        worksheet = self.workbook[sheet_name]
+        print(f"\n Scanning for question ID: {question_id} in sheet '{sheet_name}'...")
+
+        row_text = None
+        block = []
+        # Read-only worksheets share one file handle, so scans run one at a time
+        with self._lock:
+            for row in worksheet.iter_rows(values_only=True):
+                if row_text is None:
+                    text = " ".join(str(cell) for cell in row if cell is not None).lower()
+                    if mentions_question(text, question_id):
+                        row_text = text
+                    continue
+
+                # Early exit: the block ends at the next question or after the window
+                if len(block) >= window_size or is_question_row(row):
+                    break
+                block.append(row)
+
+        if row_text is None:
+            raise ValueError(f" Question ID '{question_id}' not found in sheet '{sheet_name}'.")
+
+        print(f" Found question:  {row_text[:100]}...")
+
+        return row_text.strip(), self._promote_header(pd.DataFrame(block))
+
+    def _shared_question_table(self, question_id: str, window_size: int = 25) -> tuple:
+        """Locate the block through the shared sheet's question index and copy out only its rows."""
+        shared = self.shared
+        print(f"\n Searching for question ID: {question_id} in shared sheet '{self.sheet_name}'...")
+        start_row = shared.find_question(question_id)
         if start_row is None:
             raise ValueError(f" Question ID '{question_id}' not found in sheet '{self.sheet_name}'.")
 
+        row_text = shared.row_text(start_row)
         print(f" Found question at row {start_row}:  {row_text[:100]}...")
 
-        # Extract a window of rows under the question
-        table_data = df.iloc[start_row + 1 : start_row + 1 + window_size]
+        end_row = min(start_row + 1 + window_size, shared.num_rows)
+        following = shared.question_rows()
+        following = following[following > start_row]
+        if len(following) and following[0] < end_row:
+            end_row = int(following[0])
+
+        return row_text.strip(), self._promote_header(shared.rows(start_row + 1, end_row))
+
+    def base_sizes(self, question_id: str, kind: str = "counts") -> Optional[Dict[str, float]]:
+        """
+        Base size per banner column for a question, from the base row of its block in the
+        counts sheet (or another kind, e.g. "unweighted"). The sheet is only parsed when a
+        base is first asked for. None when the workbook has no such sheet or base row.
+        """
+        key = (kind, question_id.strip().upper())
+        if key in self._bases:
+            return self._bases[key]
+
+        bases = None
+        sheet = self.resolve_sheet(kind)
+        if sheet is not None:
+            try:
+                _, table = self.extract_question_table(question_id, sheet_name=sheet)
+                base_row = find_base_row(table)
+                if base_row is not None:
+                    values = pd.to_numeric(table.iloc[base_row], errors="coerce")
+                    bases = {cell_label(col): float(value) for col, value in zip(table.columns[1:], values.iloc[1:])
+                             if pd.notna(value)} or None
+            except ValueError as e:
+                print(f" No {kind} bases for {question_id}: {e}")
+        self._bases[key] = bases
+        return bases
+
+    def total_base(self, question_id: str, kind: str = "counts") -> Optional[int]:
+        """Respondents who answered a question (the Total column's base), or None if unknown."""
+        bases = self.base_sizes(question_id, kind)
+        if not bases:
+            return None
+        total = next((value for label, value in bases.items() if label.lower() == "total"), next(iter(bases.values())))
+        return int(round(total))
+
+    def _iter_rows(self, predicate=None):
+        """Yield sheet rows as tuples (optionally only those matching predicate), in any mode."""
+        if self.shared is not None:
+            return (row for row in self.shared.iter_rows() if predicate is None or predicate(row))
+        if self.streaming:
+            if self.workbook is None:
+                raise ValueError("Excel file not loaded. Call load_excel() first.")
+            with self._lock:
+                rows = [row for row in self.workbook[self.sheet_name].iter_rows(values_only=True)
+                        if predicate is None or predicate(row)]
+        else:
+            if self.excel is None:
+                raise ValueError("Excel file not loaded. Call load_excel() first.")
+            rows = [row for row in self._load_sheet(self.sheet_name).itertuples(index=False)
+                    if predicate is None or predicate(row)]
+        return iter(rows)
+
+    def list_question_ids(self) -> list:
+        """List the question IDs that start a block in the sheet, in sheet order."""
+        question_ids = []
+        for row in self._iter_rows(is_question_row):
+            qid = question_id_of(row)
+            if qid not in question_ids:
+                question_ids.append(qid)
+        return question_ids
+
+    def iter_question_blocks(self):
+        """Yield (question_id, question_text, table) for every question block in the sheet."""
+        qid, text, block = None, None, []
+        for row in self._iter_rows():
+            if is_question_row(row):
+                if qid is not None:
+                    yield qid, text, self._promote_header(pd.DataFrame(block))
+                qid = question_id_of(row)
+                text = " ".join(str(cell) for cell in row if pd.notna(cell)).strip()
+                block = []
+            elif qid is not None:
+                block.append(row)
+
+        if qid is not None:
+            yield qid, text, self._promote_header(pd.DataFrame(block))
 
-        # Promote first row to header
-        table_data.columns = table_data.iloc[0]
-        table_data = table_data.drop(table_data.index[0])
+    def _load_sheet(self, sheet_name: str) -> pd.DataFrame:
+        """Parse a sheet once and reuse it for later questions."""
+        with self._lock:
+            if sheet_name not in self._frames:
+                self._frames[sheet_name] = self.excel.parse(sheet_name, header=None)
+            return self._frames[sheet_name]
+
+    def _promote_header(self, table_data: pd.DataFrame) -> pd.DataFrame:
+        """Promote the banner row(s) of a question block to the header and record its banner schema."""
+        if table_data.empty:
+            return table_data.reset_index(drop=True)
+
+        # Multi-row banners (dimension row above segment row) are flattened to their segment labels
+        header_count = 1
+        while (header_count < min(MAX_HEADER_ROWS, len(table_data) - 1)
+               and is_header_row(list(table_data.iloc[header_count].values))):
+            header_count += 1
+
+        header_rows = [list(table_data.iloc[i].values) for i in range(header_count)]
+        schema = self._banner_for(header_rows)
+        columns = list(table_data.iloc[0].values)
+        if header_count > 1:
+            columns = [columns[0]] + schema.flat_labels()
+
+        table_data.columns = columns
+        table_data = table_data.drop(table_data.index[:header_count])
         table_data = table_data.reset_index(drop=True)
 
         print(f" Extracted table with shape: {table_data.shape} (rows x columns)")
-        return row_text.strip(), table_data
+        return table_data
 
-    def format_table(self, df: pd.DataFrame) -> str:
-        """Format table to markdown for GPT."""
-        df = df.copy()
-        for col in df.columns:
-            try:
-                df[col] = df[col].apply(lambda x: f"{x:.1f}%" if pd.notna(x) and isinstance(x, (float, int)) else x)
-            except Exception:
-                continue
+    def _banner_for(self, header_rows: list) -> BannerSchema:
+        """Parse a banner once; later blocks with the same header reuse the schema."""
+        raw_key = tuple(tuple(cell_label(v) for v in row[1:]) for row in header_rows)
+        with self._lock:
+            schema = self._banners.get(raw_key)
+            if schema is None:
+                schema = parse_banner(header_rows)
+                self._banners[raw_key] = schema
+                # Also findable from a promoted table's flattened columns
+                self._banners[tuple(schema.flat_labels())] = schema
+            return schema
+
+    def banner_schema(self, table: pd.DataFrame) -> BannerSchema:
+        """Banner schema of a table returned by this extractor."""
+        schema = self._banners.get(tuple(cell_label(v) for v in table.columns[1:]))
+        if schema is None:
+            schema = self._banner_for([[None] + list(table.columns[1:])])
+        return schema
 
+    def format_table(self, df: pd.DataFrame, fmt: str = None) -> str:
+        """Format table for GPT (markdown unless another table_serializers format is given or configured)."""
         try:
-            return df.to_markdown(index=False)
+            return serialize_table(df, fmt)
         except Exception as e:
             return f"**Table formatting failed: {str(e)}**"
 
@@ -1,42 +1,9 @@
 from typing import Dict, Any, List, Optional
+import os
 import pandas as pd
-import numpy as np
-import re
-
-def clean_column_names(df: pd.DataFrame) -> pd.DataFrame:
-    """Clean and standardize column names."""
-    df.columns = [str(col).strip().lower() for col in df.columns]
-    # Remove special characters but keep spaces
-    df.columns = [re.sub(r'[^\w\s]', '', col) for col in df.columns]
-    return df
-
-def extract_relevant_columns(df: pd.DataFrame, question: str) -> pd.DataFrame:
-    """Extract columns relevant to the question."""
-    # Basic columns to always include
-    base_cols = ['base', 'all', 'total', 'unweighted']
-    demo_cols = ['age', 'gender', 'nccs', 'sec', 'town', 'city', 'zone']
-    
-    # Get question-specific columns
-    keywords = []
-    if 'netflix' in question.lower():
-        keywords.extend(['netflix', 'ott', 'streaming'])
-    elif 'prime' in question.lower():
-        keywords.extend(['prime', 'amazon', 'ott'])
-    elif 'hotstar' in question.lower():
-        keywords.extend(['hotstar', 'disney', 'ott'])
-    else:
-        keywords.extend(['ott', 'app', 'platform', 'streaming'])
-
-    # Find relevant columns
-    relevant_cols = []
-    for col in df.columns:
-        col_lower = str(col).lower()
-        if (any(base in col_lower for base in base_cols) or
-            any(demo in col_lower for demo in demo_cols) or
-            any(key in col_lower for key in keywords)):
-            relevant_cols.append(col)
-            
-    return df[relevant_cols] if relevant_cols else df
+from study_registry import get_registry
+from banner_schema import DEMOGRAPHIC_DIMENSIONS, cell_label
+from aggregate_cube import answer_comparison, get_cube
 
 def clean_numeric_data(df: pd.DataFrame) -> pd.DataFrame:
     """Clean and convert numeric data."""
@@ -50,36 +17,6 @@ def clean_numeric_data(df: pd.DataFrame) -> pd.DataFrame:
             )
     return df
 
-def summarize_app_data(df: pd.DataFrame, app_name: str) -> Dict[str, Any]:
-    """Generate summary statistics for specific app."""
-    app_cols = [col for col in df.columns if app_name.lower() in str(col).lower()]
-    if not app_cols:
-        return {}
-        
-    app_data = df[app_cols]
-    numeric_cols = app_data.select_dtypes(include=[np.number]).columns
-    
-    summary = {
-        "total_users": app_data[numeric_cols].mean().mean(),
-        "by_age_group": {},
-        "by_gender": {},
-        "by_region": {}
-    }
-    
-    # Extract demographic breakdowns if available
-    age_cols = [col for col in df.columns if 'age' in str(col).lower()]
-    gender_cols = [col for col in df.columns if 'gender' in str(col).lower()]
-    region_cols = [col for col in df.columns if any(x in str(col).lower() for x in ['zone', 'region', 'city'])]
-    
-    if age_cols:
-        summary["by_age_group"] = df[age_cols].mean().to_dict()
-    if gender_cols:
-        summary["by_gender"] = df[gender_cols].mean().to_dict()
-    if region_cols:
-        summary["by_region"] = df[region_cols].mean().to_dict()
-        
-    return summary
-
 def table_extractor_node(state: Dict[str, Any]) -> Dict[str, Any]:
     """Extract and process table data based on question context."""
     question_id = state.get("question_id", "unknown")
@@ -88,61 +25,65 @@ def table_extractor_node(state: Dict[str, Any]) -> Dict[str, Any]:
     print(f"\nExtracting table for Question ID: {question_id}")
     
     try:
-        # Load Excel file
-        excel_path = "Data/raw data/Tables.xlsx"
+        # Load the study's Excel file (kept open by the registry between requests)
+        assets = get_registry().assets(state.get("study_id"))
+        excel_path = assets.config.workbook
         print(f"Excel file loaded: {excel_path}")
         
-        xlsx = pd.ExcelFile(excel_path)
-        sheets = xlsx.sheet_names
-        print(f"Sheets available: {sheets}")
-        
-        # Search in col% sheet
-        sheet = "col%"
-        df = pd.read_excel(excel_path, sheet_name=sheet)
-        
-        print(f"\nSearching for question ID: {question_id} in sheet '{sheet}'...")
-        
-        # Find rows containing question ID
-        question_rows = df[df.astype(str).apply(lambda x: x.str.contains(question_id, case=False, na=False)).any(axis=1)]
-        
-        if len(question_rows) > 0:
-            start_idx = question_rows.index[0]
-            print(f" Found question at row {start_idx}: {df.iloc[start_idx, 0]}")
-            
-            # Extract table data (20 rows after question)
-            table_df = df.iloc[start_idx:start_idx+20].copy()
-            
-            # Clean and process table
-            table_df = clean_column_names(table_df)
-            table_df = clean_numeric_data(table_df)
-            table_df = extract_relevant_columns(table_df, question_text)
-            
+        # Search in the study's col% sheet (parsed once and cached by the extractor)
+        sheet = assets.config.sheet_name
+        extractor = assets.extractor
+        if extractor.sheet_name != sheet:
+            extractor.load_excel(sheet)
+        _, table_df = extractor.extract_question_table(question_id)
+
+        if not table_df.empty:
+            # Select banner columns by dimension from the workbook's banner schema
+            schema = extractor.banner_schema(table_df)
+            table_df = schema.select(table_df, DEMOGRAPHIC_DIMENSIONS, max_columns=None)
+            table_df.columns = [cell_label(col) for col in table_df.columns]
+            table_df = clean_numeric_data(table_df.copy())
+
             print(f" Extracted table with shape: {table_df.shape}")
-            
+
             # Create basic table dictionary
             table_dict = {
                 "columns": table_df.columns.tolist(),
                 "data": table_df.values.tolist(),
-                "shape": table_df.shape
+                "shape": table_df.shape,
+                # Significance tests only compare segments within a dimension
+                "dimensions": schema.label_dimensions()
             }
+
+            # Real bases from the counts sheets (parsed only now, when a question needs them)
+            bases = extractor.base_sizes(question_id, "unweighted") or extractor.base_sizes(question_id)
+            if bases:
+                table_dict["bases"] = {col: bases[col] for col in table_df.columns if col in bases}
+            table_dict["base_size"] = extractor.total_base(question_id) or assets.config.base_size
             
-            # Add app-specific summaries if relevant
-            for app in ['netflix', 'prime', 'hotstar', 'youtube']:
-                if app in question_text.lower():
-                    summary = summarize_app_data(table_df, app)
-                    if summary:
-                        table_dict[f"{app}_summary"] = summary
+            # Breakdowns for any brand/option the question names, read from the precomputed cube
+            direct_answer = None
+            try:
+                cube = get_cube(state.get("study_id"))
+                for label in cube.mentioned_labels(question_id, question_text):
+                    table_dict[f"{label.lower()}_summary"] = cube.breakdown(question_id, label)
+                # "How does X compare across age/gender/region" is answered without the LLM
+                if os.getenv("CUBE_DIRECT_ANSWERS", "1").lower() in ("1", "true"):
+                    direct_answer = answer_comparison(cube, question_id, question_text)
+            except Exception as e:
+                print(f"Aggregate cube unavailable: {e}")
             
             print(f"Processed table for {question_id}")
             
             return {
                 **state,
                 "table_dict": table_dict,
-                "table_shape": table_df.shape
+                "table_shape": table_df.shape,
+                "direct_answer": direct_answer
             }
             
         else:
-            error_msg = f" Question ID '{question_id}' not found in sheet '{sheet}'."
+            error_msg = f" Question ID '{question_id}' has no table rows in sheet '{sheet}'."
             print(error_msg)
             raise ValueError(error_msg)
             
@@ -166,3 +107,5 @@ if __name__ == "__main__":
     print(f"Table shape: {result.get('table_shape')}")
     if 'netflix_summary' in result.get('table_dict', {}):
         print("\nNetflix Summary:", result['table_dict']['netflix_summary'])
+    if result.get('direct_answer'):
+        print("\nDirect answer:", result['direct_answer'])
@@ -0,0 +1,174 @@
+import csv
+import io
+import json
+import os
+import threading
+from typing import Callable, Dict, List, Optional
+
+import pandas as pd
+from tabulate import tabulate
+
+DEFAULT_FORMAT = "markdown"
+DEFAULT_FORMATS_PATH = "Data/cache/table_formats.json"  # Cheapest format per model, written by the benchmark
+COMPACT_DIGITS = 0  # Decimal places kept by the compact formats (col% values)
+
+
+def _label(value) -> str:
+    return "" if value is None or (isinstance(value, float) and pd.isna(value)) else str(value).strip()
+
+
+def _number(value, digits: int) -> str:
+    text = f"{value:.{digits}f}"
+    return "0" if text in ("-0", "-0.0") else text
+
+
+def _cell(value, digits: int) -> str:
+    """Cell text: numbers rounded, empty cells as ""."""
+    if value is None or (isinstance(value, float) and pd.isna(value)):
+        return ""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return _number(value, digits)
+    return str(value).strip()
+
+
+def _rows(df: pd.DataFrame, index: bool) -> pd.DataFrame:
+    """Index moved into the first column when it carries labels (e.g. mean/min/max summaries)."""
+    return df.rename_axis("").reset_index() if index else df
+
+
+def column_codes(count: int) -> List[str]:
+    """Spreadsheet-style short codes: A..Z, AA, AB, ..."""
+    codes = []
+    for n in range(1, count + 1):
+        code = ""
+        while n:
+            n, rem = divmod(n - 1, 26)
+            code = chr(65 + rem) + code
+        codes.append(code)
+    return codes
+
+
+def to_markdown(df: pd.DataFrame, digits: int = 1, index: bool = False) -> str:
+    """The original format: percentages with one decimal in a padded markdown table."""
+    df = _rows(df, index).copy()
+    for col in df.columns:
+        try:
+            df[col] = df[col].apply(lambda x: f"{x:.{digits}f}%" if pd.notna(x) and isinstance(x, (float, int)) else x)
+        except Exception:
+            continue
+    return df.to_markdown(index=False)
+
+
+def to_pipe(df: pd.DataFrame, digits: int = 2, index: bool = False) -> str:
+    """GitHub pipe table via tabulate (what prompt_builder_node used to send)."""
+    df = _rows(df, index)
+    return tabulate(df.values.tolist(), headers=[_label(c) for c in df.columns], tablefmt="github",
+                    floatfmt=f".{digits}f")
+
+
+def _delimited(df: pd.DataFrame, digits: int, index: bool, delimiter: str) -> str:
+    df = _rows(df, index)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=delimiter, lineterminator="\n")
+    writer.writerow([_label(c) for c in df.columns])
+    for row in df.itertuples(index=False):
+        writer.writerow([_cell(v, digits) for v in row])
+    return f"(values in %, rounded to {digits} dp)\n" + buffer.getvalue().rstrip("\n")
+
+
+def to_csv(df: pd.DataFrame, digits: int = COMPACT_DIGITS, index: bool = False) -> str:
+    return _delimited(df, digits, index, ",")
+
+
+def to_tsv(df: pd.DataFrame, digits: int = COMPACT_DIGITS, index: bool = False) -> str:
+    return _delimited(df, digits, index, "\t")
+
+
+def to_sparse(df: pd.DataFrame, digits: int = COMPACT_DIGITS, index: bool = False) -> str:
+    """One line per row listing only its non-empty cells: "Netflix: Total 8, Male 11"."""
+    df = _rows(df, index)
+    headers = [_label(c) for c in df.columns[1:]]
+    lines = [f"(values in %, rounded to {digits} dp; empty cells omitted)"]
+    for row in df.itertuples(index=False):
+        cells = [f"{h} {_cell(v, digits)}" for h, v in zip(headers, row[1:]) if _cell(v, digits)]
+        lines.append(f"{_cell(row[0], digits)}: {', '.join(cells)}" if cells else _cell(row[0], digits))
+    return "\n".join(lines)
+
+
+def to_coded(df: pd.DataFrame, digits: int = COMPACT_DIGITS, index: bool = False) -> str:
+    """
+    Sparse rows with a header dictionary: banner labels are stated once as short codes
+    ("A=Total; B=Male") and rows use the codes ("Netflix: A8 B11").
+    """
+    df = _rows(df, index)
+    headers = [_label(c) for c in df.columns[1:]]
+    codes = column_codes(len(headers))
+    lines = [f"(values in %, rounded to {digits} dp; empty cells omitted)",
+             "Columns: " + "; ".join(f"{code}={h}" for code, h in zip(codes, headers))]
+    for row in df.itertuples(index=False):
+        cells = [f"{code}{_cell(v, digits)}" for code, v in zip(codes, row[1:]) if _cell(v, digits)]
+        lines.append(f"{_cell(row[0], digits)}: {' '.join(cells)}" if cells else _cell(row[0], digits))
+    return "\n".join(lines)
+
+
+SERIALIZERS: Dict[str, Callable[..., str]] = {
+    "markdown": to_markdown,
+    "pipe": to_pipe,
+    "csv": to_csv,
+    "tsv": to_tsv,
+    "sparse": to_sparse,
+    "coded": to_coded,
+}
+
+
+def serialize_table(df: pd.DataFrame, fmt: Optional[str] = None, digits: Optional[int] = None,
+                    index: bool = False) -> str:
+    """
+    Serialize a table for a prompt.
+
+    Args:
+        df: Table with row labels in the first column
+        fmt: One of SERIALIZERS (default: TABLE_FORMAT env, else markdown)
+        digits: Decimal places (default: each format's own)
+        index: Include the index as the first column
+    """
+    fmt = fmt or os.getenv("TABLE_FORMAT", DEFAULT_FORMAT)
+    if fmt not in SERIALIZERS:
+        raise ValueError(f"Unknown table format '{fmt}'. Available: {', '.join(SERIALIZERS)}")
+    kwargs = {"index": index} if digits is None else {"index": index, "digits": digits}
+    return SERIALIZERS[fmt](df, **kwargs)
+
+
+_model_formats: Optional[Dict[str, str]] = None
+_model_formats_lock = threading.Lock()
+
+
+def table_format_for(model: str) -> str:
+    """
+    Table format to use for a model: TABLE_FORMAT if set, else the benchmark's pick for the
+    model (TABLE_FORMATS_PATH), else markdown.
+    """
+    global _model_formats
+    if os.getenv("TABLE_FORMAT"):
+        return os.getenv("TABLE_FORMAT")
+    with _model_formats_lock:
+        if _model_formats is None:
+            path = os.getenv("TABLE_FORMATS_PATH", DEFAULT_FORMATS_PATH)
+            _model_formats = {}
+            if os.path.exists(path):
+                with open(path, "r", encoding="utf-8") as f:
+                    _model_formats = json.load(f)
+        fmt = _model_formats.get(model, DEFAULT_FORMAT)
+    return fmt if fmt in SERIALIZERS else DEFAULT_FORMAT
+
+
+def save_model_formats(choices: Dict[str, str], path: Optional[str] = None) -> str:
+    """Record the format chosen for each model (read by table_format_for)."""
+    global _model_formats
+    path = path or os.getenv("TABLE_FORMATS_PATH", DEFAULT_FORMATS_PATH)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(choices, f, indent=2)
+    with _model_formats_lock:
+        _model_formats = None
+    return path
@@ -11,6 +11,10 @@ def load_keys():
         "PINECONE_INDEX": os.getenv("PINECONE_INDEX_NAME")
     }
 
+def pinecone_namespace(namespace: str) -> str:
+    """Map a study namespace to a Pinecone namespace ("default" is Pinecone's unnamed namespace)."""
+    return "" if namespace == "default" else namespace
+
 import re
 
 def extract_insights_and_recommendations(text: str) -> str:
@@ -0,0 +1,124 @@
+import re
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+import pandas as pd
+from table_extractor import TableExtractor
+
+MAX_RESULT_ROWS = 50
+QUERY_TIMEOUT_SECONDS = 5.0  # Generated SQL can loop forever (e.g. an unbounded recursive CTE)
+PROGRESS_INTERVAL = 10_000  # SQLite VM instructions between deadline checks
+SAMPLE_BANNERS = 40  # Banner labels listed in the schema description
+
+SCHEMA_DDL = """CREATE TABLE questions (
+    qid TEXT PRIMARY KEY,      -- e.g. 'Q10.1'
+    question_text TEXT         -- full question wording from the sheet
+);
+CREATE TABLE responses (
+    qid TEXT,                  -- question the row belongs to
+    row_label TEXT,            -- answer option / brand / statement (e.g. 'Netflix', 'Base')
+    banner TEXT,               -- banner column (e.g. 'Total', 'Male', '18-24 years', 'NCCS A')
+    column_index INTEGER,      -- position of the banner column in the sheet
+    value REAL                 -- cell value as shown in the col% sheet
+);"""
+
+
+class WorkbookSQL:
+    def __init__(self, extractor: TableExtractor):
+        """
+        Every question block of a workbook sheet loaded into an in-memory SQLite database.
+
+        All blocks share one long-format responses table (qid, row_label, banner, value),
+        so the schema shown to the LLM stays the same size however large the sheet is.
+        """
+        self.extractor = extractor
+        self._conn = sqlite3.connect(":memory:", check_same_thread=False)
+        self._lock = threading.Lock()
+        self._build()
+
+    def _build(self) -> None:
+        questions = []
+        responses = []
+        for qid, question_text, table in self.extractor.iter_question_blocks():
+            questions.append((qid, question_text))
+            if table.empty:
+                continue
+
+            labels = table.iloc[:, 0].astype(object).where(table.iloc[:, 0].notna(), "").astype(str).str.strip()
+            for col_idx, banner in enumerate(table.columns[1:], start=1):
+                values = pd.to_numeric(table.iloc[:, col_idx], errors="coerce")
+                banner_label = "" if pd.isna(banner) else str(banner).strip()
+                for label, value in zip(labels, values):
+                    if pd.notna(value):
+                        responses.append((qid, label, banner_label, col_idx, float(value)))
+
+        with self._lock:
+            self._conn.executescript(SCHEMA_DDL)
+            self._conn.executemany("INSERT OR REPLACE INTO questions VALUES (?, ?)", questions)
+            self._conn.executemany("INSERT INTO responses VALUES (?, ?, ?, ?, ?)", responses)
+            self._conn.execute("CREATE INDEX idx_responses_qid ON responses (qid)")
+            self._conn.commit()
+            # Guard against anything but reads from generated SQL
+            self._conn.execute("PRAGMA query_only = ON")
+
+        print(f"Loaded {len(questions)} questions and {len(responses)} cells into the query engine")
+
+    def describe(self) -> str:
+        """Compact schema description for the LLM (independent of workbook size)."""
+        with self._lock:
+            banners = [row[0] for row in self._conn.execute(
+                "SELECT banner FROM responses GROUP BY banner ORDER BY MIN(column_index) LIMIT ?", (SAMPLE_BANNERS,)
+            ).fetchall()]
+            counts = self._conn.execute("SELECT COUNT(*) FROM questions").fetchone()[0]
+
+        return (f"{SCHEMA_DDL}\n\n-- {counts} questions loaded."
+                f"\n-- Banner columns: {', '.join(repr(b) for b in banners)}")
+
+    def run_query(self, sql: str, max_rows: int = MAX_RESULT_ROWS,
+                  timeout: float = QUERY_TIMEOUT_SECONDS) -> pd.DataFrame:
+        """Run a single read-only SELECT and return at most max_rows rows, stopping it after timeout seconds."""
+        sql = sql.strip().rstrip(";").strip()
+        if ";" in sql:
+            raise ValueError("Only a single SQL statement is allowed.")
+        if not re.match(r'^(SELECT|WITH)\b', sql, re.IGNORECASE):
+            raise ValueError("Only SELECT queries are allowed.")
+
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            # A non-zero return from the handler interrupts the running statement
+            self._conn.set_progress_handler(lambda: int(time.monotonic() > deadline), PROGRESS_INTERVAL)
+            try:
+                cursor = self._conn.execute(sql)
+                columns = [d[0] for d in cursor.description]
+                rows = cursor.fetchmany(max_rows)
+            except sqlite3.OperationalError as e:
+                if time.monotonic() > deadline:
+                    raise ValueError(f"Query stopped after {timeout:g}s; simplify it or bound any recursion.") from e
+                raise
+            finally:
+                self._conn.set_progress_handler(None, 0)
+        return pd.DataFrame(rows, columns=columns)
+
+
+_engines: Dict[Tuple[str, str], WorkbookSQL] = {}
+_engines_lock = threading.Lock()
+
+
+def get_query_engine(filepath: str, sheet_name: Optional[str] = None) -> WorkbookSQL:
+    """Return a query engine for a workbook sheet, built once per process."""
+    key = (filepath, sheet_name or "col%")
+    with _engines_lock:
+        if key not in _engines:
+            extractor = TableExtractor(filepath)
+            extractor.load_excel(sheet_name)
+            _engines[key] = WorkbookSQL(extractor)
+        return _engines[key]
+
+
+def drop_query_engines(filepath: str) -> None:
+    """Forget engines built from a workbook (after it has been replaced)."""
+    with _engines_lock:
+        for key in [k for k in _engines if k[0] == filepath]:
+            del _engines[key]